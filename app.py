@@ -1,69 +1,209 @@
-from flask import Flask, jsonify, render_template, request, session, redirect, url_for
+from flask import Flask, Response, g, jsonify, render_template, request, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+import math
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from model.recommendation_engine import train_model, recommend_for_user
-from model.predictor import predict_tag_and_response # Importa tu función de predicción 
+from model.recommendation_engine import recommend_for_user, train_model
+from model.training_scheduler import TrainingScheduler
+from model import similarity_store
+from model.recommendation_cache import create_recommendation_cache
+from db.connection import db # Cliente compartido con pool por proceso; se conecta en el primer uso
+from db.rating_queue import RatingQueueFull, create_rating_queue
+from db.migrations import verify_indexes_at_startup
+from metrics import PROMETHEUS_CONTENT_TYPE, count_error, create_profiler, instrument_app, metrics
+import assets
+from model.search_index import build_search_index
+from model.geo_index import build_geo_index
+from db.pagination import KEYSET_SORT, CachedCount, encode_cursor, keyset_filter
+from db.catalog_cache import CatalogCache
+from model.predictor import NEGOCIO_TAG_MAPPING, predict_tag_and_response, get_latency_stats # Importa tu función de predicción 
+from db.serializers import BUSINESS_SUMMARY_PROJECTION, FastJSONProviderMixin, chatbot_response_data, serialize_business
 from datetime import datetime
+import threading
+import time
 
 load_dotenv()
 
 # --- Configuración de Flask ---
+class JSONProvider(FastJSONProviderMixin, DefaultJSONProvider):
+    """
+    jsonify con orjson (si está instalado) y soporte de ObjectId.
+    """
+
 app = Flask(__name__)
+app.json = JSONProvider(app)
 # ¡IMPORTANTE! Cambia esta clave en producción
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
-# ✅ Mapa de etiquetas a categorías de negocios
-NEGOCIO_TAG_MAPPING = {
-    "recomendacion_restaurantes": "Restaurantes",
-    "recomendacion_hospedajes": "Hospedajes",
-    "recomendacion_bares": "Bares",
-    "recomendacion_sitios_turisticos": "Sitios Turisticos"
-    # Añade nuevos tags para negocios aquí
-}
+# Latencia de cada ruta en /metrics y, con METRICS_PROFILE_SLOW_MS, perfiles de las peticiones lentas
+slow_request_profiler = create_profiler()
+instrument_app(app, request, g, slow_request_profiler)
+
+# Estáticos con hash y miniaturas generados por 'python -m assets', servidos en /assets/ con caché immutable
+assets.init_app(app)
+
+# No arranca si alguna consulta frecuente haría un COLLSCAN (ver db/migrations.py y MONGO_INDEX_CHECK)
+verify_indexes_at_startup()
+
+
+# Intervalo (en segundos) para reconstruir la matriz de similitud completa y corregir deriva
+FULL_REBUILD_INTERVAL = int(os.getenv('MODEL_FULL_REBUILD_INTERVAL', 3600))
+
+# Arranque del modelo de recomendaciones:
+#   background (por defecto): la app responde de inmediato y el modelo se carga en segundo plano
+#   blocking: el modelo se carga antes de atender la primera petición
+MODEL_STARTUP_MODE = os.getenv('MODEL_STARTUP_MODE', 'background')
+
+# Los reentrenamientos por nuevas valoraciones se hacen en segundo plano sobre el índice
+# compartido en disco: solo un worker lo construye cuando no existe o es más antiguo que
+# RECOMMENDER_SNAPSHOT_MAX_AGE, y cada lote de valoraciones se guarda como una versión nueva
+training_scheduler = TrainingScheduler(
+    debounce_seconds=float(os.getenv('MODEL_DEBOUNCE_SECONDS', 2.0)),
+    full_rebuild_interval=FULL_REBUILD_INTERVAL,
+    # Cada cuántos segundos se cargan las versiones guardadas por los demás workers
+    poll_interval=float(os.getenv('MODEL_POLL_INTERVAL', 30)),
+    build=train_model,
+    snapshot_dir=similarity_store.SNAPSHOT_DIR,
+    # Antigüedad máxima del índice de contenido compartido antes de reconstruirlo
+    content_max_age=int(os.getenv('CONTENT_INDEX_TTL', 600))
+)
+
+# Caché de recomendaciones por usuario; se invalida al publicar una nueva versión del modelo
+recommendation_cache = create_recommendation_cache()
+training_scheduler.add_listener(recommendation_cache.on_model_published)
+training_scheduler.start(block=MODEL_STARTUP_MODE == 'blocking')
+
+class BackgroundIndex:
+    """
+    Índice en memoria construido desde 'negocios' con build(db). Solo la primera construcción
+    se espera; después, cuando tiene más de ttl segundos, se reconstruye en un hilo y mientras
+    tanto las peticiones siguen usando el anterior.
+    """
+
+    # Espera antes de reintentar si una reconstrucción falló
+    RETRY_SECONDS = 30
+
+    def __init__(self, name, build, ttl):
+        self.name = name
+        self.build = build
+        self.ttl = ttl
+        self._index = None
+        self._next_refresh_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def get(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self.build(db)
+                    self._next_refresh_at = time.time() + self.ttl
+            return self._index
+        if time.time() >= self._next_refresh_at and self._refreshing.acquire(blocking=False):
+            self._next_refresh_at = time.time() + self.RETRY_SECONDS
+            threading.Thread(target=self._rebuild, name=f'{self.name}-index', daemon=True).start()
+        return index
+
+    def _rebuild(self):
+        try:
+            self._index = self.build(db)
+            self._next_refresh_at = time.time() + self.ttl
+        except Exception as e:
+            print(f"Error al reconstruir el índice '{self.name}': {e}")
+            count_error(f'{self.name}_index')
+        finally:
+            self._refreshing.release()
+
+# Índice de búsqueda en memoria; se reconstruye desde 'negocios' cada SEARCH_INDEX_TTL segundos
+# (se construye con la primera búsqueda, no al arrancar)
+search_index = BackgroundIndex('search', build_search_index, int(os.getenv('SEARCH_INDEX_TTL', 300)))
+
+def get_search_index():
+    """
+    Devuelve el índice de búsqueda (el anterior mientras se reconstruye).
+    """
+    return search_index.get()
+
+# Índice espacial en memoria para las consultas de negocios cercanos y del mapa
+geo_index = BackgroundIndex('geo', build_geo_index, int(os.getenv('GEO_INDEX_TTL', 300)))
 
+def get_geo_index():
+    """
+    Devuelve el índice espacial (el anterior mientras se reconstruye).
+    """
+    return geo_index.get()
+
+def get_content_index():
+    """
+    Índice de vecinos por contenido (categoría, descripción y cercanía) que se mezcla con el
+    colaborativo, o None hasta que se carga. Lo mantiene training_scheduler desde el disco:
+    un solo proceso lo construye cada CONTENT_INDEX_TTL segundos y los demás lo mapean.
+    """
+    return training_scheduler.content_index
 
-# --- Conexión a MongoDB ---
-mongo_uri = os.getenv('MONGO_URI')
-if not mongo_uri:
-    raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
-    
-client = MongoClient(mongo_uri) 
-db = client[os.getenv('MONGO_DB_NAME')] # El nombre de la base de datos también se lee desde .env
+# Tamaño máximo de página en los listados y total de negocios estimado (se refresca cada minuto)
+MAX_PAGE_SIZE = 50
+businesses_count = CachedCount(db, 'negocios', ttl_seconds=int(os.getenv('BUSINESS_COUNT_TTL', 60)))
 
-# Entrenar el modelo al iniciar la aplicación
-item_similarity_df = train_model()
+# Listas en memoria de los negocios mejor valorados (global y por categoría)
+catalog_cache = CatalogCache(db, refresh_interval=int(os.getenv('CATALOG_REFRESH_INTERVAL', 60)))
+
+# Las valoraciones se guardan en lotes en segundo plano; cada lote guardado actualiza el
+# modelo, la caché de recomendaciones de sus usuarios y las listas del catálogo
+rating_queue = create_rating_queue(db)
+
+def on_ratings_saved(events):
+    model_version = training_scheduler.snapshot.version
+    for usuario_id, negocio_id, puntuacion in events:
+        training_scheduler.notify_rating(usuario_id, negocio_id, puntuacion)
+        recommendation_cache.invalidate_user(usuario_id, model_version)
+    catalog_cache.invalidate()
+
+rating_queue.add_listener(on_ratings_saved)
+rating_queue.start()
+
+def catalog_response(payload):
+    """
+    Respuesta JSON con ETag de la versión del catálogo para que el navegador revalide
+    con If-None-Match y reciba un 304 si nada cambió.
+    """
+    response = jsonify(payload)
+    response.set_etag(catalog_cache.etag)
+    response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response.make_conditional(request)
+
+def get_user_recommendations(user_id_obj):
+    """
+    Devuelve las recomendaciones serializadas de un usuario, usando la caché cuando es posible.
+    """
+    snapshot = training_scheduler.snapshot
+    recommendations_json = recommendation_cache.get(user_id_obj, snapshot.version)
+    if recommendations_json is None:
+        recommendations = recommend_for_user(
+            user_id_obj, snapshot.model, top_rated=catalog_cache.top, content_index=get_content_index()
+        )
+        recommendations_json = [serialize_business(b) for b in recommendations]
+        recommendation_cache.set(user_id_obj, snapshot.version, recommendations_json)
+    return recommendations_json
 
 # --- Rutas de la Aplicación ---
 @app.route('/')
 def home():
     user_id = session.get('user_id')
     username = session.get('username')
-    recommendations = []
 
     if user_id:
-        user_id_obj = ObjectId(user_id)
-        recommendations = recommend_for_user(user_id_obj, item_similarity_df)
+        recommendations_for_template = get_user_recommendations(ObjectId(user_id))
     else:
         # Muestra los negocios más populares si no hay un usuario logueado
-        recommendations = list(db.negocios.find().sort('promedio_ranking', -1).limit(5))
-
-    # Convertir a un formato JSON serializable para Jinja2
-    recommendations_for_template = [
-        {
-            'id': str(b['_id']),
-            'name': b['nombre'],
-            'category': b['categoria'],
-            'ranking': b.get('promedio_ranking', 0),
-            'image_url': b.get('imagen_url', 'https://placehold.co/300x200'),
-            'lat': b.get('coordenadas', {}).get('lat'),
-            'lng': b.get('coordenadas', {}).get('lon')
-        } for b in recommendations
-    ]
+        recommendations = catalog_cache.top(5)
+
+        # Convertir a un formato JSON serializable para Jinja2
+        recommendations_for_template = [serialize_business(b) for b in recommendations]
 
     return render_template('index.html', recommendations=recommendations_for_template, user_id=user_id, username=username)
 
@@ -117,29 +257,15 @@ def valorar_negocio():
         if not 1 <= puntuacion <= 5:
             return jsonify({"error": "La puntuación debe ser entre 1 y 5."}), 400
 
-        # Insertar o actualizar la valoración del usuario
-        db.valoraciones.update_one(
-            {'usuario_id': ObjectId(user_id), 'negocio_id': negocio_id_obj},
-            {'$set': {'puntuacion': puntuacion}},
-            upsert=True # Si no existe, lo crea
-        )
-        
-        # Calcular y actualizar el promedio del negocio
-        valoraciones_negocio = list(db.valoraciones.find({'negocio_id': negocio_id_obj}))
-        if valoraciones_negocio:
-            total_puntuaciones = sum(v['puntuacion'] for v in valoraciones_negocio)
-            promedio = round(total_puntuaciones / len(valoraciones_negocio), 1)
+        # La valoración se encola; el guardado, el promedio y el modelo se actualizan en segundo plano
+        rating_queue.submit(ObjectId(user_id), negocio_id_obj, puntuacion)
 
-            db.negocios.update_one(
-                {'_id': negocio_id_obj},
-                {'$set': {'promedio_ranking': promedio}}
-            )
+        return jsonify({"message": "Valoración recibida; el ranking se actualizará en unos segundos."}), 202
 
-        # Volver a entrenar el modelo después de una nueva valoración
-        global item_similarity_df
-        item_similarity_df = train_model()
-
-        return jsonify({"message": "Valoración guardada y ranking actualizado."}), 200
+    except RatingQueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -154,78 +280,130 @@ def get_recommendations_api():
         recommendations = []
         if user_id:
             if user_id == "popular":
-                recommendations = list(db.negocios.find().sort('promedio_ranking', -1).limit(5))
+                recommendations = catalog_cache.top(5)
+                return catalog_response([serialize_business(b) for b in recommendations])
             else:
-                user_id_obj = ObjectId(user_id)
-                recommendations = recommend_for_user(user_id_obj, item_similarity_df)
+                # Las recomendaciones personalizadas ya vienen serializadas desde la caché
+                return jsonify(get_user_recommendations(ObjectId(user_id))), 200
         elif category:
-            recommendations = list(db.negocios.find({'categoria': category}).limit(10))
+            recommendations = catalog_cache.top(10, category)
+            return catalog_response([serialize_business(b) for b in recommendations])
         elif search_term:
-            # Filtra por término de búsqueda (nombre o descripción)
-            # '$regex' permite buscar un texto dentro de un campo.
-            # '$options: 'i'' hace que la búsqueda no distinga mayúsculas y minúsculas.
-            recommendations = list(db.negocios.find({
-                '$or': [
-                    {'nombre': {'$regex': search_term, '$options': 'i'}},
-                    {'descripcion': {'$regex': search_term, '$options': 'i'}}
-                ]
-            }).limit(10))
+            # Busca en el índice invertido en memoria (sin tildes ni mayúsculas, con prefijos)
+            recommendations = get_search_index().search(search_term, limit=10)
         else:
             return jsonify({"error": "Parámetros de búsqueda no válidos"}), 400
 
         # ... (el resto de tu lógica para convertir recomendaciones a JSON) ...
-        recommendations_json = [
-            {
-                'id': str(b['_id']),
-                'name': b['nombre'],
-                'category': b['categoria'],
-                'ranking': b.get('promedio_ranking', 0),
-                'image_url': b.get('imagen_url', 'https://placehold.co/300x200'),
-                'lat': b.get('coordenadas', {}).get('lat'),
-                'lng': b.get('coordenadas', {}).get('lon')
-            } for b in recommendations
-        ]
+        recommendations_json = [serialize_business(b) for b in recommendations]
         return jsonify(recommendations_json), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/modelo/estado')
+def get_model_status():
+    """
+    Ruta para consultar la versión publicada del modelo de recomendaciones.
+    """
+    return jsonify(training_scheduler.status()), 200
+
+@app.route('/api/valoraciones/cola')
+def get_rating_queue_stats():
+    """
+    Ruta para consultar el estado de la cola de valoraciones pendientes.
+    """
+    return jsonify(rating_queue.stats()), 200
+
+@app.route('/api/recomendaciones/cache')
+def get_recommendation_cache_stats():
+    """
+    Ruta para consultar aciertos, fallos y desalojos de la caché de recomendaciones.
+    """
+    return jsonify(recommendation_cache.stats()), 200
+
 @app.route('/api/todos_los_negocios')
 def get_all_businesses():
     """
     Ruta para obtener todos los negocios de la base de datos con paginación.
+    Con 'cursor' usa paginación por clave (keyset): el costo no crece con la profundidad.
+    Sin 'cursor' se mantiene la paginación clásica por 'page' y 'limit'.
     """
     try:
-        # Obtiene los parámetros 'page' y 'limit' de la URL
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
+        # Obtiene los parámetros 'page' y 'limit' de la URL ('limit' se acota a MAX_PAGE_SIZE)
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 10)), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
 
-        # Calcula la cantidad de documentos a saltar (skip)
-        skip = (page - 1) * limit
+        # Con cursor continúa después del último negocio de la página anterior (cursor vacío = inicio)
+        query = db.negocios.find(keyset_filter(cursor) if cursor else {}, BUSINESS_SUMMARY_PROJECTION).sort(KEYSET_SORT)
+        if cursor is None:
+            # Calcula la cantidad de documentos a saltar (skip)
+            query = query.skip((page - 1) * limit)
 
-        # Obtiene el total de negocios para calcular las páginas
-        total_businesses = db.negocios.count_documents({})
-        
-        # Realiza la consulta con skip y limit
-        businesses = list(db.negocios.find({}).skip(skip).limit(limit))
+        # Se pide un documento extra para saber si hay una página siguiente
+        businesses = list(query.limit(limit + 1))
+        has_more = len(businesses) > limit
+        businesses = businesses[:limit]
 
-        businesses_json = [
-            {
-                'id': str(b['_id']),
-                'name': b['nombre'],
-                'category': b['categoria'],
-                'ranking': b.get('promedio_ranking', 0),
-                'image_url': b.get('imagen_url', 'https://placehold.co/300x200'),
-                'lat': b.get('coordenadas', {}).get('lat'),
-                'lng': b.get('coordenadas', {}).get('lon')
-            } for b in businesses
-        ]
+        businesses_json = [serialize_business(b) for b in businesses]
+
+        # El total se estima y se guarda en caché en lugar de contarlo en cada petición
+        total_businesses = businesses_count.get()
 
         # Devuelve los datos junto con la información de paginación
         return jsonify({
             "businesses": businesses_json,
             "total_pages": (total_businesses + limit - 1) // limit,
-            "current_page": page
+            "current_page": page,
+            "next_cursor": encode_cursor(businesses[-1]) if has_more else None
         }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _finite_arg(name, value, low=None, high=None):
+    # Número finito del query string (float() acepta 'nan' e 'inf'); ValueError si no lo es
+    number = float(value)
+    if not math.isfinite(number) or (low is not None and not low <= number <= high):
+        raise ValueError(f"'{name}' no es válido: {value!r}.")
+    return number
+
+@app.route('/api/cercanos')
+def get_nearby_businesses():
+    """
+    Ruta para obtener los negocios cercanos a un punto (lat, lng, radius en km) ordenados
+    por distancia, o los que están dentro del área visible del mapa (bbox). 'category' filtra
+    por categoría ('radio' y 'categoria' se aceptan como alias).
+    """
+    try:
+        category = request.args.get('category') or request.args.get('categoria')
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        bbox = request.args.get('bbox')
+
+        if bbox:
+            # Formato de Leaflet (toBBoxString): oeste,sur,este,norte. Con el mapa alejado las
+            # longitudes pueden salirse de ±180, así que se recortan al rango válido
+            min_lng, min_lat, max_lng, max_lat = (_finite_arg('bbox', v) for v in bbox.split(','))
+            min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+            min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0)
+            businesses = get_geo_index().within_bbox(min_lat, min_lng, max_lat, max_lng, category, limit)
+            return jsonify([serialize_business(b) for b in businesses]), 200
+
+        if request.args.get('lat') is None or request.args.get('lng') is None:
+            return jsonify({"error": "Debes indicar 'lat' y 'lng', o 'bbox'."}), 400
+        lat = _finite_arg('lat', request.args['lat'], -90, 90)
+        lng = _finite_arg('lng', request.args['lng'], -180, 180)
+        radius_km = _finite_arg('radius', request.args.get('radius', request.args.get('radio', 2)), 0, float('inf'))
+        radius_km = min(radius_km, 50)
+
+        nearby = get_geo_index().near(lat, lng, radius_km, category, limit)
+        businesses_json = [
+            {**serialize_business(b), 'distance_km': round(distance, 3)} for b, distance in nearby
+        ]
+        return jsonify(businesses_json), 200
+    except ValueError:
+        return jsonify({"error": "Parámetros de ubicación no válidos."}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -279,6 +457,9 @@ def register():
         # Insertar el nuevo usuario en la colección 'usuarios'
         db.usuarios.insert_one(new_user)
         return jsonify({"message": "Registro exitoso. Ahora puedes iniciar sesión."}), 201
+    except DuplicateKeyError:
+        # Otro registro con el mismo correo llegó al mismo tiempo (índice único de 'email')
+        return jsonify({"error": "Este correo ya está registrado."}), 409
     except Exception as e:
         return jsonify({"error": f"Error al registrar el usuario: {str(e)}"}), 500
 
@@ -292,26 +473,37 @@ def get_popular_businesses():
     Ruta para obtener los 4 negocios más populares (mejor ranking).
     """
     try:
-        # Busca los 4 negocios con el mejor promedio de ranking
-        popular_businesses = list(db.negocios.find().sort('promedio_ranking', -1).limit(4))
+        # Busca los 4 negocios con el mejor promedio de ranking (desde la caché del catálogo)
+        popular_businesses = catalog_cache.top(4)
 
-        # Convierte los resultados a un formato serializable
-        businesses_json = [
-            {
-                'id': str(b['_id']),
-                'name': b['nombre'],
-                'category': b['categoria'],
-                'ranking': b.get('promedio_ranking', 0),
-                'image_url': b.get('imagen_url', 'https://placehold.co/300x200'),
-                'lat': b.get('coordenadas', {}).get('lat'),
-                'lng': b.get('coordenadas', {}).get('lon')
-            } for b in popular_businesses
-        ]
-        return jsonify(businesses_json), 200
+        return catalog_response([serialize_business(b) for b in popular_businesses])
     except Exception as e:
         print(f"Error al obtener negocios populares: {e}")
         return jsonify({"error": "Ocurrió un error en el servidor."}), 500
 
+@app.route('/metrics')
+def get_metrics():
+    """
+    Métricas del proceso en formato Prometheus (rutas, comandos de MongoDB, etapas del modelo).
+    """
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/api/metricas/perfiles')
+def get_slow_request_profiles():
+    """
+    Pilas más frecuentes de las últimas peticiones lentas (requiere METRICS_PROFILE_SLOW_MS).
+    """
+    if slow_request_profiler is None:
+        return jsonify({"error": "El perfilador está desactivado (METRICS_PROFILE_SLOW_MS=0)."}), 404
+    return jsonify(slow_request_profiler.recent()), 200
+
+@app.route('/api/chatbot/metricas')
+def get_chatbot_metrics():
+    """
+    Ruta para consultar las latencias por etapa del clasificador y su caché de mensajes.
+    """
+    return jsonify(get_latency_stats()), 200
+
 """
  Ruta para que interactua con el chat bot y devuelve los mensajes
 """
@@ -327,36 +519,11 @@ def chatbot():
         print(f"Error en el modelo de predicción: {e}")
         return jsonify({"message": "Lo siento, hubo un problema con el asistente. Intenta de nuevo más tarde."}), 500
 
-    response_data = {}
-    
     # ✅ Lógica para recomendaciones de negocios (la única parte que necesita DB)
-    if tag in NEGOCIO_TAG_MAPPING:
-        categoria_negocio = NEGOCIO_TAG_MAPPING[tag]
-        negocios = list(db.negocios.find({'categoria': categoria_negocio}).sort('promedio_ranking', -1).limit(3))
-        
-        if negocios:
-            # Convertir ObjectId a string para serializar a JSON
-            for negocio in negocios:
-                if '_id' in negocio:
-                    negocio['_id'] = str(negocio['_id'])
-            
-            response_data = {
-                "message": f"Aquí te presento algunos de los {categoria_negocio} mejor valorados:",
-                "type": "negocios",
-                "data": negocios
-            }
-        else:
-            response_data = {"message": f"No se encontraron negocios en la categoría de {categoria_negocio}."}
-    
-    # ✅ Lógica para todas las demás respuestas estáticas
-    elif static_response:
-        response_data = {"message": static_response}
-    
-    # Manejar el caso de no encontrar respuesta
-    else:
-        response_data = {"message": "Lo siento, no entendí tu pregunta. ¿Puedes reformularla?"}
-        
-    return jsonify(response_data)
+    categoria_negocio = NEGOCIO_TAG_MAPPING.get(tag)
+    negocios = catalog_cache.top(3, categoria_negocio) if categoria_negocio else []
+
+    return jsonify(chatbot_response_data(categoria_negocio, negocios, static_response))
 
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,303 @@
+"""
+Miniaturas de las imágenes y archivos estáticos precomprimidos, con nombres por contenido.
+
+    python -m assets            # genera solo lo que cambió desde la última ejecución
+    python -m assets --prune    # además borra los archivos que ya no usa el manifiesto
+
+Se ejecuta en cada despliegue, antes de arrancar la app, y escribe en static/dist/:
+
+  - img/<nombre>-<ancho>.<hash>.webp y .jpg: miniaturas de cada imagen de static/img en los
+    anchos de THUMBNAIL_WIDTHS (nunca más grandes que el original)
+  - js/ y css/: copias de los scripts y hojas de estilo con su versión .gz y .br
+  - manifest.json: ruta original (relativa a static/) -> archivos generados
+
+El hash del nombre cambia con el contenido, así que app.py sirve /assets/ con
+Cache-Control immutable por un año: cada despliegue publica nombres nuevos y los navegadores
+no vuelven a pedir lo que ya tienen. Los payloads de negocios incluyen 'image_srcset' con
+las miniaturas (ver db/serializers.py) y las plantillas enlazan los estáticos con asset_url().
+Si no se generó el manifiesto todo sigue funcionando con los archivos originales de /static/.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import threading
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se generan las versiones .gz
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.abspath(os.getenv('ASSETS_DIST_DIR', os.path.join(STATIC_DIR, 'dist')))
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+ASSETS_URL_PREFIX = '/assets/'
+
+# Anchos de las miniaturas en píxeles; el de DEFAULT se usa como 'src' para los navegadores sin srcset
+THUMBNAIL_WIDTHS = tuple(sorted(int(w) for w in os.getenv('THUMBNAIL_WIDTHS', '160,320,640,960').split(',')))
+THUMBNAIL_DEFAULT_WIDTH = int(os.getenv('THUMBNAIL_DEFAULT_WIDTH', 640))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Directorios de static/ que se copian con hash y se precomprimen
+COMPRESSED_DIRS = ('js', 'css')
+COMPRESSED_EXTENSIONS = ('.js', '.css')
+# Codificaciones precomprimidas, en orden de preferencia
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+# --- Generación ---
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def _hashed_name(rel_path, data, suffix=''):
+    # 'js/app.js' -> 'js/app.<hash>.js'; con suffix: 'img/1.png' -> 'img/1-320.<hash>.webp'
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}{suffix}.{_content_hash(data)}{ext}"
+
+def _write(rel_path, data):
+    # Los nombres llevan el hash del contenido: si el archivo existe ya tiene estos bytes
+    path = os.path.join(DIST_DIR, rel_path)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def precompress(rel_path, data):
+    """
+    Escribe las versiones .gz y .br del archivo (solo las que resultan más pequeñas).
+    """
+    compressed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['.br'] = brotli.compress(data, quality=11)
+    for suffix, payload in compressed.items():
+        if len(payload) < len(data):
+            _write(rel_path + suffix, payload)
+
+def build_static_file(rel_path):
+    """
+    Copia un archivo de static/ con el hash en el nombre y lo precomprime.
+    """
+    with open(os.path.join(STATIC_DIR, rel_path), 'rb') as f:
+        data = f.read()
+    hashed = _hashed_name(rel_path, data)
+    _write(hashed, data)
+    precompress(hashed, data)
+    return hashed
+
+def build_thumbnails(rel_path, data, widths=THUMBNAIL_WIDTHS):
+    """
+    Genera las miniaturas WebP y JPEG de una imagen y devuelve su entrada del manifiesto.
+    """
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    width, height = image.size
+    # No se agranda: si la imagen es más chica que el ancho mayor se incluye su propio ancho
+    targets = sorted({w for w in widths if w < width} | ({width} if width <= max(widths) else set()))
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    entry = {'width': width, 'height': height, 'webp': [], 'jpeg': []}
+    for target in targets:
+        resized = image if target == width else image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        resized.save(webp, 'WEBP', quality=WEBP_QUALITY, method=6)
+
+        # JPEG no tiene transparencia: se compone sobre fondo blanco
+        if has_alpha:
+            background = Image.new('RGB', resized.size, (255, 255, 255))
+            background.paste(resized, mask=resized.getchannel('A'))
+            resized = background
+        jpeg = io.BytesIO()
+        resized.save(jpeg, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+        for key, ext, payload in (('webp', '.webp', webp.getvalue()), ('jpeg', '.jpg', jpeg.getvalue())):
+            name = _hashed_name(os.path.splitext(rel_path)[0] + ext, payload, suffix=f'-{target}')
+            _write(name, payload)
+            entry[key].append([target, name])
+    return entry
+
+def _source_files(directory, extensions):
+    root = os.path.join(STATIC_DIR, directory)
+    for current, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if os.path.join(current, d) != DIST_DIR)
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                yield os.path.relpath(os.path.join(current, name), STATIC_DIR).replace(os.sep, '/')
+
+def _read_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}, 'images': {}}
+
+def build(force=False, widths=THUMBNAIL_WIDTHS):
+    """
+    Genera miniaturas y estáticos comprimidos y escribe el manifiesto. Las imágenes cuyo
+    contenido no cambió se reutilizan salvo con force=True.
+    """
+    previous = _read_manifest()
+    manifest = {'files': {}, 'images': {}}
+
+    for directory in COMPRESSED_DIRS:
+        for rel_path in _source_files(directory, COMPRESSED_EXTENSIONS):
+            manifest['files'][rel_path] = build_static_file(rel_path)
+
+    for rel_path in _source_files('img', IMAGE_EXTENSIONS):
+        with open(os.path.join(STATIC_DIR, rel_path), 'rb') as f:
+            data = f.read()
+        source_hash = _content_hash(data)
+        entry = previous['images'].get(rel_path)
+        outputs_exist = entry and all(
+            os.path.exists(os.path.join(DIST_DIR, name)) for _, name in entry['webp'] + entry['jpeg']
+        )
+        if force or not outputs_exist or entry.get('source_hash') != source_hash or entry.get('widths') != list(widths):
+            entry = build_thumbnails(rel_path, data, widths)
+            entry.update(source_hash=source_hash, widths=list(widths))
+            print(f"Miniaturas de {rel_path}: {', '.join(str(w) for w, _ in entry['webp'])} px.")
+        manifest['images'][rel_path] = entry
+
+    _write_manifest(manifest)
+    print(f"Manifiesto con {len(manifest['files'])} estáticos y {len(manifest['images'])} imágenes en {MANIFEST_PATH}.")
+    return manifest
+
+def _write_manifest(manifest):
+    os.makedirs(DIST_DIR, exist_ok=True)
+    tmp_path = f'{MANIFEST_PATH}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def prune(manifest):
+    """
+    Borra de static/dist los archivos que el manifiesto ya no usa.
+    """
+    keep = {'manifest.json'}
+    for name in manifest['files'].values():
+        keep.update(name + suffix for suffix in ('', '.gz', '.br'))
+    for entry in manifest['images'].values():
+        keep.update(name for _, name in entry['webp'] + entry['jpeg'])
+    removed = 0
+    for current, _, files in os.walk(DIST_DIR):
+        for name in files:
+            path = os.path.join(current, name)
+            if os.path.relpath(path, DIST_DIR).replace(os.sep, '/') not in keep:
+                os.remove(path)
+                removed += 1
+    print(f"Eliminados {removed} archivos sin uso.")
+
+
+# --- Uso desde la aplicación ---
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def _load_manifest():
+    """
+    Manifiesto del proceso con los srcset ya armados; se lee una sola vez.
+    """
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                manifest = _read_manifest()
+                images = {}
+                for rel_path, entry in manifest['images'].items():
+                    jpeg = entry['jpeg']
+                    default = min(jpeg, key=lambda item: abs(item[0] - THUMBNAIL_DEFAULT_WIDTH))
+                    images[rel_path] = {
+                        'src': ASSETS_URL_PREFIX + default[1],
+                        'srcset': {
+                            key: ', '.join(f"{ASSETS_URL_PREFIX}{name} {w}w" for w, name in entry[key])
+                            for key in ('webp', 'jpeg')
+                        }
+                    }
+                _manifest = {'files': manifest['files'], 'images': images}
+    return _manifest
+
+def reload_manifest():
+    global _manifest
+    _manifest = None
+
+def _static_path(url):
+    # 'img/1.png', '/static/img/1.png' y '../static/img/1.png' apuntan al mismo archivo. Se quitan
+    # solo los prefijos completos: un nombre que empieza con punto ('.well-known/...') se conserva
+    path = posixpath.normpath(url).lstrip('/')
+    while path.startswith('../'):
+        path = path[len('../'):]
+    return path[len('static/'):] if path.startswith('static/') else path
+
+def image_variants(imagen_url):
+    """
+    {'src', 'srcset': {'webp', 'jpeg'}} de una imagen local con miniaturas, o None (URL
+    externa o manifiesto sin generar).
+    """
+    if not imagen_url or '://' in imagen_url:
+        return None
+    return _load_manifest()['images'].get(_static_path(imagen_url))
+
+def asset_url(path):
+    """
+    URL de un archivo de static/ (por ejemplo 'js/app.js'): la versión con hash si existe.
+    """
+    hashed = _load_manifest()['files'].get(path)
+    return ASSETS_URL_PREFIX + hashed if hashed else '/static/' + path
+
+def send_asset(filename):
+    """
+    Sirve un archivo de static/dist con la mejor codificación precomprimida que acepte el
+    navegador y caché immutable.
+    """
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, suffix = next(
+        ((encoding, suffix) for encoding, suffix in ENCODINGS
+         if request.accept_encodings[encoding] and os.path.isfile(path + suffix)),
+        (None, '')
+    )
+    response = send_file(path + suffix, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(COMPRESSED_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def init_app(app):
+    """
+    Registra /assets/<archivo> y las funciones asset_url() e image_variants() para las plantillas.
+    """
+    app.add_url_rule(ASSETS_URL_PREFIX + '<path:filename>', 'assets', send_asset)
+    app.add_template_global(asset_url)
+    app.add_template_global(image_variants)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera miniaturas y estáticos precomprimidos en static/dist.")
+    parser.add_argument('--force', action='store_true', help="Regenera todas las miniaturas.")
+    parser.add_argument('--prune', action='store_true', help="Borra los archivos generados que ya no se usan.")
+    args = parser.parse_args()
+
+    built = build(force=args.force)
+    if args.prune:
+        prune(built)
@@ -0,0 +1,286 @@
+"""
+Modo de servicio asíncrono para los endpoints de lectura más usados.
+
+    hypercorn async_app:app --bind 0.0.0.0:8001
+
+Atiende /api/recomendaciones, /api/todos_los_negocios, /api/popular_businesses y /api/chatbot
+(y sus propias métricas en /metrics) con los mismos contratos JSON que app.py, pero con Quart y el driver asíncrono de pymongo
+(AsyncMongoClient): mientras una petición espera a MongoDB el mismo proceso atiende otras, así
+que cientos de peticiones pueden estar en curso a la vez. El trabajo de CPU (puntuar
+recomendaciones, clasificar mensajes) corre en un pool de hilos para no bloquear el bucle.
+
+El resto de rutas (login, valoraciones, páginas) sigue en app.py; el proxy inverso envía estas
+rutas de lectura a este proceso. El modelo de recomendaciones se lee del índice compartido en
+disco (model/similarity_store.py): los workers de app.py guardan una versión nueva con cada lote
+de valoraciones y este proceso la carga en la siguiente revisión (ASYNC_MODEL_POLL_INTERVAL).
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from quart import Quart, Response, g, jsonify, request
+from quart.json.provider import DefaultJSONProvider
+
+from db.catalog_cache import AsyncCatalogCache
+from db.connection import get_async_db
+from db.migrations import verify_indexes_at_startup
+from db.pagination import KEYSET_SORT, AsyncCachedCount, encode_cursor, keyset_filter
+from db.serializers import BUSINESS_SUMMARY_PROJECTION, FastJSONProviderMixin, chatbot_response_data, serialize_business
+from metrics import PROMETHEUS_CONTENT_TYPE, instrument_async_app, metrics
+from model import similarity_store
+from model.predictor import NEGOCIO_TAG_MAPPING, predict_tag_and_response
+from model.recommendation_cache import create_recommendation_cache
+from model.recommendation_engine import NeighborIndex, recommend_for_user_async
+from model.search_index import SEARCH_PROJECTION, SearchIndex
+
+load_dotenv()
+
+
+class JSONProvider(FastJSONProviderMixin, DefaultJSONProvider):
+    """
+    jsonify con orjson (si está instalado) y soporte de ObjectId.
+    """
+
+
+app = Quart(__name__)
+app.json = JSONProvider(app)
+# Latencia de cada ruta en /metrics (el perfilador por hilos no aplica a un bucle de eventos)
+instrument_async_app(app, request, g)
+
+# Hilos para el trabajo de CPU (puntuación de recomendaciones y clasificador del chatbot)
+executor = ThreadPoolExecutor(max_workers=int(os.getenv('ASYNC_CPU_THREADS', 4)), thread_name_prefix='async-cpu')
+
+# Cada cuántos segundos se revisa si hay una versión nueva del índice de vecinos en disco
+MODEL_POLL_INTERVAL = int(os.getenv('ASYNC_MODEL_POLL_INTERVAL', 30))
+
+SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', 300))
+CONTENT_INDEX_TTL = int(os.getenv('CONTENT_INDEX_TTL', 600))
+MAX_PAGE_SIZE = 50
+
+db = None
+catalog_cache = None
+businesses_count = None
+# Caché de recomendaciones compartida con app.py en Redis (claves por versión del índice en disco),
+# donde app.py borra las de un usuario cuando valora. Sin RECOMMENDATION_CACHE_URL no se guardan
+# aquí: una caché propia de este proceso no se enteraría de esas valoraciones
+recommendation_cache = create_recommendation_cache() if os.getenv('RECOMMENDATION_CACHE_URL') else None
+
+# Índice de vecinos publicado y su versión en disco (se reemplazan juntos)
+model_state = {'version': None, 'model': NeighborIndex.empty()}
+search_state = {'index': None, 'refreshing': False, 'retry_at': 0.0}
+# Índice de vecinos por contenido que se mezcla con el colaborativo (None hasta el primero)
+content_state = {'index': None}
+search_index_lock = asyncio.Lock()
+
+
+async def load_model_snapshot():
+    """
+    Carga la versión actual del índice de vecinos si cambió. Leer el disco (o construir el
+    índice si todavía no existe) se hace en el pool de hilos.
+    """
+    loop = asyncio.get_running_loop()
+    version = similarity_store.get_current_version()
+    if version is None:
+        model, manifest = await loop.run_in_executor(executor, similarity_store.load_or_build)
+        version = manifest['version']
+    elif version != model_state['version']:
+        model, manifest = await loop.run_in_executor(
+            executor, similarity_store.load_current, similarity_store.SNAPSHOT_DIR, float('inf')
+        )
+        if model is None:
+            return
+        version = manifest['version']
+    else:
+        return
+    model_state.update(version=version, model=model)
+
+async def watch_model_snapshots():
+    while True:
+        await asyncio.sleep(MODEL_POLL_INTERVAL)
+        try:
+            await load_model_snapshot()
+        except Exception as e:
+            print(f"Error al recargar el índice de vecinos: {e}")
+
+async def watch_content_index():
+    """
+    Carga el índice de contenido compartido en disco (el mismo que usan los workers de app.py)
+    y revisa cada MODEL_POLL_INTERVAL segundos si hay una versión nueva. Solo se construye aquí
+    si ningún proceso guardó una con menos de CONTENT_INDEX_TTL segundos.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            content_state['index'] = await loop.run_in_executor(
+                executor, similarity_store.refresh_content_index, content_state['index'],
+                similarity_store.SNAPSHOT_DIR, CONTENT_INDEX_TTL
+            )
+        except Exception as e:
+            print(f"Error al cargar el índice de contenido: {e}")
+        await asyncio.sleep(MODEL_POLL_INTERVAL)
+
+@app.before_serving
+async def startup():
+    global db, catalog_cache, businesses_count
+    # No arranca si alguna consulta frecuente haría un COLLSCAN (usa el cliente síncrono, en un hilo)
+    await asyncio.get_running_loop().run_in_executor(executor, verify_indexes_at_startup)
+    db = get_async_db()
+    catalog_cache = AsyncCatalogCache(db, refresh_interval=int(os.getenv('CATALOG_REFRESH_INTERVAL', 60)))
+    businesses_count = AsyncCachedCount(db, 'negocios', ttl_seconds=int(os.getenv('BUSINESS_COUNT_TTL', 60)))
+    app.add_background_task(load_model_snapshot)
+    app.add_background_task(watch_model_snapshots)
+    app.add_background_task(watch_content_index)
+
+async def build_search_index():
+    negocios = await db.negocios.find({}, SEARCH_PROJECTION).to_list(None)
+    return await asyncio.get_running_loop().run_in_executor(executor, SearchIndex, negocios)
+
+async def refresh_search_index():
+    try:
+        search_state['index'] = await build_search_index()
+    except Exception as e:
+        print(f"Error al reconstruir el índice de búsqueda: {e}")
+        search_state['retry_at'] = time.time() + 30
+    finally:
+        search_state['refreshing'] = False
+
+async def get_search_index():
+    """
+    Índice de búsqueda en memoria, reconstruido desde 'negocios' cada SEARCH_INDEX_TTL segundos.
+    Solo la primera construcción se espera; las siguientes corren en segundo plano y mientras
+    tanto se sigue usando el índice anterior.
+    """
+    index = search_state['index']
+    if index is None:
+        async with search_index_lock:
+            if search_state['index'] is None:
+                search_state['index'] = await build_search_index()
+        return search_state['index']
+    now = time.time()
+    if (now - index.built_at >= SEARCH_INDEX_TTL and now >= search_state['retry_at']
+            and not search_state['refreshing']):
+        search_state['refreshing'] = True
+        app.add_background_task(refresh_search_index)
+    return index
+
+async def catalog_response(payload):
+    """
+    Respuesta JSON con el ETag de la versión del catálogo (304 si el navegador ya la tiene).
+    """
+    response = jsonify(payload)
+    response.set_etag(await catalog_cache.current_etag())
+    response.headers['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    if request.if_none_match.contains(response.get_etag()[0]):
+        response.status_code = 304
+        response.set_data(b'')
+    return response
+
+async def get_user_recommendations(user_id_obj):
+    """
+    Recomendaciones serializadas de un usuario, usando la caché compartida si está configurada.
+    """
+    version, model = model_state['version'], model_state['model']
+    loop = asyncio.get_running_loop()
+    if recommendation_cache is not None:
+        recommendations_json = await loop.run_in_executor(executor, recommendation_cache.get, user_id_obj, version)
+        if recommendations_json is not None:
+            return recommendations_json
+    recommendations = await recommend_for_user_async(
+        user_id_obj, model, db, catalog_cache.top, executor=executor, content_index=content_state['index']
+    )
+    recommendations_json = [serialize_business(b) for b in recommendations]
+    if recommendation_cache is not None:
+        await loop.run_in_executor(executor, recommendation_cache.set, user_id_obj, version, recommendations_json)
+    return recommendations_json
+
+# --- Rutas de lectura ---
+@app.route('/api/recomendaciones')
+async def get_recommendations_api():
+    try:
+        user_id = request.args.get('user_id')
+        category = request.args.get('category')
+        search_term = request.args.get('search')
+
+        if user_id:
+            if user_id == "popular":
+                return await catalog_response([serialize_business(b) for b in await catalog_cache.top(5)])
+            return jsonify(await get_user_recommendations(ObjectId(user_id))), 200
+        elif category:
+            return await catalog_response([serialize_business(b) for b in await catalog_cache.top(10, category)])
+        elif search_term:
+            recommendations = (await get_search_index()).search(search_term, limit=10)
+        else:
+            return jsonify({"error": "Parámetros de búsqueda no válidos"}), 400
+
+        return jsonify([serialize_business(b) for b in recommendations]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/todos_los_negocios')
+async def get_all_businesses():
+    """
+    Listado paginado de negocios (por 'cursor' o por 'page' y 'limit'), como en app.py.
+    """
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 10)), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+
+        query = db.negocios.find(keyset_filter(cursor) if cursor else {}, BUSINESS_SUMMARY_PROJECTION).sort(KEYSET_SORT)
+        if cursor is None:
+            query = query.skip((page - 1) * limit)
+
+        # Se pide un documento extra para saber si hay una página siguiente
+        businesses = await query.limit(limit + 1).to_list(limit + 1)
+        has_more = len(businesses) > limit
+        businesses = businesses[:limit]
+        total_businesses = await businesses_count.get()
+
+        return jsonify({
+            "businesses": [serialize_business(b) for b in businesses],
+            "total_pages": (total_businesses + limit - 1) // limit,
+            "current_page": page,
+            "next_cursor": encode_cursor(businesses[-1]) if has_more else None
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/popular_businesses')
+async def get_popular_businesses():
+    """
+    Los 4 negocios más populares (mejor ranking).
+    """
+    try:
+        return await catalog_response([serialize_business(b) for b in await catalog_cache.top(4)])
+    except Exception as e:
+        print(f"Error al obtener negocios populares: {e}")
+        return jsonify({"error": "Ocurrió un error en el servidor."}), 500
+
+@app.route('/api/chatbot', methods=['POST'])
+async def chatbot():
+    data = await request.get_json()
+    user_message = data.get('message', '')
+
+    try:
+        tag, static_response = await asyncio.get_running_loop().run_in_executor(
+            executor, predict_tag_and_response, user_message
+        )
+    except Exception as e:
+        print(f"Error en el modelo de predicción: {e}")
+        return jsonify({"message": "Lo siento, hubo un problema con el asistente. Intenta de nuevo más tarde."}), 500
+
+    categoria_negocio = NEGOCIO_TAG_MAPPING.get(tag)
+    negocios = await catalog_cache.top(3, categoria_negocio) if categoria_negocio else []
+    return jsonify(chatbot_response_data(categoria_negocio, negocios, static_response))
+
+@app.route('/metrics')
+async def get_metrics():
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    app.run(port=8001)
@@ -0,0 +1,173 @@
+"""
+Generador de carga concurrente para los endpoints de la aplicación Flask.
+
+    python -m benchmarks.load --scale full --concurrency 16 --duration 30
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 64 --duration 60
+
+Sin --url carga los datos sintéticos (ver benchmarks/synthetic.py) y llama a la aplicación
+dentro del mismo proceso con el cliente de pruebas de Flask: mide el costo de las vistas,
+MongoDB y el modelo sin la red ni el servidor WSGI. Con --url envía peticiones HTTP a un
+servidor ya en marcha (por ejemplo gunicorn), que debe usar la misma base de datos.
+mongomock no es seguro entre hilos: con --backend mongomock pueden aparecer errores
+esporádicos que no ocurren con MongoDB; para medir carga conviene usar mongod.
+
+Cada hilo elige endpoints al azar según su peso durante --duration segundos. Se reportan
+p50/p95/p99, rendimiento y errores por endpoint y en total, y se guarda el resultado en
+benchmarks/results/.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from benchmarks import synthetic
+from benchmarks.micro import CHATBOT_MESSAGES
+from benchmarks.results import print_summary, save_results, summarize
+
+# Peso de cada endpoint en la mezcla de peticiones
+ENDPOINT_WEIGHTS = {
+    'popular': 3,
+    'listing': 3,
+    'recommendations': 4,
+    'search': 2,
+    'nearby': 2,
+    'chatbot': 1,
+}
+
+
+class Workload:
+    """
+    Genera peticiones (método, ruta, cuerpo JSON) con parámetros tomados de los datos cargados.
+    """
+
+    def __init__(self, db, endpoints, seed=42):
+        self.endpoints = list(endpoints)
+        self.weights = [ENDPOINT_WEIGHTS[name] for name in self.endpoints]
+        self.seed = seed
+        self.usuarios = [str(u) for u in db.valoraciones.distinct('usuario_id')] or ['popular']
+        self.total_pages = max(db.negocios.estimated_document_count() // 20, 1)
+        self.words = synthetic.PALABRAS + [name.split()[0].lower() for names in synthetic.NOMBRES.values() for name in names]
+
+    def next_request(self, rng):
+        name = rng.choices(self.endpoints, self.weights)[0]
+        if name == 'popular':
+            return name, 'GET', '/api/popular_businesses', None
+        if name == 'listing':
+            # Las primeras páginas son las más visitadas
+            page = min(int(rng.expovariate(1 / 5)) + 1, self.total_pages)
+            return name, 'GET', f'/api/todos_los_negocios?limit=20&page={page}', None
+        if name == 'recommendations':
+            return name, 'GET', f'/api/recomendaciones?user_id={rng.choice(self.usuarios)}', None
+        if name == 'search':
+            return name, 'GET', f'/api/recomendaciones?search={rng.choice(self.words)}', None
+        if name == 'nearby':
+            lat = synthetic.CENTER_LAT + rng.gauss(0, synthetic.COORDINATE_SPREAD)
+            lng = synthetic.CENTER_LON + rng.gauss(0, synthetic.COORDINATE_SPREAD)
+            return name, 'GET', f'/api/cercanos?lat={lat:.5f}&lng={lng:.5f}&radio=2', None
+        return name, 'POST', '/api/chatbot', {'message': rng.choice(CHATBOT_MESSAGES)}
+
+
+def flask_client_factory():
+    """
+    Clientes de prueba de la aplicación en este proceso (uno por hilo).
+    """
+    import app
+    app.training_scheduler.wait_until_ready()
+
+    def send(client, method, path, body):
+        return client.open(path, method=method, json=body).status_code
+
+    return app.app.test_client, send
+
+def http_client_factory(base_url, timeout):
+    """
+    Sesiones HTTP contra un servidor en marcha (una por hilo).
+    """
+    import requests
+
+    def send(session, method, path, body):
+        return session.request(method, base_url.rstrip('/') + path, json=body, timeout=timeout).status_code
+
+    return requests.Session, send
+
+def run(workload, new_client, send, concurrency=8, duration=30.0, warmup=2.0):
+    """
+    Ejecuta la carga y devuelve el resumen por endpoint y total ('all').
+    """
+    samples = {name: [] for name in workload.endpoints}
+    errors = {name: 0 for name in workload.endpoints}
+    lock = threading.Lock()
+    start_measuring = time.perf_counter() + warmup
+    deadline = start_measuring + duration
+
+    def worker(worker_id):
+        rng = random.Random(workload.seed + worker_id)
+        client = new_client()
+        while True:
+            name, method, path, body = workload.next_request(rng)
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                return
+            try:
+                failed = send(client, method, path, body) >= 500
+            except Exception:
+                failed = True
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            if t0 < start_measuring:
+                continue  # Calentamiento: índices perezosos, cachés y conexiones
+            with lock:
+                samples[name].append(elapsed_ms)
+                if failed:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for name in workload.endpoints:
+        results[name] = {**summarize(samples[name], duration), 'errors': errors[name]}
+    all_samples = [ms for name in workload.endpoints for ms in samples[name]]
+    results['all'] = {**summarize(all_samples, duration), 'errors': sum(errors.values())}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Carga concurrente sobre los endpoints de la aplicación.")
+    synthetic.add_arguments(parser)
+    parser.add_argument('--url', help="Servidor en marcha; sin --url se usa la aplicación en este proceso.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="Segundos de medición.")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Segundos iniciales que no se miden.")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Tiempo máximo por petición HTTP.")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINT_WEIGHTS), help="Endpoints separados por comas.")
+    parser.add_argument('--no-save', action='store_true', help="No guarda el resultado en benchmarks/results/.")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINT_WEIGHTS)
+    if unknown:
+        parser.error(f"Endpoints desconocidos: {', '.join(sorted(unknown))}")
+
+    os.environ['MODEL_STARTUP_MODE'] = 'blocking'
+    if args.url:
+        # Los parámetros de las peticiones se toman de la base de datos sintética que usa el servidor
+        db = synthetic.connect('mongod', args.mongo_uri)
+        data_info = {'url': args.url}
+        new_client, send = http_client_factory(args.url, args.timeout)
+    else:
+        db, data_info = synthetic.prepare(
+            args.scale, args.backend, args.mongo_uri, args.seed, args.reuse, not args.no_indexes
+        )
+        new_client, send = flask_client_factory()
+    print(f"Datos: {data_info}")
+
+    results = run(Workload(db, endpoints, args.seed), new_client, send, args.concurrency, args.duration, args.warmup)
+    print_summary(results)
+    print(f"Errores: {results['all']['errors']}")
+    if not args.no_save:
+        params = {**vars(args), 'data': data_info}
+        print(f"Resultado guardado en {save_results('load', results, params)}")
@@ -0,0 +1,152 @@
+"""
+Micro-benchmarks de las piezas que más pesan en el servidor, sobre datos sintéticos.
+
+    python -m benchmarks.micro --scale full
+    python -m benchmarks.micro --scale small --backend mongomock --only train,score
+
+Operaciones:
+  - train: train_model() completo (lectura de valoraciones y vecinos más similares)
+  - score: recommend_for_user() de usuarios al azar con el índice ya entrenado
+  - content_build / score_blended: índice de contenido y recomendaciones mezclándolo con el colaborativo
+  - search_build / search: construcción del índice de búsqueda y consultas de una o dos palabras
+  - page_keyset / page_skip: páginas de /api/todos_los_negocios por cursor y por 'skip'
+  - chatbot / chatbot_cached: predicción de la etiqueta de mensajes nuevos y repetidos
+
+El resultado se guarda en benchmarks/results/ (ver benchmarks/results.py).
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks import synthetic
+from benchmarks.results import print_summary, save_results, summarize
+
+OPERATIONS = ('train', 'score', 'search', 'pagination', 'chatbot')
+
+CHATBOT_MESSAGES = [
+    'recomiendame un restaurante', 'donde puedo dormir esta noche', 'hola', 'que sitios turisticos hay',
+    'quiero tomar algo con amigos', 'gracias', 'cual es el horario', 'busco un hotel barato'
+]
+
+
+def time_calls(fn, calls):
+    """
+    Ejecuta fn(*args) por cada elemento de calls y devuelve el resumen de los tiempos.
+    """
+    samples = []
+    start = time.perf_counter()
+    for args in calls:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples, time.perf_counter() - start)
+
+def bench_train(repeats):
+    from model.recommendation_engine import train_model
+    return {'train': time_calls(train_model, [()] * repeats)}
+
+def bench_score(db, iterations, rng):
+    from model.content_index import build_content_index
+    from model.recommendation_engine import recommend_for_user, train_model
+    index = train_model()
+    # Usuarios con valoraciones: los que reciben recomendaciones personalizadas
+    usuarios = db.valoraciones.distinct('usuario_id')
+    results = {'score': time_calls(
+        recommend_for_user, [(rng.choice(usuarios), index) for _ in range(iterations)]
+    )}
+    results['content_build'] = time_calls(build_content_index, [(db,)])
+    content_index = build_content_index(db)
+    results['score_blended'] = time_calls(
+        lambda user_id: recommend_for_user(user_id, index, content_index=content_index),
+        [(rng.choice(usuarios),) for _ in range(iterations)]
+    )
+    return results
+
+def bench_search(db, repeats, iterations, rng):
+    from model.search_index import build_search_index
+    results = {'search_build': time_calls(build_search_index, [(db,)] * repeats)}
+    index = build_search_index(db)
+    words = synthetic.PALABRAS + [name.split()[0].lower() for names in synthetic.NOMBRES.values() for name in names]
+    queries = [
+        ' '.join(rng.sample(words, rng.choice((1, 2)))) if rng.random() < 0.8 else rng.choice(words)[:3]
+        for _ in range(iterations)
+    ]
+    results['search'] = time_calls(index.search, [(query,) for query in queries])
+    return results
+
+def bench_pagination(db, pages, page_size):
+    from db.pagination import KEYSET_SORT, encode_cursor, keyset_filter
+    from db.serializers import BUSINESS_SUMMARY_PROJECTION
+    state = {'cursor': None}
+
+    def keyset_page():
+        query = db.negocios.find(keyset_filter(state['cursor']) if state['cursor'] else {}, BUSINESS_SUMMARY_PROJECTION)
+        businesses = list(query.sort(KEYSET_SORT).limit(page_size + 1))
+        state['cursor'] = encode_cursor(businesses[page_size - 1]) if len(businesses) > page_size else None
+
+    def skip_page(page):
+        query = db.negocios.find({}, BUSINESS_SUMMARY_PROJECTION).sort(KEYSET_SORT)
+        list(query.skip(page * page_size).limit(page_size + 1))
+
+    return {
+        'page_keyset': time_calls(keyset_page, [()] * pages),
+        'page_skip': time_calls(skip_page, [(page,) for page in range(pages)])
+    }
+
+def bench_chatbot(iterations, rng):
+    from model.predictor import predict_tag_and_response, registry
+    registry.current()  # La carga del modelo no forma parte de la medición
+    # Una palabra extra distinta en cada mensaje evita la caché de mensajes ya clasificados
+    new_messages = [(f"{rng.choice(CHATBOT_MESSAGES)} {i}",) for i in range(iterations)]
+    repeated = [(rng.choice(CHATBOT_MESSAGES),) for _ in range(iterations)]
+    return {
+        'chatbot': time_calls(predict_tag_and_response, new_messages),
+        'chatbot_cached': time_calls(predict_tag_and_response, repeated)
+    }
+
+def run(db, operations=OPERATIONS, repeats=3, iterations=200, pages=50, page_size=20, seed=42):
+    """
+    Ejecuta las operaciones pedidas y devuelve el resumen de cada una.
+    """
+    rng = random.Random(seed)
+    results = {}
+    if 'train' in operations:
+        results.update(bench_train(repeats))
+    if 'score' in operations:
+        results.update(bench_score(db, iterations, rng))
+    if 'search' in operations:
+        results.update(bench_search(db, repeats, iterations, rng))
+    if 'pagination' in operations:
+        results.update(bench_pagination(db, pages, page_size))
+    if 'chatbot' in operations:
+        results.update(bench_chatbot(iterations, rng))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del recomendador, la búsqueda, la paginación y el chatbot.")
+    synthetic.add_arguments(parser)
+    parser.add_argument('--only', default=','.join(OPERATIONS), help=f"Operaciones separadas por comas ({', '.join(OPERATIONS)}).")
+    parser.add_argument('--repeats', type=int, default=3, help="Repeticiones de las operaciones pesadas (entrenar, indexar).")
+    parser.add_argument('--iterations', type=int, default=200, help="Llamadas de las operaciones por petición.")
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--no-save', action='store_true', help="No guarda el resultado en benchmarks/results/.")
+    args = parser.parse_args()
+
+    operations = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"Operaciones desconocidas: {', '.join(sorted(unknown))}")
+
+    os.environ['MODEL_STARTUP_MODE'] = 'blocking'
+    db, data_info = synthetic.prepare(
+        args.scale, args.backend, args.mongo_uri, args.seed, args.reuse, not args.no_indexes
+    )
+    print(f"Datos: {data_info}")
+    results = run(db, operations, args.repeats, args.iterations, args.pages, args.page_size, args.seed)
+    print_summary(results)
+    if not args.no_save:
+        params = {**vars(args), 'data': data_info}
+        print(f"Resultado guardado en {save_results('micro', results, params)}")
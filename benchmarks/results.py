@@ -0,0 +1,125 @@
+"""
+Estadísticas, guardado y comparación de resultados de los benchmarks.
+
+    python -m benchmarks.results benchmarks/results/micro-ANTES.json benchmarks/results/micro-DESPUES.json
+
+Cada resultado se guarda en benchmarks/results/<tipo>-<fecha>.json junto con el commit,
+la versión de Python y los parámetros de la corrida, para comparar corridas entre cambios.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.getenv('BENCH_RESULTS_DIR', os.path.join(BENCHMARKS_DIR, 'results'))
+
+# Métricas de latencia que se comparan entre corridas
+COMPARED_METRICS = ('p50', 'p95', 'p99')
+
+
+def summarize(samples_ms, elapsed_s=None):
+    """
+    Percentiles y media (en milisegundos) de una lista de tiempos. Con elapsed_s se agrega
+    el rendimiento (operaciones por segundo) de toda la corrida.
+    """
+    values = np.asarray(samples_ms, dtype=float)
+    if not len(values):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    summary = {
+        'count': len(values),
+        'min': round(float(values.min()), 3),
+        'mean': round(float(values.mean()), 3),
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(values.max()), 3)
+    }
+    if elapsed_s:
+        summary['throughput'] = round(len(values) / elapsed_s, 1)
+    return summary
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(kind, results, params, directory=RESULTS_DIR):
+    """
+    Guarda un resultado con sus metadatos y devuelve la ruta del archivo.
+    """
+    os.makedirs(directory, exist_ok=True)
+    document = {
+        'kind': kind,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results
+    }
+    path = os.path.join(directory, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    return path
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def compare(baseline, current):
+    """
+    Filas (operación, métrica, antes, después, cambio %) de las operaciones presentes en
+    ambos resultados. Un cambio positivo es más lento.
+    """
+    rows = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if not isinstance(before, dict) or not isinstance(after, dict):
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in before and metric in after:
+                change = (after[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+                rows.append((name, metric, before[metric], after[metric], round(change, 1)))
+    return rows
+
+def print_summary(results):
+    """
+    Imprime una línea por operación con sus percentiles.
+    """
+    for name, summary in results.items():
+        if not isinstance(summary, dict) or 'p50' not in summary:
+            continue
+        line = f"{name:<28} n={summary['count']:<7} p50={summary['p50']:>9.2f} ms  p95={summary['p95']:>9.2f} ms  p99={summary['p99']:>9.2f} ms"
+        if 'throughput' in summary:
+            line += f"  {summary['throughput']:>8.1f}/s"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara dos resultados de benchmarks.")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--max-regression', type=float, help="Falla si algún p50 empeora más de este porcentaje.")
+    args = parser.parse_args()
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    regressions = []
+    for name, metric, before, after, change in compare(baseline, current):
+        print(f"{name:<28} {metric:<4} {before:>10.2f} -> {after:>10.2f} ms  ({change:+.1f}%)")
+        if args.max_regression is not None and metric == 'p50' and change > args.max_regression:
+            regressions.append(name)
+    if regressions:
+        print(f"Empeoraron más de {args.max_regression}%: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,88 @@
+"""
+Benchmark del arranque en frío de la aplicación.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --mode blocking --max-first-response-ms 3000
+
+Cada corrida lanza un proceso nuevo de Python (como un worker de gunicorn) y mide:
+  - import_ms: tiempo de 'import app' (módulos, conexión perezosa y arranque de hilos)
+  - first_response_ms: desde el inicio del proceso hasta la respuesta a GET /
+  - model_ready_ms: hasta que el recomendador publica su modelo inicial
+Usa la base de datos configurada en MONGO_URI / MONGO_DB_NAME. Con --max-first-response-ms
+el proceso termina con código 1 si la mediana supera el umbral (útil para detectar regresiones).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Código que ejecuta cada proceso hijo; imprime una línea JSON con sus tiempos
+CHILD_CODE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+responded = time.perf_counter()
+app.training_scheduler.wait_until_ready(timeout=600)
+ready = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_response_ms': (responded - start) * 1000,
+    'model_ready_ms': (ready - start) * 1000
+}))
+"""
+
+
+def run_once(mode, snapshot_dir=None):
+    env = dict(os.environ, MODEL_STARTUP_MODE=mode)
+    if snapshot_dir:
+        env['RECOMMENDER_SNAPSHOT_DIR'] = snapshot_dir
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_CODE], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    # La última línea es el JSON; lo anterior son los mensajes de arranque de la app
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min': round(values[0], 1),
+        'p50': round(statistics.median(values), 1),
+        'max': round(values[-1], 1)
+    }
+
+def run(runs=5, mode='background', snapshot_dir=None):
+    """
+    Ejecuta el benchmark y devuelve las estadísticas de cada métrica.
+    """
+    samples = [run_once(mode, snapshot_dir) for _ in range(runs)]
+    return {
+        'mode': mode,
+        'runs': runs,
+        **{metric: summarize([sample[metric] for sample in samples]) for metric in samples[0]}
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mide el arranque en frío de la aplicación.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=['background', 'blocking'], default='background')
+    parser.add_argument('--snapshot-dir', help="Directorio del índice compartido (por defecto el de la app).")
+    parser.add_argument('--max-first-response-ms', type=float, help="Falla si la mediana supera este valor.")
+    parser.add_argument('--output', help="Guarda el resultado en un archivo JSON.")
+    args = parser.parse_args()
+
+    results = run(args.runs, args.mode, args.snapshot_dir)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_first_response_ms and results['first_response_ms']['p50'] > args.max_first_response_ms:
+        print(f"La mediana de la primera respuesta supera el umbral de {args.max_first_response_ms} ms.")
+        sys.exit(1)
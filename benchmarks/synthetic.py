@@ -0,0 +1,223 @@
+"""
+Catálogo y valoraciones sintéticas para los benchmarks, con la forma de los documentos de
+db/seed_db.py (negocios, usuarios y valoraciones con sus agregados ya calculados).
+
+    python -m benchmarks.synthetic --scale full --mongo-uri mongodb://localhost:27017
+
+La popularidad de los negocios sigue una ley de potencias (pocos negocios concentran muchas
+valoraciones, como en el uso real) y cada negocio tiene una calidad base alrededor de la
+cual varían sus puntuaciones. Con la misma semilla se generan siempre los mismos datos.
+
+Backends:
+  - mongod: una instancia local (o la de --mongo-uri). Se usa una base de datos propia
+    (BENCH_DB_NAME) que se borra antes de cargar; nunca la de la aplicación.
+  - mongomock: base en memoria dentro del proceso. No necesita servidor, pero sus consultas
+    son mucho más lentas que las de MongoDB, así que solo es práctica con --scale small.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from db import connection
+from db.migrations import INDEXES, ensure_indexes
+from db.seed_db import negocios_data
+
+# (negocios, usuarios, valoraciones) de cada escala
+SCALES = {
+    'small': (500, 2000, 20000),
+    'medium': (2000, 10000, 200000),
+    'full': (10000, 50000, 1000000),
+}
+
+BENCH_DB_NAME = os.getenv('BENCH_DB_NAME', 'turismo_benchmark')
+
+# Centro de El Carmen de Bolívar y dispersión (en grados) de los negocios generados
+CENTER_LAT, CENTER_LON = 9.714, -75.127
+COORDINATE_SPREAD = 0.05
+
+CATEGORIAS = ['Restaurantes', 'Hospedajes', 'Sitios Turisticos', 'Bares']
+NOMBRES = {
+    'Restaurantes': ['Restaurante', 'Asadero', 'Cocina', 'Sazón', 'Fogón'],
+    'Hospedajes': ['Hotel', 'Hospedaje', 'Posada', 'Hostal', 'Casa'],
+    'Sitios Turisticos': ['Parque', 'Mirador', 'Museo', 'Plaza', 'Sendero'],
+    'Bares': ['Bar', 'Taberna', 'Estadero', 'Terraza', 'Cantina'],
+}
+APELLIDOS = ['del Carmen', 'La Candelaria', 'Los Montes', 'El Cerro', 'San Juan', 'La Cueva', 'Las Palmas', 'El Tabaco']
+PALABRAS = [
+    'comida', 'típica', 'ambiente', 'familiar', 'música', 'vallenato', 'tranquilo', 'cultura',
+    'naturaleza', 'paseo', 'noche', 'amigos', 'tradicional', 'colombiana', 'descanso', 'vista'
+]
+
+
+def generate(n_negocios, n_usuarios, n_valoraciones, seed=42):
+    """
+    Devuelve (negocios, usuarios, valoraciones) como listas de documentos listos para insertar.
+    Puede haber algunas valoraciones menos que n_valoraciones: se descartan los pares
+    (usuario, negocio) repetidos, como hace el índice único de la colección.
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+
+    negocio_ids = _object_ids(1, n_negocios)
+    usuario_ids = _object_ids(2, n_usuarios)
+
+    # Popularidad (ley de potencias) y calidad base de cada negocio
+    popularity = 1.0 / np.arange(1, n_negocios + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    quality = rng.normal(3.6, 0.7, n_negocios)
+
+    negocio_idx = rng.choice(n_negocios, size=n_valoraciones, p=popularity)
+    usuario_idx = rng.integers(0, n_usuarios, size=n_valoraciones)
+    pairs, first = np.unique(usuario_idx.astype(np.int64) * n_negocios + negocio_idx, return_index=True)
+    usuario_idx, negocio_idx = usuario_idx[first], negocio_idx[first]
+    puntuaciones = np.clip(np.rint(quality[negocio_idx] + rng.normal(0, 0.9, len(pairs))), 1, 5).astype(int)
+    antiguedad = rng.integers(0, 180 * 24 * 3600, size=len(pairs))
+
+    valoraciones = [
+        {
+            'usuario_id': usuario_ids[u],
+            'negocio_id': negocio_ids[n],
+            'puntuacion': int(p),
+            'actualizado_en': now - timedelta(seconds=int(s)),
+            'escrito_en': now - timedelta(seconds=int(s))
+        }
+        for u, n, p, s in zip(usuario_idx, negocio_idx, puntuaciones, antiguedad)
+    ]
+
+    # Agregados por negocio, igual que reconcile_rating_aggregates
+    totales = np.bincount(negocio_idx, minlength=n_negocios)
+    sumas = np.bincount(negocio_idx, weights=puntuaciones, minlength=n_negocios)
+    histogramas = np.zeros((n_negocios, 5), dtype=int)
+    np.add.at(histogramas, (negocio_idx, puntuaciones - 1), 1)
+
+    categorias = rng.integers(0, len(CATEGORIAS), size=n_negocios)
+    lat = CENTER_LAT + rng.normal(0, COORDINATE_SPREAD, n_negocios)
+    lon = CENTER_LON + rng.normal(0, COORDINATE_SPREAD, n_negocios)
+    plantilla = negocios_data[0]
+    negocios = []
+    for i, negocio_id in enumerate(negocio_ids):
+        categoria = CATEGORIAS[categorias[i]]
+        negocio = {
+            '_id': negocio_id,
+            'nombre': f"{rng.choice(NOMBRES[categoria])} {rng.choice(APELLIDOS)} {i}",
+            'categoria': categoria,
+            'descripcion': ' '.join(rng.choice(PALABRAS, size=8)).capitalize() + '.',
+            'imagen_url': f"img/db_img/{i % 5 + 1}.png",
+            'coordenadas': {'lat': round(float(lat[i]), 6), 'lon': round(float(lon[i]), 6)},
+            'telefono': f"+57 300 {i // 10000:03d} {i % 10000:04d}",
+            'email': f"negocio{i}@example.com",
+            'horario_atencion': dict(plantilla['horario_atencion']),
+            'suma_puntuaciones': int(sumas[i]),
+            'total_valoraciones': int(totales[i]),
+            'histograma_puntuaciones': {str(p): int(histogramas[i, p - 1]) for p in range(1, 6)}
+        }
+        if totales[i]:
+            negocio['promedio_ranking'] = round(float(sumas[i] / totales[i]), 1)
+        negocios.append(negocio)
+
+    usuarios = [
+        {
+            '_id': usuario_id,
+            'nombre': f"Usuario {i}",
+            'email': f"usuario{i}@example.com",
+            'password_hash': '12345',
+            'fecha_registro': now
+        }
+        for i, usuario_id in enumerate(usuario_ids)
+    ]
+    return negocios, usuarios, valoraciones
+
+def _object_ids(collection, n):
+    # Ids fijos (no dependen de la hora) para que dos cargas con la misma semilla sean iguales
+    return [ObjectId(f"{0x66000000 + collection:08x}{i:016x}") for i in range(n)]
+
+def connect(backend='mongod', mongo_uri=None, db_name=BENCH_DB_NAME):
+    """
+    Apunta la conexión compartida (db/connection.py) a la base de datos del benchmark y
+    aísla los archivos locales de la aplicación (índice de vecinos y spool de valoraciones)
+    en un directorio temporal. Debe llamarse antes de importar app.
+    """
+    os.environ['MONGO_DB_NAME'] = db_name
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    work_dir = tempfile.mkdtemp(prefix='turismo-bench-')
+    os.environ['RECOMMENDER_SNAPSHOT_DIR'] = os.path.join(work_dir, 'snapshots')
+    os.environ['RATING_SPOOL_DIR'] = os.path.join(work_dir, 'spool')
+
+    if backend == 'mongomock':
+        import mongomock
+        os.environ['MONGO_URI'] = 'mongodb://mongomock'
+        # mongomock no implementa explain(), así que la aplicación no puede verificar sus índices
+        os.environ['MONGO_INDEX_CHECK'] = 'off'
+        connection.set_client(mongomock.MongoClient())
+    else:
+        # No se toma MONGO_URI del .env: el benchmark borra colecciones y no debe tocar el servidor real
+        os.environ['MONGO_URI'] = mongo_uri or os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017')
+    return connection.get_db()
+
+def load(db, negocios, usuarios, valoraciones, chunk_size=10000):
+    """
+    Borra las colecciones del benchmark e inserta los datos por bloques.
+    """
+    for name, documents in (('negocios', negocios), ('usuarios', usuarios), ('valoraciones', valoraciones)):
+        db[name].drop()
+        for i in range(0, len(documents), chunk_size):
+            db[name].insert_many(documents[i:i + chunk_size], ordered=False)
+
+def prepare(scale='small', backend='mongod', mongo_uri=None, seed=42, reuse=False, indexes=True):
+    """
+    Conecta con el backend y carga los datos sintéticos de la escala indicada. Con reuse
+    (solo mongod) se conservan los datos de una carga anterior si tienen la escala pedida.
+    Con indexes se crean los índices de db/migrations.py; sin ellos (para comparar) la
+    aplicación arranca igual, pero avisa de los COLLSCAN.
+    Devuelve (db, info) con los tamaños y el tiempo de carga.
+    """
+    n_negocios, n_usuarios, n_valoraciones = SCALES[scale]
+    db = connect(backend, mongo_uri)
+    info = {'scale': scale, 'backend': backend, 'seed': seed}
+
+    if reuse and backend == 'mongod' and db.negocios.estimated_document_count() == n_negocios:
+        info['reused'] = True
+    else:
+        start = time.perf_counter()
+        negocios, usuarios, valoraciones = generate(n_negocios, n_usuarios, n_valoraciones, seed)
+        generated = time.perf_counter()
+        load(db, negocios, usuarios, valoraciones)
+        info['generate_s'] = round(generated - start, 2)
+        info['load_s'] = round(time.perf_counter() - generated, 2)
+
+    if indexes:
+        ensure_indexes(db)
+    else:
+        for collection in INDEXES:
+            db[collection].drop_indexes()
+        if backend == 'mongod':
+            os.environ['MONGO_INDEX_CHECK'] = 'warn'
+    info['indexes'] = indexes
+    info['negocios'] = db.negocios.estimated_document_count()
+    info['usuarios'] = db.usuarios.estimated_document_count()
+    info['valoraciones'] = db.valoraciones.estimated_document_count()
+    return db, info
+
+def add_arguments(parser):
+    """
+    Opciones comunes de los benchmarks para elegir los datos y el backend.
+    """
+    parser.add_argument('--scale', choices=sorted(SCALES), default='full')
+    parser.add_argument('--backend', choices=['mongod', 'mongomock'], default='mongod')
+    parser.add_argument('--mongo-uri', help="MongoDB local (por defecto BENCH_MONGO_URI o localhost:27017).")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help="Reutiliza los datos ya cargados (solo mongod).")
+    parser.add_argument('--no-indexes', action='store_true', help="Sin los índices de db/migrations.py (para comparar).")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Carga un catálogo sintético para los benchmarks.")
+    add_arguments(parser)
+    args = parser.parse_args()
+    _, info = prepare(args.scale, args.backend, args.mongo_uri, args.seed, args.reuse, not args.no_indexes)
+    print(info)
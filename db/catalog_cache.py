@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+from db.serializers import BUSINESS_SUMMARY_PROJECTION, serialize_business
+
+# Cantidad de negocios que se guardan por lista (global y por categoría)
+CATALOG_TOP_N = 20
+
+
+class CatalogCache:
+    """
+    Listas materializadas de los negocios mejor valorados, global y por categoría.
+
+    Se recargan desde MongoDB cada refresh_interval segundos o cuando una valoración cambia
+    un ranking (invalidate). La recarga la hace una sola petición a la vez; mientras tanto
+    las demás siguen leyendo la versión anterior, que nunca se modifica.
+    """
+
+    def __init__(self, db, top_n=CATALOG_TOP_N, refresh_interval=60, min_refresh_interval=1.0):
+        self.db = db
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.refreshes = 0
+
+        self._lists = {}  # None -> top global, 'categoria' -> top de la categoría
+        self._etag = None
+        self._loaded_at = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    @property
+    def etag(self):
+        self._refresh_if_needed()
+        return self._etag
+
+    def top(self, n=5, categoria=None):
+        """
+        Devuelve los n negocios con mejor promedio_ranking (de una categoría si se indica).
+        """
+        self._refresh_if_needed()
+        if n > self.top_n:
+            # Listas más largas que las materializadas se piden directamente a la base de datos
+            query = {'categoria': categoria} if categoria else {}
+            return list(self.db.negocios.find(query, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(n))
+        return self._lists.get(categoria, [])[:n]
+
+    def invalidate(self):
+        """
+        Marca las listas como desactualizadas (por ejemplo, tras una nueva valoración).
+        """
+        self._dirty = True
+
+    def refresh(self):
+        """
+        Recarga todas las listas y las publica reemplazando una sola referencia.
+        """
+        lists = {None: list(self.db.negocios.find({}, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(self.top_n))}
+        for categoria in self.db.negocios.distinct('categoria'):
+            lists[categoria] = list(
+                self.db.negocios.find({'categoria': categoria}, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(self.top_n)
+            )
+        self._publish(lists)
+
+    def _is_stale(self):
+        age = time.time() - self._loaded_at
+        return age >= self.refresh_interval or (self._dirty and age >= self.min_refresh_interval)
+
+    def _publish(self, lists):
+        # El ETag sale de las tarjetas tal como se envían (nombre, imagen, srcset, coordenadas...),
+        # así que cualquier cambio visible en una lista lo cambia
+        payload = {
+            categoria or '': [serialize_business(negocio) for negocio in negocios]
+            for categoria, negocios in lists.items()
+        }
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode())
+
+        self._lists = lists
+        self._etag = digest.hexdigest()
+        self._loaded_at = time.time()
+        self._dirty = False
+        self.refreshes += 1
+
+    def _refresh_if_needed(self):
+        if not self._is_stale():
+            return
+        # Si otra petición ya está recargando, se sirve la versión actual (salvo en la primera carga)
+        if self._lock.acquire(blocking=not self._lists):
+            try:
+                if self._is_stale():
+                    self.refresh()
+            finally:
+                self._lock.release()
+
+
+class AsyncCatalogCache(CatalogCache):
+    """
+    CatalogCache para la aplicación asíncrona: las mismas listas, leídas con el driver
+    asíncrono. top(), current_etag() y refresh() son corrutinas.
+    """
+
+    def __init__(self, db, top_n=CATALOG_TOP_N, refresh_interval=60, min_refresh_interval=1.0):
+        super().__init__(db, top_n, refresh_interval, min_refresh_interval)
+        self._lock = asyncio.Lock()
+
+    async def current_etag(self):
+        await self._refresh_if_needed()
+        return self._etag
+
+    async def top(self, n=5, categoria=None):
+        await self._refresh_if_needed()
+        if n > self.top_n:
+            query = {'categoria': categoria} if categoria else {}
+            return await self.db.negocios.find(query, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(n).to_list(n)
+        return self._lists.get(categoria, [])[:n]
+
+    async def refresh(self):
+        lists = {None: await self.db.negocios.find({}, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(self.top_n).to_list(self.top_n)}
+        for categoria in await self.db.negocios.distinct('categoria'):
+            lists[categoria] = await (
+                self.db.negocios.find({'categoria': categoria}, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(self.top_n)
+                .to_list(self.top_n)
+            )
+        self._publish(lists)
+
+    async def _refresh_if_needed(self):
+        if not self._is_stale():
+            return
+        # Igual que en la versión síncrona: una sola recarga a la vez, sin esperar si ya hay listas
+        if self._lock.locked() and self._lists:
+            return
+        async with self._lock:
+            if self._is_stale():
+                await self.refresh()
@@ -0,0 +1,142 @@
+import os
+import threading
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from metrics import mongo_command_listener
+
+load_dotenv()
+
+# --- Configuración del pool de conexiones (variables de entorno) ---
+# Conexiones máximas y mínimas por proceso; con gunicorn cada worker tiene su propio pool
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))
+
+# Tiempos de espera en milisegundos: elegir servidor, abrir la conexión, esperar una conexión
+# libre del pool y (opcional, 0 = sin límite) esperar la respuesta de una operación
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0))
+
+# primary, primaryPreferred, secondary, secondaryPreferred o nearest
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_client = None
+
+
+def client_options():
+    """
+    Opciones del MongoClient compartido según las variables de entorno.
+    """
+    options = {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'readPreference': MONGO_READ_PREFERENCE,
+        'appname': os.getenv('MONGO_APP_NAME', 'turismo-el-carmen')
+    }
+    if MONGO_SOCKET_TIMEOUT_MS > 0:
+        options['socketTimeoutMS'] = MONGO_SOCKET_TIMEOUT_MS
+    if mongo_command_listener is not None:
+        # Latencia y documentos por comando y colección en /metrics
+        options['event_listeners'] = [mongo_command_listener]
+    return options
+
+def get_client():
+    """
+    Devuelve el MongoClient del proceso, creándolo en el primer uso.
+
+    Si el proceso es un hijo creado con fork (por ejemplo un worker de gunicorn con --preload),
+    no reutiliza el cliente del padre: crea uno nuevo con su propio pool.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                mongo_uri = os.getenv('MONGO_URI')
+                if not mongo_uri:
+                    raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
+                _client = MongoClient(mongo_uri, connect=False, **client_options())
+                _client_pid = pid
+    return _client
+
+def set_client(client):
+    """
+    Usa un cliente ya creado como el del proceso actual (por ejemplo mongomock en los benchmarks).
+    """
+    global _client, _client_pid
+    with _client_lock:
+        _client, _client_pid = client, os.getpid()
+
+def get_db():
+    """
+    Base de datos de la aplicación (el nombre se lee de MONGO_DB_NAME).
+    """
+    return get_client()[os.getenv('MONGO_DB_NAME')]
+
+def get_async_client():
+    """
+    AsyncMongoClient del proceso para la aplicación asíncrona (async_app.py), con las mismas
+    opciones de pool. Se crea en el primer uso, dentro del bucle de eventos que lo va a usar.
+    """
+    global _async_client
+    if _async_client is None:
+        from pymongo import AsyncMongoClient
+        mongo_uri = os.getenv('MONGO_URI')
+        if not mongo_uri:
+            raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
+        _async_client = AsyncMongoClient(mongo_uri, **client_options())
+    return _async_client
+
+def get_async_db():
+    """
+    Base de datos de la aplicación para el driver asíncrono.
+    """
+    return get_async_client()[os.getenv('MONGO_DB_NAME')]
+
+def close_client():
+    """
+    Cierra el cliente del proceso actual; el próximo get_client() abre uno nuevo.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client, _client_pid = None, None
+
+def _forget_client_after_fork():
+    # En el hijo el cliente heredado no se cierra (sus sockets son del padre), solo se descarta
+    global _client, _client_pid, _client_lock, _async_client
+    _client, _client_pid, _async_client = None, None, None
+    _client_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
+
+
+class LazyDatabase:
+    """
+    Referencia a la base de datos que resuelve el cliente en cada acceso.
+
+    Se puede crear al importar un módulo sin conectarse a MongoDB, y después de un fork
+    apunta automáticamente al cliente del proceso hijo.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+# Base de datos compartida por la aplicación, el recomendador y los scripts de db/
+db = LazyDatabase()
@@ -0,0 +1,496 @@
+"""
+Carga masiva de negocios, usuarios y valoraciones desde CSV o JSONL, sin borrar colecciones.
+
+    python -m db.loader negocios catalogo.csv
+    python -m db.loader valoraciones historico.jsonl.gz --batch-size 5000 --workers 8
+    python -m db.loader usuarios usuarios.csv --dry-run
+
+El archivo se lee fila por fila (generadores): cada fila se valida y se convierte en un upsert
+por su clave natural (_id en negocios, email en usuarios, usuario y negocio en
+valoraciones), y los upserts se envían en lotes con bulk_write(ordered=False) desde varios
+hilos. Cargar el mismo archivo dos veces deja la base igual, así que se puede importar sobre
+la base en producción.
+
+Después de cada lote se guarda un checkpoint con las filas ya escritas (solo avanza cuando
+todos los lotes anteriores terminaron sin errores de escritura). Si la carga se interrumpe o
+algún lote falla, al repetir el comando continúa desde ahí; --restart la empieza de cero. Las
+filas inválidas no detienen la carga: se cuentan, se muestran las primeras y se pueden
+guardar con --rejects.
+
+Una valoración del archivo lleva la fecha de su columna 'actualizado_en' o 'fecha' y nunca
+reemplaza a una más nueva del mismo par (como en db/rating_queue.py); sin fecha solo se inserta
+si el par no tiene una valoración fechada. Al terminar una carga de valoraciones se recalculan
+los agregados de los negocios afectados.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from itertools import islice
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from db.connection import get_db
+from db.ratings import PUNTUACIONES, reconcile_rating_aggregates
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directorio de los checkpoints de las cargas en curso
+CHECKPOINT_DIR = os.path.abspath(os.getenv('LOADER_CHECKPOINT_DIR', os.path.join(BASE_DIR, 'data', 'loader')))
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 4
+MAX_RETRIES = 5
+
+# Código de error de MongoDB para una clave duplicada en un índice único
+DUPLICATE_KEY = 11000
+
+# Colecciones cuyos upserts llevan una condición de fecha: una clave duplicada significa que
+# ya hay un documento más nuevo, así que la fila se descarta en lugar de contarse como error
+GUARDED_COLLECTIONS = {'valoraciones'}
+
+
+class InvalidRow(ValueError):
+    """
+    Una fila del archivo no se puede cargar (falta un campo o tiene un valor no válido).
+    """
+
+
+# --- Lectura ---
+
+def _open_text(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise ValueError(f"No se reconoce el formato de '{path}'; indícalo con --format csv o jsonl.")
+
+def read_rows(path, file_format=None):
+    """
+    Genera (número de línea, fila) del archivo; las líneas JSON mal formadas se generan como
+    InvalidRow para que se cuenten como filas inválidas.
+    """
+    file_format = file_format or detect_format(path)
+    with _open_text(path) as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Las celdas vacías se tratan como campos ausentes
+                yield reader.line_num, {key: value for key, value in row.items() if key and value not in (None, '')}
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, InvalidRow(f"JSON no válido: {e}")
+                continue
+            yield line_number, row if isinstance(row, dict) else InvalidRow("La línea no es un objeto JSON.")
+
+
+# --- Validación: cada fila se convierte en (clave del upsert, documento de actualización) ---
+
+def _required(row, field):
+    value = row.get(field)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise InvalidRow(f"Falta el campo '{field}'.")
+    return value.strip() if isinstance(value, str) else value
+
+def _object_id(row, field):
+    value = _required(row, field)
+    if isinstance(value, dict) and '$oid' in value:
+        value = value['$oid']  # ObjectId exportado con mongoexport
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise InvalidRow(f"'{field}' no es un ObjectId válido: {value!r}.")
+
+def _number(value, field, low, high, cast=float):
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"'{field}' no es un número: {value!r}.")
+    if cast is int and number != float(value):
+        raise InvalidRow(f"'{field}' debe ser un entero: {value!r}.")
+    if not low <= number <= high:
+        raise InvalidRow(f"'{field}' debe estar entre {low} y {high}: {value!r}.")
+    return number
+
+def _datetime(value, field):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, dict) and '$date' in value:
+        value = value['$date']
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidRow(f"'{field}' no es una fecha ISO 8601: {value!r}.")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _json_field(row, field):
+    # En CSV los campos anidados vienen como texto JSON
+    value = row.get(field)
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise InvalidRow(f"'{field}' no es JSON válido.")
+    return value
+
+def validate_negocio(row):
+    fields = {'nombre': _required(row, 'nombre'), 'categoria': _required(row, 'categoria')}
+    for field in ('descripcion', 'imagen_url', 'telefono', 'email'):
+        if row.get(field) is not None:
+            fields[field] = str(row[field]).strip()
+
+    coordenadas = _json_field(row, 'coordenadas') or {}
+    lat, lon = row.get('lat', coordenadas.get('lat')), row.get('lon', coordenadas.get('lon'))
+    if (lat is None) != (lon is None):
+        raise InvalidRow("Las coordenadas necesitan 'lat' y 'lon'.")
+    if lat is not None:
+        fields['coordenadas'] = {'lat': _number(lat, 'lat', -90, 90), 'lon': _number(lon, 'lon', -180, 180)}
+
+    horario = _json_field(row, 'horario_atencion')
+    if horario is not None:
+        if not isinstance(horario, dict):
+            raise InvalidRow("'horario_atencion' debe ser un objeto {día: horario}.")
+        fields['horario_atencion'] = horario
+
+    # El promedio lo mantienen las valoraciones; el del archivo solo se usa para negocios nuevos
+    promedio = _number(row['promedio_ranking'], 'promedio_ranking', 0, 5) if row.get('promedio_ranking') is not None else 0.0
+    # El nombre no identifica un negocio (sucursales, el mismo nombre en otra categoría)
+    key = {'_id': _object_id(row, '_id')}
+    return key, {'$set': fields, '$setOnInsert': {'promedio_ranking': promedio}}
+
+def validate_usuario(row):
+    email = _required(row, 'email')
+    if '@' not in email:
+        raise InvalidRow(f"'email' no es un correo válido: {email!r}.")
+    fields = {'nombre': _required(row, 'nombre'), 'password_hash': _required(row, 'password_hash')}
+    on_insert = {'fecha_registro': _datetime(row['fecha_registro'], 'fecha_registro') if row.get('fecha_registro') else datetime.now(timezone.utc)}
+    if row.get('_id') is not None:
+        on_insert['_id'] = _object_id(row, '_id')
+    return {'email': email}, {'$set': fields, '$setOnInsert': on_insert}
+
+def validate_valoracion(row):
+    fields = {
+        'puntuacion': _number(_required(row, 'puntuacion'), 'puntuacion', min(PUNTUACIONES), max(PUNTUACIONES), cast=int)
+    }
+    if row.get('comentario') is not None:
+        fields['comentario'] = str(row['comentario'])
+    if row.get('fecha') is not None:
+        fields['fecha'] = _datetime(row['fecha'], 'fecha')
+    key = {'usuario_id': _object_id(row, 'usuario_id'), 'negocio_id': _object_id(row, 'negocio_id')}
+
+    # 'actualizado_en' es la fecha de la valoración (no la de la carga) y decide cuál gana, con
+    # la misma condición que la cola de valoraciones; si el upsert no coincide, el índice único
+    # lo rechaza con una clave duplicada
+    if row.get('actualizado_en') is not None:
+        fields['actualizado_en'] = _datetime(row['actualizado_en'], 'actualizado_en')
+    elif 'fecha' in fields:
+        fields['actualizado_en'] = fields['fecha']
+    if 'actualizado_en' in fields:
+        key['actualizado_en'] = {'$not': {'$gte': fields['actualizado_en']}}
+    else:
+        key['actualizado_en'] = {'$exists': False}
+    # 'escrito_en' es la hora de MongoDB al guardarla: el índice de vecinos incluye el cambio
+    return key, {'$set': fields, '$currentDate': {'escrito_en': True}}
+
+# Colecciones que se pueden cargar y la función que valida sus filas
+VALIDATORS = {
+    'negocios': validate_negocio,
+    'usuarios': validate_usuario,
+    'valoraciones': validate_valoracion,
+}
+
+
+# --- Checkpoints ---
+
+def checkpoint_path(collection, source, directory=CHECKPOINT_DIR):
+    return os.path.join(directory, f"{collection}-{os.path.basename(source)}.checkpoint.json")
+
+def _source_signature(source):
+    # Un checkpoint solo vale para el mismo archivo sin modificar
+    if source == '-':
+        return None
+    stat = os.stat(source)
+    return {'path': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def read_checkpoint(path, source):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return checkpoint if checkpoint.get('source') == _source_signature(source) else None
+
+def write_checkpoint(path, checkpoint):
+    # Se escribe en un temporal y se reemplaza, para no dejar un checkpoint a medias
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+# --- Carga ---
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class BulkLoader:
+    """
+    Escribe las filas de un archivo en una colección con upserts en lotes paralelos.
+
+    Los lotes se numeran en el orden del archivo; el checkpoint guarda las filas del mayor
+    prefijo de lotes ya escritos, así que al reanudar ninguna fila queda sin escribir (como
+    mucho se repiten algunas, lo que no cambia el resultado).
+    """
+
+    def __init__(self, db, collection, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                 checkpoint=None, rejects=None, dry_run=False, progress_interval=5.0, max_errors_shown=10):
+        if collection not in VALIDATORS:
+            raise ValueError(f"Colección no soportada: {collection}. Opciones: {', '.join(VALIDATORS)}.")
+        self.db = db
+        self.collection = collection
+        self.validate = VALIDATORS[collection]
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint = checkpoint  # (ruta, firma del archivo) o None
+        self.rejects = rejects
+        self.dry_run = dry_run
+        self.progress_interval = progress_interval
+        self.max_errors_shown = max_errors_shown
+
+        self.stats = {
+            'read': 0, 'skipped': 0, 'invalid': 0, 'written': 0, 'upserted': 0, 'modified': 0, 'stale': 0, 'failed': 0
+        }
+        self.negocio_ids = set()
+        self._lock = threading.Lock()
+        self._done_batches = {}  # número de lote -> filas del archivo que cubre
+        self._next_batch = 0
+        self._committed_rows = 0
+        self._last_progress = 0.0
+        self._start = None
+
+    def run(self, rows, resume_rows=0):
+        """
+        Carga las filas (número de línea, fila) saltándose las primeras resume_rows.
+        Devuelve las estadísticas de la carga.
+        """
+        self._start = time.perf_counter()
+        self._committed_rows = resume_rows
+        self.stats['skipped'] = resume_rows
+        operations = self._operations(islice(rows, resume_rows, None))
+
+        # Como mucho 2 lotes por hilo en memoria: el archivo se lee al ritmo de las escrituras
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='loader') as executor:
+            in_flight = set()
+            for number, (batch, rows_covered) in enumerate(self._batches(operations)):
+                if len(in_flight) >= self.workers * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                in_flight.add(executor.submit(self._write_batch, number, batch, rows_covered))
+            for future in in_flight:
+                future.result()
+
+        self._report(final=True)
+        return self.stats
+
+    def _operations(self, rows):
+        # Genera (operación o None, línea) por cada fila leída; None si la fila es inválida
+        for line_number, row in rows:
+            self.stats['read'] += 1
+            try:
+                if isinstance(row, InvalidRow):
+                    raise row
+                key, update = self.validate(row)
+            except InvalidRow as e:
+                self._reject(line_number, row, e)
+                yield None
+                continue
+            if self.collection == 'valoraciones':
+                self.negocio_ids.add(key['negocio_id'])
+            yield key, update
+
+    def _batches(self, operations):
+        # Lotes de hasta batch_size operaciones válidas, con las filas del archivo que abarcan
+        batch, rows_covered = {}, 0
+        for operation in operations:
+            rows_covered += 1
+            if operation is not None:
+                key, update = operation
+                # Si la misma clave aparece dos veces en el lote gana la última fila (en valoraciones
+                # la clave incluye la fecha: dos fechas distintas se envían y gana la más nueva)
+                batch[json.dumps(key, sort_keys=True, default=str)] = UpdateOne(key, update, upsert=True)
+            if len(batch) >= self.batch_size:
+                yield list(batch.values()), rows_covered
+                batch, rows_covered = {}, 0
+        if rows_covered:
+            yield list(batch.values()), rows_covered
+
+    def _write_batch(self, number, operations, rows_covered):
+        result = None
+        if operations and not self.dry_run:
+            result = self._bulk_write_with_retries(operations)
+        with self._lock:
+            if result is not None:
+                self.stats['upserted'] += result['upserted']
+                self.stats['modified'] += result['modified']
+                self.stats['stale'] += result['stale']
+                self.stats['failed'] += result['failed']
+            self.stats['written'] += len(operations) - (result['failed'] + result['stale'] if result else 0)
+            if result is None or not result['failed']:
+                self._done_batches[number] = rows_covered
+            # El checkpoint avanza solo por el prefijo de lotes terminados sin errores: un lote
+            # con filas fallidas lo detiene y al reanudar se repite desde ahí (los upserts son idempotentes)
+            advanced = False
+            while self._next_batch in self._done_batches:
+                self._committed_rows += self._done_batches.pop(self._next_batch)
+                self._next_batch += 1
+                advanced = True
+            if advanced and self.checkpoint is not None and not self.dry_run:
+                path, source = self.checkpoint
+                write_checkpoint(path, {'source': source, 'collection': self.collection, 'rows': self._committed_rows})
+        self._report()
+
+    def _bulk_write_with_retries(self, operations):
+        collection = self.db[self.collection]
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                return {'upserted': result.upserted_count, 'modified': result.modified_count, 'stale': 0, 'failed': 0}
+            except BulkWriteError as e:
+                # Con ordered=False el resto del lote sí se escribió; los errores por documento
+                # (por ejemplo un email duplicado con otro _id) no se arreglan reintentando
+                details = e.details
+                errors = details.get('writeErrors', [])
+                if self.collection in GUARDED_COLLECTIONS:
+                    stale = [error for error in errors if error.get('code') == DUPLICATE_KEY]
+                    errors = [error for error in errors if error.get('code') != DUPLICATE_KEY]
+                else:
+                    stale = []
+                for error in errors[:self.max_errors_shown]:
+                    print(f"Error al escribir en '{self.collection}': {error.get('errmsg')}")
+                return {
+                    'upserted': details.get('nUpserted', 0),
+                    'modified': details.get('nModified', 0),
+                    'stale': len(stale),
+                    'failed': len(errors)
+                }
+            except PyMongoError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = min(2 ** attempt, 30)
+                print(f"Error al escribir un lote de {len(operations)} filas ({e}); reintento en {delay} s.")
+                time.sleep(delay)
+
+    def _reject(self, line_number, row, error):
+        self.stats['invalid'] += 1
+        if self.stats['invalid'] <= self.max_errors_shown:
+            print(f"Línea {line_number}: {error}")
+        if self.rejects is not None:
+            record = {'line': line_number, 'error': str(error), 'row': None if isinstance(row, InvalidRow) else row}
+            self.rejects.write(json.dumps(record, default=str, ensure_ascii=False) + '\n')
+
+    def _report(self, final=False):
+        now = time.perf_counter()
+        if not final and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        elapsed = now - self._start
+        stats = self.stats
+        rate = stats['read'] / elapsed if elapsed else 0.0
+        prefix = "Carga terminada" if final else "Progreso"
+        print(
+            f"{prefix}: {stats['read']} filas leídas ({rate:,.0f}/s), {stats['written']} escritas "
+            f"({stats['upserted']} nuevas, {stats['modified']} modificadas), {stats['invalid']} inválidas, "
+            f"{stats['stale']} descartadas por ser más antiguas, "
+            f"{stats['failed']} con error, {self._committed_rows} confirmadas en el checkpoint."
+        )
+
+def load_rows(db, collection, rows, **options):
+    """
+    Carga filas (dicts) ya en memoria, por ejemplo los datos de db/seed_db.py. No recalcula
+    los agregados de valoraciones: eso queda a cargo de quien llama.
+    """
+    return BulkLoader(db, collection, progress_interval=float('inf'), **options).run(enumerate(rows, 1))
+
+def load_file(db, collection, source, file_format=None, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+              restart=False, rejects_path=None, dry_run=False, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Carga un archivo CSV o JSONL en la colección, reanudando desde su checkpoint si existe.
+    """
+    checkpoint, resume_rows = None, 0
+    if source != '-':
+        path = checkpoint_path(collection, source, checkpoint_dir)
+        if not restart:
+            previous = read_checkpoint(path, source)
+            if previous is not None:
+                resume_rows = previous['rows']
+                print(f"Reanudando la carga desde la fila {resume_rows} (checkpoint {path}).")
+        checkpoint = (path, _source_signature(source))
+
+    rejects = open(rejects_path, 'w', encoding='utf-8') if rejects_path else None
+    try:
+        loader = BulkLoader(db, collection, batch_size=batch_size, workers=workers,
+                            checkpoint=checkpoint, rejects=rejects, dry_run=dry_run)
+        stats = loader.run(read_rows(source, file_format), resume_rows=resume_rows)
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    if collection == 'valoraciones' and not dry_run:
+        # Al reanudar no se conocen los negocios de las filas ya cargadas: se reconcilia todo
+        print("Recalculando los agregados de valoraciones de los negocios...")
+        reconcile_rating_aggregates(db, None if resume_rows else loader.negocio_ids)
+    # Con filas fallidas se conserva el checkpoint para reintentar desde el primer lote con error
+    if checkpoint is not None and not dry_run and not stats['failed'] and os.path.exists(checkpoint[0]):
+        os.remove(checkpoint[0])
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Carga masiva de negocios, usuarios o valoraciones con upserts.")
+    parser.add_argument('collection', choices=sorted(VALIDATORS), help="Colección de destino.")
+    parser.add_argument('source', help="Archivo CSV o JSONL (opcionalmente .gz); '-' lee JSONL de la entrada estándar.")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Formato del archivo (por defecto, según la extensión).")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Operaciones por bulk_write.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Lotes escritos en paralelo.")
+    parser.add_argument('--restart', action='store_true', help="Ignora el checkpoint y empieza desde la primera fila.")
+    parser.add_argument('--rejects', help="Archivo JSONL donde guardar las filas inválidas.")
+    parser.add_argument('--dry-run', action='store_true', help="Solo lee y valida, sin escribir en MongoDB.")
+    args = parser.parse_args()
+
+    file_format = args.format or ('jsonl' if args.source == '-' else None)
+    stats = load_file(
+        get_db(), args.collection, args.source, file_format=file_format, batch_size=args.batch_size,
+        workers=args.workers, restart=args.restart, rejects_path=args.rejects, dry_run=args.dry_run
+    )
+    if stats['failed']:
+        sys.exit(1)
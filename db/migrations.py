@@ -0,0 +1,219 @@
+"""
+Índices y migraciones de esquema de 'negocios', 'valoraciones' y 'usuarios'.
+
+    python -m db.migrations            # aplica migraciones e índices y verifica las consultas
+    python -m db.migrations --check    # solo verifica (por ejemplo antes de un despliegue)
+
+Las migraciones de datos se aplican una sola vez, en orden; la última versión aplicada se
+guarda en la colección 'migraciones'. Los índices se crean en cada ejecución: create_indexes
+no hace nada si ya existen con la misma definición.
+
+La verificación ejecuta explain() sobre las consultas frecuentes de la aplicación y falla si
+alguna recorre la colección completa (COLLSCAN). app.py y async_app.py la ejecutan al arrancar
+según MONGO_INDEX_CHECK: 'fail' (por defecto) no arranca, 'warn' solo avisa y 'off' la omite.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from db.connection import get_db
+from db.ratings import reconcile_rating_aggregates
+
+# Índices que necesita la aplicación, por colección
+INDEXES = {
+    'valoraciones': [
+        # Upsert de /api/valorar y de la cola de valoraciones; su prefijo sirve a las
+        # valoraciones de un usuario (recomendaciones)
+        IndexModel([('usuario_id', ASCENDING), ('negocio_id', ASCENDING)], name='usuario_negocio', unique=True),
+        # Agregados de un negocio y usuarios que lo valoraron (actualización incremental)
+        IndexModel([('negocio_id', ASCENDING)], name='negocio'),
+        # Valoraciones guardadas desde la marca de agua del índice de vecinos
+        IndexModel([('escrito_en', ASCENDING)], name='escrito_en'),
+    ],
+    'negocios': [
+        # Listado paginado (KEYSET_SORT) y negocios mejor valorados
+        IndexModel([('promedio_ranking', DESCENDING), ('_id', DESCENDING)], name='ranking'),
+        # Mejor valorados de una categoría
+        IndexModel([('categoria', ASCENDING), ('promedio_ranking', DESCENDING)], name='categoria_ranking'),
+    ],
+    'usuarios': [
+        # Inicio de sesión y registro
+        IndexModel([('email', ASCENDING)], name='email', unique=True),
+    ],
+}
+
+# Consultas frecuentes que no pueden recorrer la colección completa:
+# (nombre, colección, filtro, orden)
+HOT_QUERIES = [
+    ('valorar', 'valoraciones', {'usuario_id': ObjectId(), 'negocio_id': ObjectId()}, None),
+    ('valoraciones_usuario', 'valoraciones', {'usuario_id': ObjectId()}, None),
+    ('valoraciones_negocio', 'valoraciones', {'negocio_id': {'$in': [ObjectId()]}}, None),
+    ('valoraciones_recientes', 'valoraciones', {'escrito_en': {'$gte': datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ('login', 'usuarios', {'email': 'usuario@example.com'}, None),
+    ('listado', 'negocios', {}, [('promedio_ranking', DESCENDING), ('_id', DESCENDING)]),
+    ('populares', 'negocios', {}, [('promedio_ranking', DESCENDING)]),
+    ('populares_categoria', 'negocios', {'categoria': 'Restaurantes'}, [('promedio_ranking', DESCENDING)]),
+]
+
+
+class MissingIndexError(RuntimeError):
+    """
+    Una consulta frecuente recorre la colección completa porque le falta su índice.
+    """
+
+
+def _remove_duplicate_ratings(db):
+    """
+    Deja una sola valoración por (usuario, negocio), la más reciente, para poder crear el
+    índice único. Los duplicados venían de upserts simultáneos antes de existir el índice.
+    """
+    duplicates = db.valoraciones.aggregate([
+        {'$sort': {'actualizado_en': -1, '_id': -1}},
+        {'$group': {
+            '_id': {'usuario_id': '$usuario_id', 'negocio_id': '$negocio_id'},
+            'ids': {'$push': '$_id'},
+            'total': {'$sum': 1}
+        }},
+        {'$match': {'total': {'$gt': 1}}}
+    ], allowDiskUse=True)
+
+    removed, negocio_ids = 0, set()
+    for group in duplicates:
+        removed += db.valoraciones.delete_many({'_id': {'$in': group['ids'][1:]}}).deleted_count
+        negocio_ids.add(group['_id']['negocio_id'])
+    if negocio_ids:
+        reconcile_rating_aggregates(db, negocio_ids)
+    print(f"Eliminadas {removed} valoraciones duplicadas.")
+
+def _backfill_rating_write_time(db):
+    """
+    Copia 'actualizado_en' en 'escrito_en' en las valoraciones guardadas antes de existir el
+    campo, para que la marca de agua del índice de vecinos las compare con la misma fecha.
+    """
+    result = db.valoraciones.update_many(
+        {'escrito_en': {'$exists': False}},
+        [{'$set': {'escrito_en': {'$ifNull': ['$actualizado_en', '$$NOW']}}}]
+    )
+    # El índice anterior sobre 'actualizado_en' ya no lo usa ninguna consulta
+    if 'actualizado_en' in db.valoraciones.index_information():
+        db.valoraciones.drop_index('actualizado_en')
+    print(f"{result.modified_count} valoraciones con fecha de escritura.")
+
+# Migraciones de datos en orden: (versión, descripción, función)
+MIGRATIONS = [
+    (1, "Eliminar valoraciones duplicadas por usuario y negocio", _remove_duplicate_ratings),
+    (2, "Agregar la fecha de escritura a las valoraciones", _backfill_rating_write_time),
+]
+
+
+def get_schema_version(db):
+    document = db.migraciones.find_one({'_id': 'esquema'})
+    return document['version'] if document else 0
+
+def apply_migrations(db):
+    """
+    Aplica las migraciones pendientes y devuelve la versión final del esquema.
+    """
+    version = get_schema_version(db)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        print(f"Migración {migration_version}: {description}...")
+        migrate(db)
+        db.migraciones.update_one(
+            {'_id': 'esquema'},
+            {'$set': {'version': migration_version, 'aplicada_en': datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        version = migration_version
+    return version
+
+def ensure_indexes(db):
+    """
+    Crea los índices declarados en INDEXES (si ya existen no hace nada).
+    """
+    for collection, indexes in INDEXES.items():
+        names = db[collection].create_indexes(indexes)
+        print(f"Índices de '{collection}': {', '.join(names)}.")
+
+def _plan_stages(plan):
+    # Etapas del plan ganador (recorre inputStage/inputStages; con el motor SBE el plan está en 'queryPlan')
+    plan = plan.get('queryPlan', plan)
+    stages = [plan.get('stage')]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+def _index_name(plan):
+    plan = plan.get('queryPlan', plan)
+    if plan.get('indexName'):
+        return plan['indexName']
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child and _index_name(child):
+            return _index_name(child)
+    return None
+
+def explain_hot_queries(db):
+    """
+    Devuelve {nombre: (etapas del plan, índice usado)} de las consultas en HOT_QUERIES.
+    """
+    plans = {}
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        plans[name] = (_plan_stages(winning_plan), _index_name(winning_plan))
+    return plans
+
+def verify_indexes(db):
+    """
+    Lanza MissingIndexError si alguna consulta frecuente se resolvería con un COLLSCAN.
+    """
+    plans = explain_hot_queries(db)
+    missing = [name for name, (stages, _) in plans.items() if 'COLLSCAN' in stages]
+    if missing:
+        raise MissingIndexError(
+            f"Consultas sin índice (COLLSCAN): {', '.join(missing)}. Ejecuta 'python -m db.migrations'."
+        )
+    return plans
+
+def verify_indexes_at_startup(mode=None):
+    """
+    Verificación al arrancar la aplicación según MONGO_INDEX_CHECK (fail, warn u off).
+    """
+    mode = mode or os.getenv('MONGO_INDEX_CHECK', 'fail')
+    if mode == 'off':
+        return
+    try:
+        verify_indexes(get_db())
+    except MissingIndexError as e:
+        if mode == 'fail':
+            raise
+        print(f"Aviso: {e}")
+    except PyMongoError as e:
+        # Sin conexión no se puede verificar; la aplicación arranca y reintenta conectar en cada petición
+        print(f"Aviso: no se pudieron verificar los índices: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aplica las migraciones y los índices de MongoDB.")
+    parser.add_argument('--check', action='store_true', help="Solo verifica los planes de las consultas.")
+    args = parser.parse_args()
+
+    db = get_db()
+    if not args.check:
+        print(f"Esquema en la versión {apply_migrations(db)}.")
+        ensure_indexes(db)
+    try:
+        for name, (stages, index_name) in verify_indexes(db).items():
+            print(f"{name:<24} {index_name or '-':<20} {' <- '.join(stages)}")
+    except MissingIndexError as e:
+        print(e)
+        sys.exit(1)
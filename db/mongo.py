@@ -1,19 +1,15 @@
-import os
-from dotenv import load_dotenv
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 from datetime import datetime
 
-load_dotenv()
-
-# --- Conexión a MongoDB ---
-mongo_uri = os.getenv('MONGO_URI')
-if not mongo_uri:
-    raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
-    
-client = MongoClient(mongo_uri) 
-db = client[os.getenv('MONGO_DB_NAME')] # El nombre de la base de datos también se lee desde .env
+# --- Conexión a MongoDB (cliente compartido del proceso) ---
+from db.connection import db
 
 # --- Obtiene los datos para el chat Bot ---
 def get_corpus():
-    return list(db.corpus.find())
\ No newline at end of file
+    return list(db.corpus.find())
+
+def iter_corpus(query=None, batch_size=500):
+    """
+    Recorre los intents de 'corpus' con un cursor, sin cargarlos todos en memoria.
+    """
+    return db.corpus.find(query or {}, batch_size=batch_size)
@@ -0,0 +1,77 @@
+import base64
+import json
+import threading
+import time
+from bson.objectid import ObjectId
+
+# Orden estable del listado: mejor ranking primero y, a igual ranking, por _id
+KEYSET_SORT = [('promedio_ranking', -1), ('_id', -1)]
+
+
+def encode_cursor(document):
+    """
+    Genera el token opaco de continuación a partir del último documento de la página.
+    """
+    raw = json.dumps({'r': document.get('promedio_ranking'), 'id': str(document['_id'])}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """
+    Devuelve (promedio_ranking, _id) del token. Lanza ValueError si el token no es válido.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        return data['r'], ObjectId(data['id'])
+    except Exception:
+        raise ValueError("El cursor de paginación no es válido.")
+
+def keyset_filter(token):
+    """
+    Filtro de MongoDB para los documentos que van después del cursor según KEYSET_SORT.
+    Los negocios sin promedio_ranking (null) quedan al final del orden descendente.
+    """
+    ranking, last_id = decode_cursor(token)
+    if ranking is None:
+        return {'promedio_ranking': None, '_id': {'$lt': last_id}}
+    return {'$or': [
+        {'promedio_ranking': {'$lt': ranking}},
+        {'promedio_ranking': ranking, '_id': {'$lt': last_id}},
+        {'promedio_ranking': None}
+    ]}
+
+
+class CachedCount:
+    """
+    Total aproximado de documentos de una colección, refrescado cada ttl_seconds.
+    Usa estimated_document_count(), que lee los metadatos en lugar de recorrer la colección.
+    La colección se resuelve en cada recarga para usar siempre el cliente del proceso actual.
+    """
+
+    def __init__(self, db, collection_name, ttl_seconds=60):
+        self.db = db
+        self.collection_name = collection_name
+        self.ttl_seconds = ttl_seconds
+        self._value = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None or time.time() - self._updated_at >= self.ttl_seconds:
+            with self._lock:
+                if self._value is None or time.time() - self._updated_at >= self.ttl_seconds:
+                    self._value = self.db[self.collection_name].estimated_document_count()
+                    self._updated_at = time.time()
+        return self._value
+
+
+class AsyncCachedCount(CachedCount):
+    """
+    CachedCount para el driver asíncrono: get() es una corrutina.
+    """
+
+    async def get(self):
+        if self._value is None or time.time() - self._updated_at >= self.ttl_seconds:
+            self._value = await self.db[self.collection_name].estimated_document_count()
+            self._updated_at = time.time()
+        return self._value
@@ -0,0 +1,340 @@
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db.ratings import apply_rating_aggregates, reconcile_rating_aggregates
+from metrics import count_error, span
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directorio de los spools locales con las valoraciones aún no guardadas en MongoDB
+SPOOL_DIR = os.path.abspath(os.getenv('RATING_SPOOL_DIR', os.path.join(BASE_DIR, 'data', 'spool')))
+
+class RatingQueueFull(Exception):
+    """
+    La cola de valoraciones alcanzó su límite; el cliente debe reintentar más tarde.
+    """
+
+
+class RatingQueue:
+    """
+    Ingesta de valoraciones con escritura diferida (write-behind).
+
+    submit() guarda el evento en un archivo local (spool) y lo deja pendiente en memoria, sin
+    tocar MongoDB. Un hilo consumidor junta los eventos cada flush_interval segundos, se queda
+    con la última puntuación de cada par (usuario, negocio) y los aplica uno por uno con
+    find_one_and_update; después suma a los agregados de cada negocio afectado la diferencia
+    entre las puntuaciones que reemplazó y las nuevas ('$inc') y avisa a los listeners (modelo,
+    cachés) con el lote aplicado. Una valoración nunca reemplaza a otra más nueva del mismo par (por ejemplo, al reprocesar
+    el spool de un proceso que terminó).
+
+    Cada proceso escribe su propio spool (con su pid en el nombre) y tiene su propio consumidor,
+    que se arranca con start() o con el primer submit() del proceso: un worker creado con fork
+    (gunicorn con --preload) no hereda el hilo ni el spool del padre. Al arrancar se reprocesan
+    los spools que dejaron procesos que ya no existen, así que los eventos sobreviven a un
+    reinicio. Aplicar un evento más de una vez no cambia el resultado (la valoración se
+    reemplaza, no se suma).
+    """
+
+    def __init__(self, db, spool_dir, max_pending=10000, flush_interval=0.5, fsync=False):
+        self.db = db
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self.submitted = 0
+        self.rejected = 0
+        self.applied = 0
+        self.stale = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_batch_ms = None
+        self.last_error = None
+
+        self._pending = {}        # (usuario_id, negocio_id) -> (puntuacion, actualizado_en)
+        self._pending_files = []  # spools cerrados cuyos eventos están en _pending
+        self._unreconciled = set()  # negocios cuyos agregados pueden estar desviados
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self._sequence = 0
+
+        # Proceso dueño del consumidor y del spool; se fijan al arrancar en cada proceso
+        self._pid = None
+        self._spool_path = None
+        self._spool = None
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def add_listener(self, callback):
+        """
+        Registra una función que se llama con la lista de eventos (usuario_id, negocio_id,
+        puntuacion) de cada lote ya guardado en MongoDB.
+        """
+        self._listeners.append(callback)
+
+    def start(self):
+        """
+        Recupera los spools pendientes de procesos anteriores y arranca el consumidor de este
+        proceso (si no estaba arrancado).
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.spool_dir, exist_ok=True)
+            pid = os.getpid()
+            self._spool_path = os.path.join(self.spool_dir, f'ratings-{pid}.jsonl')
+            self._recover_orphan_spools(pid)
+            self._spool = open(self._spool_path, 'a', encoding='utf-8')
+            self._thread = threading.Thread(target=self._run, name='rating-queue', daemon=True)
+            self._thread.start()
+            self._pid = pid
+            if self._pending:
+                self._idle.clear()
+                self._wakeup.set()
+
+    def submit(self, usuario_id, negocio_id, puntuacion):
+        """
+        Encola una valoración ya validada. Lanza RatingQueueFull si hay demasiadas pendientes.
+        """
+        self.start()
+        key = (usuario_id, negocio_id)
+        actualizado_en = datetime.now(timezone.utc)
+        line = json.dumps({
+            'u': str(usuario_id), 'n': str(negocio_id), 'p': puntuacion, 't': actualizado_en.isoformat()
+        })
+        with self._lock:
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                raise RatingQueueFull("Hay demasiadas valoraciones pendientes; inténtalo de nuevo en unos segundos.")
+            self._spool.write(line + '\n')
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._pending[key] = (puntuacion, actualizado_en)
+            self.submitted += 1
+            self._idle.clear()
+        self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """
+        Espera a que se apliquen todas las valoraciones pendientes. Devuelve False si se agota el tiempo.
+        """
+        self._wakeup.set()
+        return self._idle.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'applied': self.applied,
+            'stale': self.stale,
+            'batches': self.batches,
+            'failures': self.failures,
+            'last_batch_ms': self.last_batch_ms,
+            'last_error': self.last_error
+        }
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Se espera un poco para juntar más eventos en el mismo lote
+            time.sleep(self.flush_interval)
+            with self._lock:
+                self._wakeup.clear()
+                batch, files = self._take_batch()
+            if not batch:
+                self._idle.set()
+                continue
+
+            start = time.perf_counter()
+            try:
+                applied = self._apply(batch)
+            except Exception as e:
+                print(f"Error al guardar un lote de {len(batch)} valoraciones: {e}")
+                count_error('rating_queue')
+                self.failures += 1
+                self.last_error = str(e)
+                with self._lock:
+                    # Se devuelven a la cola, salvo las que ya tienen una puntuación más nueva
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._pending_files = files + self._pending_files
+                time.sleep(min(self.flush_interval * 10, 5))
+                self._wakeup.set()
+                continue
+
+            for path in files:
+                os.remove(path)
+            self.applied += len(applied)
+            self.stale += len(batch) - len(applied)
+            self.batches += 1
+            self.last_batch_ms = round((time.perf_counter() - start) * 1000, 2)
+            self.last_error = None
+
+            events = [(usuario_id, negocio_id, batch[usuario_id, negocio_id][0]) for usuario_id, negocio_id in applied]
+            # Los eventos descartados por tener una valoración más nueva no cambian nada
+            for callback in self._listeners:
+                if not events:
+                    break
+                try:
+                    callback(events)
+                except Exception as e:
+                    print(f"Error al notificar un lote de valoraciones: {e}")
+
+            with self._lock:
+                if not self._pending:
+                    self._idle.set()
+                else:
+                    self._wakeup.set()
+
+    def _take_batch(self):
+        # Se cierra el spool actual junto con los eventos pendientes: si el lote falla o el
+        # proceso se detiene, ese archivo contiene exactamente lo que faltó aplicar
+        if not self._pending:
+            return {}, []
+        self._spool.close()
+        self._sequence += 1
+        closed_path = os.path.join(self.spool_dir, f'ratings-{self._pid}-{self._sequence}.applying')
+        os.replace(self._spool_path, closed_path)
+        self._spool = open(self._spool_path, 'a', encoding='utf-8')
+
+        batch, files = self._pending, self._pending_files + [closed_path]
+        self._pending, self._pending_files = {}, []
+        return batch, files
+
+    @span('apply_rating_batch')
+    def _apply(self, batch):
+        # Cada par se escribe con find_one_and_update, que devuelve la valoración tal como estaba
+        # justo antes de esta escritura: la diferencia de los agregados sale de esa misma
+        # operación, así que dos procesos que apliquen el mismo evento no la cuentan dos veces
+        applied, cambios, error = [], {}, None
+        for (usuario_id, negocio_id), (puntuacion, actualizado_en) in batch.items():
+            try:
+                anterior = self.db.valoraciones.find_one_and_update(
+                    # Solo si la valoración guardada es más antigua (o no tiene fecha)
+                    {'usuario_id': usuario_id, 'negocio_id': negocio_id,
+                     'actualizado_en': {'$not': {'$gte': actualizado_en}}},
+                    # 'actualizado_en' es la hora del evento (decide qué valoración gana) y
+                    # 'escrito_en' la hora de MongoDB al guardarla (marca de agua del índice de vecinos)
+                    {'$set': {'puntuacion': puntuacion, 'actualizado_en': actualizado_en},
+                     '$currentDate': {'escrito_en': True}},
+                    projection={'_id': 0, 'puntuacion': 1},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                # Ya hay una valoración más nueva del par: el filtro no coincidió y el upsert
+                # chocó con el índice único. Se descarta el evento
+                continue
+            except Exception as e:
+                # No se sabe si la escritura llegó a aplicarse: al reintentar no se puede
+                # calcular su diferencia, así que ese negocio se reconcilia después
+                self._unreconciled.add(negocio_id)
+                error = e
+                break
+            applied.append((usuario_id, negocio_id))
+            cambios.setdefault(negocio_id, []).append((anterior['puntuacion'] if anterior else None, puntuacion))
+
+        # Diferencias de los eventos guardados, agrupadas por negocio (aunque el lote falle
+        # después: si se reintenta, esos eventos ya no cambian nada)
+        for negocio_id, cambios_negocio in cambios.items():
+            apply_rating_aggregates(self.db, negocio_id, cambios_negocio)
+        if error is not None:
+            raise error
+        if self._unreconciled:
+            reconcile_rating_aggregates(self.db, self._unreconciled)
+            self._unreconciled = set()
+        return applied
+
+    def _after_fork(self):
+        # El hijo no tiene el hilo consumidor y los locks pudieron quedar tomados. Los eventos
+        # pendientes y el spool abierto son del padre, que los aplica; el hijo arranca vacío
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self._pending, self._pending_files = {}, []
+        self._pid, self._spool_path, self._spool = None, None, None
+        self._sequence = 0
+
+    def _recover_orphan_spools(self, pid):
+        # Spools de procesos que ya terminaron: se renombran (solo un proceso lo consigue) y
+        # sus eventos se cargan como pendientes, en orden, quedándose con el más reciente
+        paths = glob.glob(os.path.join(self.spool_dir, 'ratings-*.jsonl'))
+        paths += glob.glob(os.path.join(self.spool_dir, 'ratings-*.applying'))
+        for path in sorted(paths, key=os.path.getmtime):
+            owner = int(os.path.basename(path).split('-')[1].split('.')[0])
+            # Un spool con el pid propio es de un proceso anterior que tuvo el mismo pid (contenedores)
+            if owner != pid and _process_alive(owner):
+                continue
+            self._sequence += 1
+            claimed_path = os.path.join(self.spool_dir, f'ratings-{pid}-{self._sequence}.applying')
+            try:
+                os.replace(path, claimed_path)
+            except FileNotFoundError:
+                continue  # Otro proceso lo recuperó primero
+            recovered = 0
+            with open(claimed_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        key = (ObjectId(event['u']), ObjectId(event['n']))
+                        actualizado_en = datetime.fromisoformat(event['t'])
+                    except (ValueError, KeyError):
+                        continue  # Línea incompleta (el proceso se detuvo mientras escribía)
+                    current = self._pending.get(key)
+                    if current is None or current[1] <= actualizado_en:
+                        self._pending[key] = (event['p'], actualizado_en)
+                    recovered += 1
+            if not recovered:
+                os.remove(claimed_path)
+                continue
+            self._pending_files.append(claimed_path)
+            print(f"Recuperadas {recovered} valoraciones pendientes de '{os.path.basename(path)}'.")
+
+
+def _process_alive(pid):
+    if os.name == 'nt':
+        # En Windows os.kill(pid, 0) no es una consulta; allí la app corre en un solo proceso
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def create_rating_queue(db):
+    """
+    Crea la cola de valoraciones con la configuración del entorno.
+    """
+    return RatingQueue(
+        db,
+        SPOOL_DIR,
+        max_pending=int(os.getenv('RATING_QUEUE_MAX_PENDING', 10000)),
+        flush_interval=float(os.getenv('RATING_QUEUE_FLUSH_INTERVAL', 0.5)),
+        fsync=os.getenv('RATING_SPOOL_FSYNC', '0') == '1'
+    )
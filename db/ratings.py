@@ -0,0 +1,107 @@
+from pymongo import ReturnDocument, UpdateOne
+from db.connection import get_db
+
+# Agregados de valoraciones guardados en cada documento de 'negocios':
+#   suma_puntuaciones, total_valoraciones y histograma_puntuaciones {'1': n, ..., '5': n}
+PUNTUACIONES = range(1, 6)
+
+
+def rating_aggregate_increment(puntuacion_anterior, puntuacion):
+    """
+    Devuelve el documento '$inc' que pasa los agregados de la puntuación anterior
+    (None si es una valoración nueva) a la nueva.
+    """
+    increment = {
+        'suma_puntuaciones': puntuacion - (puntuacion_anterior or 0),
+        f'histograma_puntuaciones.{puntuacion}': 1
+    }
+    if puntuacion_anterior is None:
+        increment['total_valoraciones'] = 1
+    else:
+        increment[f'histograma_puntuaciones.{puntuacion_anterior}'] = -1
+    return increment
+
+def apply_rating_aggregates(db, negocio_id, cambios):
+    """
+    Aplica a los agregados del negocio una lista de cambios de valoraciones
+    (puntuacion_anterior, puntuacion) con un solo '$inc' y recalcula su promedio.
+    """
+    increment = {}
+    for puntuacion_anterior, puntuacion in cambios:
+        if puntuacion_anterior == puntuacion:
+            continue
+        for field, value in rating_aggregate_increment(puntuacion_anterior, puntuacion).items():
+            increment[field] = increment.get(field, 0) + value
+    increment = {field: value for field, value in increment.items() if value}
+    if not increment:
+        return
+
+    negocio = db.negocios.find_one_and_update(
+        {'_id': negocio_id, 'total_valoraciones': {'$exists': True}},
+        {'$inc': increment},
+        projection={'suma_puntuaciones': 1, 'total_valoraciones': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if negocio is None:
+        # El negocio aún no tiene agregados: se calculan desde sus valoraciones
+        reconcile_rating_aggregates(db, [negocio_id])
+        return
+
+    # Solo se escribe el promedio si nadie cambió los agregados mientras tanto;
+    # si hubo otra valoración concurrente, esa escribirá el promedio correcto.
+    suma, total = negocio['suma_puntuaciones'], negocio['total_valoraciones']
+    if total:
+        db.negocios.update_one(
+            {'_id': negocio_id, 'suma_puntuaciones': suma, 'total_valoraciones': total},
+            {'$set': {'promedio_ranking': round(suma / total, 1)}}
+        )
+
+def reconcile_rating_aggregates(db, negocio_ids=None):
+    """
+    Recalcula en bloque los agregados de valoraciones con un pipeline de agregación.
+    Si no se indican negocios se reconcilia todo el catálogo.
+    """
+    pipeline = []
+    if negocio_ids is not None:
+        pipeline.append({'$match': {'negocio_id': {'$in': list(negocio_ids)}}})
+    pipeline.append({'$group': {
+        '_id': '$negocio_id',
+        'suma': {'$sum': '$puntuacion'},
+        'total': {'$sum': 1},
+        **{
+            f'estrellas_{p}': {'$sum': {'$cond': [{'$eq': ['$puntuacion', p]}, 1, 0]}}
+            for p in PUNTUACIONES
+        }
+    }})
+
+    operations = []
+    for row in db.valoraciones.aggregate(pipeline, allowDiskUse=True):
+        operations.append(UpdateOne({'_id': row['_id']}, {'$set': {
+            'suma_puntuaciones': row['suma'],
+            'total_valoraciones': row['total'],
+            'histograma_puntuaciones': {str(p): row[f'estrellas_{p}'] for p in PUNTUACIONES},
+            'promedio_ranking': round(row['suma'] / row['total'], 1)
+        }}))
+        if len(operations) >= 1000:
+            db.negocios.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        db.negocios.bulk_write(operations, ordered=False)
+
+    # Los negocios que quedan sin agregados no tienen valoraciones; se conserva su promedio
+    sin_valoraciones = {'total_valoraciones': {'$exists': False}}
+    if negocio_ids is not None:
+        sin_valoraciones['_id'] = {'$in': list(negocio_ids)}
+    db.negocios.update_many(sin_valoraciones, {'$set': {
+        'suma_puntuaciones': 0,
+        'total_valoraciones': 0,
+        'histograma_puntuaciones': {str(p): 0 for p in PUNTUACIONES}
+    }})
+
+
+if __name__ == '__main__':
+    db = get_db()
+
+    print("Reconciliando los agregados de valoraciones de los negocios...")
+    reconcile_rating_aggregates(db)
+    print("Agregados actualizados.")
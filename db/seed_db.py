@@ -1,17 +1,13 @@
-from pymongo import MongoClient
+import sys
+
 from bson.objectid import ObjectId
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+from db.ratings import reconcile_rating_aggregates
+from db.loader import load_rows
+from db.migrations import apply_migrations, ensure_indexes
 
-load_dotenv()
-# --- Conexión a MongoDB ---
-mongo_uri = os.getenv('MONGO_URI')
-if not mongo_uri:
-    raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
-    
-client = MongoClient(mongo_uri) 
-db = client[os.getenv('MONGO_DB_NAME')] # El nombre de la base de datos también se lee desde .env
+# --- Conexión a MongoDB (cliente compartido del proceso) ---
+from db.connection import db
 
 
 # --- Datos Simulados ---
@@ -176,29 +172,41 @@ valoraciones_data = [
 
 # --- Funciones de Poblado de la DB ---
 
-def populate_collections():
+def populate_collections(reset=False):
     """
     Función principal para poblar las colecciones en MongoDB.
+
+    Los datos se cargan con upserts (db/loader.py), así que se puede ejecutar sobre una base
+    en uso sin borrar nada; con reset=True (--reset) primero se borran las colecciones.
     """
     print("Iniciando la población de la base de datos...")
 
-    # Borra las colecciones si ya existen
-    db.negocios.drop()
-    db.usuarios.drop()
-    db.valoraciones.drop()
-    print("Colecciones existentes borradas.")
+    if reset:
+        db.negocios.drop()
+        db.usuarios.drop()
+        db.valoraciones.drop()
+        print("Colecciones existentes borradas.")
+
+    # Índices de las consultas frecuentes (la aplicación no arranca sin ellos); se crean antes
+    # de cargar para que los upserts usen los índices únicos
+    apply_migrations(db)
+    ensure_indexes(db)
+
+    # Inserta o actualiza los datos en las colecciones
+    stats = load_rows(db, 'negocios', negocios_data)
+    print(f"Cargados {stats['written']} negocios.")
 
-    # Inserta los datos en las colecciones
-    db.negocios.insert_many(negocios_data)
-    print(f"Insertados {len(negocios_data)} negocios.")
+    stats = load_rows(db, 'usuarios', usuarios_data)
+    print(f"Cargados {stats['written']} usuarios.")
 
-    db.usuarios.insert_many(usuarios_data)
-    print(f"Insertados {len(usuarios_data)} usuarios.")
+    stats = load_rows(db, 'valoraciones', valoraciones_data)
+    print(f"Cargadas {stats['written']} valoraciones.")
 
-    db.valoraciones.insert_many(valoraciones_data)
-    print(f"Insertadas {len(valoraciones_data)} valoraciones.")
+    # Calcula los agregados de valoraciones (suma, total, histograma y promedio) de cada negocio
+    reconcile_rating_aggregates(db)
+    print("Agregados de valoraciones calculados.")
 
     print("\nBase de datos poblada exitosamente. ¡Listo para usar!")
 
 if __name__ == '__main__':
-    populate_collections()
+    populate_collections(reset='--reset' in sys.argv)
@@ -0,0 +1,97 @@
+"""
+Formato JSON de los negocios que consumen el frontend y el chatbot.
+
+Lo comparten app.py y async_app.py para que ambos modos de servicio devuelvan exactamente
+los mismos contratos. Las consultas de listados piden solo BUSINESS_SUMMARY_PROJECTION, así
+que horarios, teléfono, email y descripción no viajan desde MongoDB si no se van a mostrar.
+Las imágenes locales se envían como miniaturas (image_srcset) si se generaron con assets.py.
+"""
+from bson.objectid import ObjectId
+
+from assets import image_variants
+
+try:
+    import orjson
+except ImportError:  # Dependencia opcional: sin ella se usa el codificador JSON estándar
+    orjson = None
+
+# Campos de un negocio que usan los listados, el mapa y las tarjetas del chatbot
+BUSINESS_SUMMARY_PROJECTION = {'nombre': 1, 'categoria': 1, 'promedio_ranking': 1, 'imagen_url': 1, 'coordenadas': 1}
+
+
+def serialize_business(b):
+    """
+    Convierte un documento de negocio al formato JSON que usa el frontend.
+
+    'image_srcset' tiene los srcset WebP y JPEG de las miniaturas ({'webp': ..., 'jpeg': ...})
+    o None si la imagen no tiene miniaturas; en ese caso 'image_url' es la imagen original.
+    """
+    image = image_variants(b.get('imagen_url'))
+    return {
+        'id': str(b['_id']),
+        'name': b['nombre'],
+        'category': b['categoria'],
+        'ranking': b.get('promedio_ranking', 0),
+        'image_url': image['src'] if image else b.get('imagen_url', 'https://placehold.co/300x200'),
+        'image_srcset': image['srcset'] if image else None,
+        'lat': b.get('coordenadas', {}).get('lat'),
+        'lng': b.get('coordenadas', {}).get('lon')
+    }
+
+def serialize_chatbot_business(b):
+    """
+    Tarjeta de negocio del chatbot (con los nombres de campo que usa su plantilla en app.js).
+    """
+    image = image_variants(b.get('imagen_url'))
+    return {
+        '_id': str(b['_id']),
+        'nombre': b['nombre'],
+        'categoria': b['categoria'],
+        'promedio_ranking': b.get('promedio_ranking', 0),
+        'imagen_url': image['src'] if image else b.get('imagen_url', 'https://placehold.co/300x200')
+    }
+
+def chatbot_response_data(categoria_negocio, negocios, static_response):
+    """
+    Cuerpo de la respuesta del chatbot. Si el mensaje pidió una categoría de negocios,
+    'negocios' son sus mejores valorados; si no, se usa la respuesta estática del intent.
+    """
+    if categoria_negocio:
+        if negocios:
+            data = [serialize_chatbot_business(negocio) for negocio in negocios]
+            return {
+                "message": f"Aquí te presento algunos de los {categoria_negocio} mejor valorados:",
+                "type": "negocios",
+                "data": data
+            }
+        return {"message": f"No se encontraron negocios en la categoría de {categoria_negocio}."}
+
+    # Respuestas estáticas del resto de intents
+    if static_response:
+        return {"message": static_response}
+
+    # Manejar el caso de no encontrar respuesta
+    return {"message": "Lo siento, no entendí tu pregunta. ¿Puedes reformularla?"}
+
+def json_default(o):
+    """
+    Tipos de MongoDB que el codificador JSON no conoce (los ObjectId se envían como texto).
+    """
+    if isinstance(o, ObjectId):
+        return str(o)
+    raise TypeError(f"El objeto de tipo {type(o).__name__} no se puede serializar a JSON")
+
+
+class FastJSONProviderMixin:
+    """
+    Se combina con el JSONProvider de Flask o Quart para codificar las respuestas con orjson
+    (si está instalado) y aceptar ObjectId. Mantiene las claves ordenadas, como jsonify.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'):
+            kwargs.setdefault('default', json_default)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(
+            obj, default=json_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
@@ -0,0 +1,346 @@
+"""
+Métricas de la aplicación en formato Prometheus (GET /metrics).
+
+  - http_request_duration_seconds: latencia de cada ruta (método, ruta y código de estado)
+  - mongodb_command_duration_seconds / mongodb_command_documents_total: latencia y documentos
+    devueltos o escritos por comando y colección (CommandListener de pymongo)
+  - span_duration_seconds: etapas instrumentadas con span() (entrenamiento, puntuación, chatbot...)
+  - chatbot_stage_duration_seconds: etapas del clasificador del chatbot (model/predictor.py)
+  - errors_total: errores capturados en segundo plano (entrenamiento, cola de valoraciones)
+
+Cada proceso lleva sus propias métricas; con varios workers de gunicorn Prometheus debe
+consultar cada worker (o sumar las series por instancia).
+
+Con METRICS_PROFILE_SLOW_MS > 0 se activa un perfilador por muestreo: mientras hay peticiones
+en curso se toma la pila de sus hilos cada METRICS_PROFILE_INTERVAL_MS y, si una petición
+supera el umbral, se guardan sus pilas más frecuentes (ver SlowRequestProfiler).
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Límites (en milisegundos) de los histogramas de etapas rápidas y de peticiones/consultas
+FAST_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+REQUEST_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRICS_MONGO_COMMANDS = os.getenv('METRICS_MONGO_COMMANDS', '1') == '1'
+METRICS_PROFILE_SLOW_MS = float(os.getenv('METRICS_PROFILE_SLOW_MS', 0))
+METRICS_PROFILE_INTERVAL_MS = float(os.getenv('METRICS_PROFILE_INTERVAL_MS', 5))
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias en milisegundos con límites fijos (acumulado, como Prometheus).
+    """
+
+    BUCKETS_MS = FAST_BUCKETS_MS
+
+    def __init__(self, buckets_ms=None):
+        self.buckets_ms = tuple(buckets_ms or self.BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, milliseconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets_ms, milliseconds)] += 1
+            self.total += 1
+            self.sum_ms += milliseconds
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, sum_ms = self.total, self.sum_ms
+        cumulative, buckets = 0, {}
+        for bound, count in zip(list(self.buckets_ms) + ['+Inf'], counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': total,
+            'mean_ms': round(sum_ms / total, 4) if total else 0.0,
+            'sum_ms': sum_ms,
+            'buckets': buckets
+        }
+
+
+class CounterValue:
+    """
+    Contador que solo aumenta.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """
+    Series de métricas por nombre y etiquetas. histogram() y counter() devuelven la serie
+    existente o la crean, así que se pueden llamar en cada observación.
+    """
+
+    def __init__(self):
+        self._families = {}  # nombre -> (tipo, ayuda, {etiquetas: serie})
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets_ms=REQUEST_BUCKETS_MS, **labels):
+        return self._series(name, 'histogram', help_text, labels, lambda: LatencyHistogram(buckets_ms))
+
+    def counter(self, name, help_text, **labels):
+        return self._series(name, 'counter', help_text, labels, CounterValue)
+
+    def _series(self, name, kind, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            return family[2].setdefault(key, factory())
+
+    def render(self):
+        """
+        Texto en el formato de exposición de Prometheus (los histogramas, en segundos).
+        """
+        lines = []
+        with self._lock:
+            families = {name: (kind, help_text, dict(series)) for name, (kind, help_text, series) in self._families.items()}
+        for name in sorted(families):
+            kind, help_text, series = families[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in sorted(series):
+                if kind == 'counter':
+                    lines.append(f"{name}{_labels(key)} {series[key].value}")
+                    continue
+                snapshot = series[key].snapshot()
+                for bound, cumulative in snapshot['buckets'].items():
+                    le = bound if bound == '+Inf' else repr(float(bound) / 1000)
+                    lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key)} {snapshot['sum_ms'] / 1000}")
+                lines.append(f"{name}_count{_labels(key)} {snapshot['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in key) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Métricas del proceso
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Mide un bloque de código en span_duration_seconds{span=name}. Si el bloque lanza una
+    excepción la cuenta en span_errors_total y la deja pasar.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.counter('span_errors_total', "Excepciones dentro de un span.", span=name, **labels).inc()
+        raise
+    finally:
+        metrics.histogram(
+            'span_duration_seconds', "Duración de las etapas instrumentadas.", span=name, **labels
+        ).observe((time.perf_counter() - start) * 1000)
+
+def count_error(origin):
+    """
+    Cuenta un error capturado fuera de una petición (además de imprimirlo).
+    """
+    metrics.counter('errors_total', "Errores capturados en tareas de segundo plano.", origin=origin).inc()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Latencia, documentos y fallos de cada comando de MongoDB por colección.
+    """
+
+    # Campo de la respuesta con los documentos devueltos, por comando
+    CURSOR_BATCHES = {'find': 'firstBatch', 'aggregate': 'firstBatch', 'getMore': 'nextBatch'}
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._pending = {}  # (request_id, connection_id) -> colección
+
+    def started(self, event):
+        collection = event.command.get('collection') if event.command_name == 'getMore' else event.command.get(event.command_name)
+        self._pending[(event.request_id, event.connection_id)] = collection if isinstance(collection, str) else ''
+
+    def succeeded(self, event):
+        collection = self._pending.pop((event.request_id, event.connection_id), '')
+        labels = {'command': event.command_name, 'collection': collection}
+        self.registry.histogram(
+            'mongodb_command_duration_seconds', "Latencia de los comandos de MongoDB.", **labels
+        ).observe(event.duration_micros / 1000)
+        documents = self._documents(event.command_name, event.reply)
+        if documents:
+            self.registry.counter(
+                'mongodb_command_documents_total', "Documentos devueltos o escritos por los comandos de MongoDB.", **labels
+            ).inc(documents)
+
+    def failed(self, event):
+        collection = self._pending.pop((event.request_id, event.connection_id), '')
+        self.registry.counter(
+            'mongodb_command_failures_total', "Comandos de MongoDB que fallaron.",
+            command=event.command_name, collection=collection
+        ).inc()
+
+    def _documents(self, command_name, reply):
+        batch = self.CURSOR_BATCHES.get(command_name)
+        if batch:
+            return len(reply.get('cursor', {}).get(batch, ()))
+        # insert, update y delete informan los documentos afectados en 'n'
+        n = reply.get('n')
+        return n if isinstance(n, int) else 0
+
+
+# Listener que db/connection.py agrega a los clientes del proceso (None si está desactivado)
+mongo_command_listener = MongoCommandListener(metrics) if METRICS_MONGO_COMMANDS else None
+
+
+class SlowRequestProfiler:
+    """
+    Perfilador por muestreo de las peticiones lentas.
+
+    Mientras una petición está en curso un hilo toma la pila de su hilo cada interval_ms;
+    al terminar, si duró más de threshold_ms, se guardan las pilas más frecuentes entre
+    los últimos perfiles (recent()) y se imprime un resumen.
+    """
+
+    def __init__(self, threshold_ms, interval_ms=5, keep=20, top_stacks=5, max_depth=12):
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        self.top_stacks = top_stacks
+        self.max_depth = max_depth
+        self._profiles = deque(maxlen=keep)
+        self._active = {}  # id del hilo -> Counter de pilas
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        threading.Thread(target=self._run, name='slow-request-profiler', daemon=True).start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+        self._wakeup.set()
+
+    def stop(self, route, duration_ms):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or duration_ms < self.threshold_ms:
+            return
+        total = sum(samples.values())
+        profile = {
+            'route': route,
+            'duration_ms': round(duration_ms, 1),
+            'samples': total,
+            'stacks': [
+                {'share': round(count / total, 3), 'stack': list(stack)} for stack, count in samples.most_common(self.top_stacks)
+            ] if total else []
+        }
+        self._profiles.append(profile)
+        top = profile['stacks'][0]['stack'][-1] if profile['stacks'] else 'sin muestras'
+        print(f"Petición lenta: {route} tardó {profile['duration_ms']} ms ({total} muestras, más frecuente: {top}).")
+
+    def recent(self):
+        return list(self._profiles)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stack = traceback.extract_stack(frame)[-self.max_depth:]
+                        samples[tuple(f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in stack)] += 1
+
+
+def create_profiler():
+    """
+    Perfilador de peticiones lentas si METRICS_PROFILE_SLOW_MS > 0; si no, None.
+    """
+    if METRICS_PROFILE_SLOW_MS <= 0:
+        return None
+    return SlowRequestProfiler(METRICS_PROFILE_SLOW_MS, METRICS_PROFILE_INTERVAL_MS)
+
+def instrument_app(app, request, g, profiler=None):
+    """
+    Mide cada petición de una aplicación Flask (para Quart, ver instrument_async_app)
+    en http_request_duration_seconds, etiquetada por la regla de la ruta para no crear una
+    serie por URL. Se registra en teardown_request, que también corre cuando la vista lanza
+    una excepción (con estado 500 si no llegó a haber respuesta).
+    """
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe_request(exc):
+        _record_request(request, g, profiler)
+
+def instrument_async_app(app, request, g):
+    """
+    Igual que instrument_app pero con funciones async para Quart, que ejecuta las funciones
+    síncronas registradas como hooks en un hilo aparte (run_sync) en cada petición. No usa el
+    perfilador: muestrea pilas de hilos y las peticiones de Quart comparten el del bucle.
+    """
+    @app.before_request
+    async def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    async def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    async def _observe_request(exc):
+        _record_request(request, g, None)
+
+def _record_request(request, g, profiler):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    duration_ms = (time.perf_counter() - start) * 1000
+    route = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+    metrics.histogram(
+        'http_request_duration_seconds', "Latencia de las peticiones HTTP.",
+        method=request.method, route=route, status=str(g.get('metrics_status', 500))
+    ).observe(duration_ms)
+    if profiler is not None:
+        profiler.stop(f"{request.method} {route}", duration_ms)
@@ -0,0 +1,216 @@
+"""
+Índice de vecinos por contenido: negocios parecidos por categoría, descripción y cercanía.
+
+Complementa al índice colaborativo (NeighborIndex), que solo conoce los negocios que ya tienen
+valoraciones: un negocio nuevo aparece aquí desde que está en el catálogo y un usuario con
+pocas valoraciones recibe negocios parecidos a los que valoró. score_users mezcla las dos
+puntuaciones (ver CONTENT_BLEND_WEIGHT en model/recommendation_engine.py).
+
+La similitud entre dos negocios es
+
+    TEXT_WEIGHT · coseno(tf-idf de la descripción) + CATEGORY_WEIGHT · [misma categoría]
+    + GEO_WEIGHT · exp(-distancia_km / GEO_SCALE_KM)
+
+y de cada negocio se guardan sus k vecinos en arreglos (n, k), como en NeighborIndex. El índice
+también guarda los documentos de los negocios para devolver las recomendaciones sin volver a
+consultar MongoDB. Se construye una sola vez para todos los workers y se guarda junto al índice
+de vecinos en disco (ver refresh_content_index en model/similarity_store.py).
+"""
+import os
+import time
+
+import numpy as np
+
+from db.serializers import BUSINESS_SUMMARY_PROJECTION
+from metrics import span
+from model.geo_index import EARTH_RADIUS_KM
+from model.search_index import tokenize
+
+# Campos de los negocios que usa el índice (los del resumen más la descripción)
+CONTENT_PROJECTION = {**BUSINESS_SUMMARY_PROJECTION, 'descripcion': 1}
+
+# Pesos de cada componente de la similitud (suman 1)
+TEXT_WEIGHT = float(os.getenv('CONTENT_TEXT_WEIGHT', 0.5))
+CATEGORY_WEIGHT = float(os.getenv('CONTENT_CATEGORY_WEIGHT', 0.3))
+GEO_WEIGHT = float(os.getenv('CONTENT_GEO_WEIGHT', 0.2))
+
+# Distancia (km) a la que la cercanía aporta 1/e de GEO_WEIGHT
+GEO_SCALE_KM = float(os.getenv('CONTENT_GEO_SCALE_KM', 2.0))
+
+# Vecinos por contenido que se guardan por negocio
+CONTENT_TOP_K = int(os.getenv('CONTENT_TOP_K', 30))
+
+# Negocios procesados por bloque al calcular similitudes (limita la memoria usada)
+CONTENT_BLOCK_SIZE = 256
+
+
+class ContentIndex:
+    """
+    Los k negocios más parecidos por contenido a cada negocio del catálogo.
+
+    'neighbors' y 'scores' son arreglos (n, k) indexados por posición, con la misma forma que
+    en NeighborIndex (huecos con -1 y similitud 0); 'documents' tiene el documento de cada
+    negocio en el mismo orden.
+    """
+
+    def __init__(self, negocios, top_k=CONTENT_TOP_K, block_size=CONTENT_BLOCK_SIZE):
+        documents = list(negocios)
+        self._set(documents, *content_neighbors(documents, top_k, block_size), built_at=time.time())
+
+    @classmethod
+    def from_arrays(cls, documents, neighbors, scores, built_at, version=None):
+        """
+        Índice ya calculado (por ejemplo, leído del disco con model/similarity_store.py).
+        """
+        index = cls.__new__(cls)
+        index._set(list(documents), neighbors, scores, built_at, version)
+        return index
+
+    def _set(self, documents, neighbors, scores, built_at, version=None):
+        self.built_at = built_at
+        # Versión en disco de la que se leyó (None si se construyó en este proceso)
+        self.version = version
+        self.documents = documents
+        self.item_ids = [negocio['_id'] for negocio in self.documents]
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.neighbors, self.scores = neighbors, scores
+        self._similarity_matrix = None
+        self._projection = (None, None)  # (NeighborIndex, matriz que lo lleva a este índice)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __contains__(self, item_id):
+        return item_id in self.item_index
+
+    @property
+    def similarity_matrix(self):
+        """
+        Matriz dispersa (CSR) n×n con las similitudes de los k vecinos; se construye una sola vez.
+        """
+        if self._similarity_matrix is None:
+            from scipy import sparse
+            n_items, top_k = self.neighbors.shape
+            valid = self.neighbors >= 0
+            rows = np.repeat(np.arange(n_items, dtype=np.int32), top_k).reshape(n_items, top_k)[valid]
+            self._similarity_matrix = sparse.csr_matrix(
+                (self.scores[valid], (rows, self.neighbors[valid])), shape=(n_items, n_items)
+            )
+        return self._similarity_matrix
+
+    def projection_from(self, neighbor_index):
+        """
+        Matriz dispersa (negocios del índice colaborativo × negocios de este índice) que pasa
+        puntuaciones del espacio de NeighborIndex a este. Se recalcula solo si cambia el índice.
+        """
+        cached_index, projection = self._projection
+        if cached_index is not neighbor_index:
+            from scipy import sparse
+            pairs = [
+                (row, self.item_index[item_id]) for row, item_id in enumerate(neighbor_index.item_ids)
+                if item_id in self.item_index
+            ]
+            rows = np.fromiter((row for row, _ in pairs), dtype=np.int32, count=len(pairs))
+            cols = np.fromiter((col for _, col in pairs), dtype=np.int32, count=len(pairs))
+            projection = sparse.csr_matrix(
+                (np.ones(len(pairs), dtype=np.float32), (rows, cols)), shape=(len(neighbor_index), len(self))
+            )
+            self._projection = (neighbor_index, projection)
+        return projection
+
+    def similar_items(self, item_id):
+        """
+        Devuelve los vecinos de un negocio como lista de (negocio_id, similitud), de mayor a menor.
+        """
+        row = self.item_index.get(item_id)
+        if row is None:
+            return []
+        return [
+            (self.item_ids[j], float(s))
+            for j, s in zip(self.neighbors[row], self.scores[row]) if j >= 0
+        ]
+
+    def find(self, item_ids):
+        """
+        Documentos de los negocios indicados, en el mismo orden (omite los que no conoce).
+        """
+        return [self.documents[self.item_index[item_id]] for item_id in item_ids if item_id in self.item_index]
+
+
+def _text_matrix(documents):
+    # tf-idf de las descripciones normalizado por filas (con los tokens del buscador)
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(tokenizer=tokenize, lowercase=False, token_pattern=None, sublinear_tf=True)
+    try:
+        return vectorizer.fit_transform(negocio.get('descripcion') or '' for negocio in documents).astype(np.float32)
+    except ValueError:
+        # Ninguna descripción tiene palabras útiles
+        return sparse.csr_matrix((len(documents), 1), dtype=np.float32)
+
+def _category_codes(documents):
+    codes = {}
+    return np.array([
+        codes.setdefault(negocio['categoria'], len(codes)) if negocio.get('categoria') else -1
+        for negocio in documents
+    ], dtype=np.int32)
+
+def _unit_vectors(documents):
+    # Cada negocio como punto de la esfera unitaria (x, y, z); (0, 0, 0) si no tiene coordenadas
+    vectors = np.zeros((len(documents), 3))
+    for i, negocio in enumerate(documents):
+        coordenadas = negocio.get('coordenadas') or {}
+        if coordenadas.get('lat') is not None and coordenadas.get('lon') is not None:
+            lat, lon = np.radians(coordenadas['lat']), np.radians(coordenadas['lon'])
+            vectors[i] = np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+    return vectors
+
+def _geo_similarity(block, vectors):
+    # exp(-distancia / escala) entre los negocios del bloque y todos. La distancia es la cuerda
+    # entre los puntos (igual al arco a escala de un municipio) y sale de un producto de
+    # matrices; si a un negocio le faltan coordenadas la cuerda mide √2 radios y la similitud es 0
+    squared_chord = np.maximum(2 - 2 * (block @ vectors.T), 0).astype(np.float32)
+    return np.exp(np.sqrt(squared_chord) * np.float32(-EARTH_RADIUS_KM / GEO_SCALE_KM))
+
+def content_neighbors(documents, top_k=CONTENT_TOP_K, block_size=CONTENT_BLOCK_SIZE):
+    """
+    Calcula por bloques la similitud de contenido entre negocios y guarda solo los k vecinos
+    de cada uno. Nunca se materializa la matriz completa N×N.
+    """
+    n_items = len(documents)
+    neighbors = np.full((n_items, top_k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, top_k), dtype=np.float32)
+    k = min(top_k, n_items - 1)
+    if k <= 0:
+        return neighbors, scores
+
+    text = _text_matrix(documents)
+    text_t = text.T.tocsc()
+    categories = _category_codes(documents)
+    vectors = _unit_vectors(documents)
+
+    for start in range(0, n_items, block_size):
+        end = min(start + block_size, n_items)
+        block = TEXT_WEIGHT * (text[start:end] @ text_t).toarray()
+        same_category = (categories[start:end, None] == categories[None, :]) & (categories[None, :] >= 0)
+        block += CATEGORY_WEIGHT * same_category
+        block += GEO_WEIGHT * _geo_similarity(vectors[start:end], vectors)
+        block[np.arange(end - start), np.arange(start, end)] = 0  # Excluir el mismo negocio
+
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        valid = candidate_scores > 0
+        neighbors[start:end, :k] = np.where(valid, candidates, -1)
+        scores[start:end, :k] = np.where(valid, candidate_scores, 0)
+
+    return neighbors, scores
+
+@span('build_content_index')
+def build_content_index(db):
+    """
+    Construye el índice de contenido a partir de la colección 'negocios'.
+    """
+    return ContentIndex(db.negocios.find({}, CONTENT_PROJECTION))
@@ -0,0 +1,108 @@
+import math
+import time
+
+from db.serializers import BUSINESS_SUMMARY_PROJECTION
+
+# Radio medio de la Tierra en kilómetros
+EARTH_RADIUS_KM = 6371.0
+
+# Kilómetros por grado de latitud
+KM_PER_DEGREE = 111.32
+
+# Campos que se guardan de cada negocio para responder sin ir a la base de datos
+GEO_PROJECTION = BUSINESS_SUMMARY_PROJECTION
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia en kilómetros entre dos puntos sobre la superficie terrestre.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GeoIndex:
+    """
+    Índice espacial en memoria: una cuadrícula de celdas de cell_size grados.
+
+    Las consultas solo revisan las celdas que tocan el círculo o el rectángulo pedido. Si la
+    zona cubre más celdas que negocios hay en el índice, se recorre la lista directamente.
+    """
+
+    def __init__(self, negocios, cell_size=0.01):
+        self.cell_size = cell_size
+        self.built_at = time.time()
+        self.documents = []
+        self.cells = {}  # (fila, columna) -> [posiciones]
+
+        for negocio in negocios:
+            coordenadas = negocio.get('coordenadas') or {}
+            lat, lon = coordenadas.get('lat'), coordenadas.get('lon')
+            if lat is None or lon is None:
+                continue
+            self.cells.setdefault(self._cell(lat, lon), []).append(len(self.documents))
+            self.documents.append((lat, lon, negocio))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def near(self, lat, lon, radius_km, categoria=None, limit=20):
+        """
+        Negocios a menos de radius_km del punto, ordenados por distancia.
+        Devuelve una lista de (negocio, distancia_km).
+        """
+        d_lat = radius_km / KM_PER_DEGREE
+        d_lon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+
+        results = []
+        for position in self._candidates(lat - d_lat, lon - d_lon, lat + d_lat, lon + d_lon):
+            doc_lat, doc_lon, negocio = self.documents[position]
+            if categoria and negocio.get('categoria') != categoria:
+                continue
+            distance = haversine_km(lat, lon, doc_lat, doc_lon)
+            if distance <= radius_km:
+                results.append((negocio, distance))
+
+        results.sort(key=lambda result: result[1])
+        return results[:limit]
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon, categoria=None, limit=200):
+        """
+        Negocios dentro del rectángulo visible del mapa, de mayor a menor promedio_ranking.
+        """
+        results = []
+        for position in self._candidates(min_lat, min_lon, max_lat, max_lon):
+            doc_lat, doc_lon, negocio = self.documents[position]
+            if categoria and negocio.get('categoria') != categoria:
+                continue
+            if min_lat <= doc_lat <= max_lat and min_lon <= doc_lon <= max_lon:
+                results.append(negocio)
+
+        results.sort(key=lambda negocio: negocio.get('promedio_ranking') or 0, reverse=True)
+        return results[:limit]
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            # Zona muy grande (mapa alejado): es más barato revisar todas las celdas ocupadas
+            for (row, col), positions in self.cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    yield from positions
+            return
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield from self.cells.get((row, col), ())
+
+
+def build_geo_index(db):
+    """
+    Construye el índice espacial a partir de las coordenadas de la colección 'negocios'.
+    """
+    return GeoIndex(db.negocios.find({'coordenadas': {'$exists': True}}, GEO_PROJECTION))
@@ -1,38 +1,177 @@
-import pickle
+import os
+import queue
 import random
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.linear_model import SGDClassifier
-
-# Cargar el modelo, el vectorizador y el corpus desde el archivo model.pkl
-# El corpus cargado tendrá la nueva estructura con la clave 'responses'
-try:
-    with open("model/model.pkl", "rb") as f:
-        model, vectorizer, corpus = pickle.load(f)
-except FileNotFoundError:
-    print("Error: El archivo 'model/model.pkl' no se encontró. Por favor, entrene el modelo primero.")
-    # Considera una solución más robusta para producción
-    model = None
-    vectorizer = None
-    corpus = []
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+
+from metrics import FAST_BUCKETS_MS, metrics
+from model.registry import ModelRegistry
+
+# Cargar la versión activa del modelo (vectorizador, clasificador y corpus) desde el registro.
+# El corpus tiene la estructura con la clave 'responses' y se indexa por tag al cargar.
+# Con MODEL_STARTUP_MODE=background (por defecto) se carga en un hilo para no retrasar el arranque.
+registry = ModelRegistry(poll_interval=int(os.getenv('CHATBOT_MODEL_POLL_INTERVAL', 30)))
+if os.getenv('MODEL_STARTUP_MODE', 'background') == 'blocking':
+    registry.load()
+else:
+    threading.Thread(target=registry.load, name='chatbot-model-loader', daemon=True).start()
+
+# ✅ Mapa de etiquetas a categorías de negocios
+NEGOCIO_TAG_MAPPING = {
+    "recomendacion_restaurantes": "Restaurantes",
+    "recomendacion_hospedajes": "Hospedajes",
+    "recomendacion_bares": "Bares",
+    "recomendacion_sitios_turisticos": "Sitios Turisticos"
+    # Añade nuevos tags para negocios aquí
+}
+
+# Cantidad de mensajes normalizados distintos cuya etiqueta se guarda en memoria
+MESSAGE_CACHE_SIZE = int(os.getenv('CHATBOT_CACHE_SIZE', 4096))
+
+# Ventana (en milisegundos) para agrupar mensajes concurrentes en una sola predicción.
+# Con 0 cada mensaje se clasifica directamente en el hilo de la petición.
+BATCH_WINDOW_MS = float(os.getenv('CHATBOT_BATCH_WINDOW_MS', 0))
+MAX_BATCH_SIZE = int(os.getenv('CHATBOT_MAX_BATCH_SIZE', 64))
+
+
+# Latencias por etapa: espera en la cola del lote, vectorización, predicción y total
+# (también se exponen en /metrics como chatbot_stage_duration_seconds)
+latency_histograms = {
+    stage: metrics.histogram(
+        'chatbot_stage_duration_seconds', "Latencia de cada etapa del clasificador del chatbot.",
+        buckets_ms=FAST_BUCKETS_MS, stage=stage
+    )
+    for stage in ('queue_wait', 'vectorize', 'predict', 'total')
+}
+
+
+class MicroBatchClassifier:
+    """
+    Agrupa los mensajes que llegan al mismo tiempo y los clasifica con una sola llamada
+    a vectorizer.transform y model.predict sobre la matriz dispersa del lote.
+    """
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='chatbot-batcher', daemon=True)
+        self._thread.start()
+
+    def predict(self, chatbot_model, text):
+        future = Future()
+        self._queue.put((chatbot_model, text, time.perf_counter(), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            # Cada mensaje se clasifica con el modelo que vio quien lo envió (durante una recarga
+            # en caliente el lote puede mezclar dos versiones)
+            by_model = {}
+            for chatbot_model, text, enqueued_at, future in batch:
+                latency_histograms['queue_wait'].observe((started - enqueued_at) * 1000)
+                by_model.setdefault(chatbot_model, []).append((text, future))
+            for chatbot_model, items in by_model.items():
+                try:
+                    tags = _classify(chatbot_model, [text for text, _ in items])
+                except Exception as e:
+                    for _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, future), tag in zip(items, tags):
+                    future.set_result(tag)
+
+
+def _classify(chatbot_model, texts):
+    # Vectoriza y predice un lote de mensajes ya normalizados
+    start = time.perf_counter()
+    X_vec = chatbot_model.transform(texts)
+    vectorized = time.perf_counter()
+    tags = chatbot_model.predict_vectors(X_vec)
+    latency_histograms['vectorize'].observe((vectorized - start) * 1000)
+    latency_histograms['predict'].observe((time.perf_counter() - vectorized) * 1000)
+    return list(tags)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatchClassifier()
+    return _batcher
+
+def normalize_message(text):
+    """
+    Minúsculas y espacios colapsados: no cambia los tokens que ve el vectorizador,
+    pero hace que las preguntas repetidas compartan la misma entrada de la caché.
+    """
+    return ' '.join(text.lower().split())
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _predict_tag(chatbot_model, normalized_text):
+    # El modelo forma parte de la clave y es el mismo que clasifica el mensaje (también dentro
+    # del lote), así que la etiqueta de un modelo nunca se guarda con la clave de otro
+    if BATCH_WINDOW_MS > 0:
+        return _get_batcher().predict(chatbot_model, normalized_text)
+    return _classify(chatbot_model, [normalized_text])[0]
+
+# Versión del modelo de las entradas de la caché; al cambiar se vacía para no retener el modelo anterior
+_cached_version = None
+
+def get_latency_stats():
+    """
+    Latencias por etapa y estadísticas de la caché de mensajes.
+    """
+    cache_info = _predict_tag.cache_info()
+    return {
+        'stages': {stage: histogram.snapshot() for stage, histogram in latency_histograms.items()},
+        'cache': {'hits': cache_info.hits, 'misses': cache_info.misses, 'size': cache_info.currsize},
+        'batching': BATCH_WINDOW_MS > 0,
+        'model': registry.status()
+    }
 
 def predict_tag_and_response(text):
-    if model is None:
+    global _cached_version
+    chatbot_model = registry.current()
+    if chatbot_model is None:
         return "error", "Lo siento, el modelo del asistente no está disponible."
-        
-    # Vectorizar el texto del usuario
-    X_vec = vectorizer.transform([text.lower()])
-    
-    # Predecir la etiqueta
-    tag = model.predict(X_vec)[0]
-
-    # Encontrar la respuesta estática en el corpus para el tag predicho
-    for intent in corpus:
-        if intent["tag"] == tag:
-            # Si el tag es de un negocio, devolvemos solo el tag.
-            if "responses" not in intent:
-                return tag, None
-            # Si tiene respuestas, devolvemos una aleatoria
-            return tag, random.choice(intent["responses"])
+
+    if chatbot_model.version != _cached_version:
+        _predict_tag.cache_clear()
+        _cached_version = chatbot_model.version
+
+    start = time.perf_counter()
+
+    # Predecir la etiqueta (desde la caché si el mensaje ya se vio antes)
+    tag = _predict_tag(chatbot_model, normalize_message(text))
+
+    latency_histograms['total'].observe((time.perf_counter() - start) * 1000)
+
+    # Encontrar la respuesta estática para el tag predicho
+    intent = chatbot_model.intents_by_tag.get(tag)
+    if intent is not None:
+        # Si el tag es de un negocio, devolvemos solo el tag.
+        if "responses" not in intent:
+            return tag, None
+        # Si tiene respuestas, devolvemos una aleatoria
+        return tag, random.choice(intent["responses"])
 
     # Si no se encuentra un tag válido (o por si acaso)
-    return "desconocido", "Lo siento, no entendí tu pregunta. ¿Puedes reformularla?"
\ No newline at end of file
+    return "desconocido", "Lo siento, no entendí tu pregunta. ¿Puedes reformularla?"
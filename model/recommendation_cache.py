@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class InMemoryBackend:
+    """
+    Almacén en proceso con expiración (TTL) y desalojo LRU con tamaño máximo.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Almacén compartido entre workers de gunicorn sobre un Redis local (o compatible).
+    El desalojo LRU lo hace el propio servidor (maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, url, ttl_seconds=600, prefix='recomendaciones:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Para usar RECOMMENDATION_CACHE_URL instala el paquete 'redis'.")
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    @property
+    def evictions(self):
+        # Claves desalojadas por el servidor (INFO stats): cuenta todo Redis, no solo este prefijo
+        return self._client.info('stats').get('evicted_keys', 0)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl_seconds)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + '*'))
+
+
+class RecommendationCache:
+    """
+    Caché de recomendaciones por usuario y versión del modelo.
+
+    La clave incluye la versión del índice de vecinos en disco (la misma en todos los workers que
+    la cargaron), así que publicar un modelo nuevo invalida las recomendaciones anteriores sin
+    recorrer el almacén y un worker nunca sirve las de una versión que no es la suya.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Los contadores se actualizan desde varios hilos ('+=' no es atómico)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, model_version):
+        value = self.backend.get(_cache_key(user_id, model_version))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, user_id, model_version, value):
+        self.backend.set(_cache_key(user_id, model_version), value)
+
+    def invalidate_user(self, user_id, model_version):
+        """
+        Elimina las recomendaciones de un usuario con una versión del modelo (por ejemplo,
+        cuando valora un negocio).
+        """
+        self.backend.delete(_cache_key(user_id, model_version))
+
+    def on_model_published(self, snapshot):
+        """
+        Libera la memoria de las entradas de versiones anteriores del modelo. En Redis no hace
+        falta: las claves de otras versiones ya no se consultan y expiran con su TTL.
+        """
+        if isinstance(self.backend, InMemoryBackend):
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'evictions': self.backend.evictions,
+        }
+
+
+def _cache_key(user_id, model_version):
+    return f'{model_version}:{user_id}'
+
+def create_recommendation_cache():
+    """
+    Crea la caché según el entorno: Redis si RECOMMENDATION_CACHE_URL está definida,
+    si no, un almacén en memoria del proceso.
+    """
+    ttl_seconds = int(os.getenv('RECOMMENDATION_CACHE_TTL', 600))
+    redis_url = os.getenv('RECOMMENDATION_CACHE_URL')
+    if redis_url:
+        backend = RedisBackend(redis_url, ttl_seconds=ttl_seconds)
+    else:
+        backend = InMemoryBackend(
+            max_entries=int(os.getenv('RECOMMENDATION_CACHE_SIZE', 10000)),
+            ttl_seconds=ttl_seconds
+        )
+    return RecommendationCache(backend)
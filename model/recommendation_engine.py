@@ -1,88 +1,428 @@
-import pandas as pd
+import asyncio
+import heapq
+import numpy as np
 import os
-from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
-from pymongo import MongoClient
+from datetime import datetime, timezone
+# scipy se importa dentro de las funciones que lo usan: importar este módulo al arrancar no paga su carga
 
-load_dotenv()
-mongo_uri = os.getenv('MONGO_URI')
-if not mongo_uri:
-    raise ValueError("No se ha definido la variable de entorno MONGO_URI.")
-    
-client = MongoClient(mongo_uri) 
-db = client[os.getenv('MONGO_DB_NAME')] # El nombre de la base de datos también se lee desde .env
+# Conexión a la base de datos MongoDB (cliente compartido; se conecta en el primer uso)
+from db.connection import db
+from db.serializers import BUSINESS_SUMMARY_PROJECTION
+from metrics import span
 
-# Conexión a la base de datos MongoDB
-#client = MongoClient('mongodb://localhost:27017/') # Cambia esta URL si tu MongoDB no está en local
-#db = client['el_carmen_tourism'] # Nombre de tu base de datos
+# Número de vecinos más similares que se guardan por negocio
+TOP_K_NEIGHBORS = int(os.getenv('RECOMMENDER_TOP_K', 50))
 
-def train_model():
+# Negocios procesados por bloque al calcular similitudes (limita la memoria usada)
+SIMILARITY_BLOCK_SIZE = 256
+
+# Peso de la similitud por contenido (model/content_index.py) al mezclarla con la colaborativa
+CONTENT_BLEND_WEIGHT = float(os.getenv('RECOMMENDER_CONTENT_WEIGHT', 0.3))
+
+class NeighborIndex:
+    """
+    Índice compacto con los k negocios más similares a cada negocio.
+
+    'neighbors' y 'scores' son arreglos (n, k) indexados por posición; la fila i corresponde
+    a item_ids[i]. Los huecos se rellenan con -1 y similitud 0. 'norms' guarda la norma de
+    cada negocio en la matriz usuario-ítem (permite actualizar el índice sin recalcularlo todo).
+    """
+
+    def __init__(self, item_ids, neighbors, scores, norms=None):
+        self.item_ids = list(item_ids)
+        self.neighbors = neighbors
+        self.scores = scores
+        self.norms = norms if norms is not None else np.zeros(len(self.item_ids), dtype=np.float64)
+        self.item_index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self._similarity_matrix = None
+
+    @classmethod
+    def empty(cls, top_k=TOP_K_NEIGHBORS):
+        return cls([], np.full((0, top_k), -1, dtype=np.int32), np.zeros((0, top_k), dtype=np.float32),
+                   np.zeros(0, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __contains__(self, item_id):
+        return item_id in self.item_index
+
+    @property
+    def similarity_matrix(self):
+        """
+        Matriz dispersa (CSR) n×n con las similitudes de los k vecinos; se construye una sola vez.
+        """
+        if self._similarity_matrix is None:
+            from scipy import sparse
+            n_items, top_k = self.neighbors.shape
+            valid = self.neighbors >= 0
+            rows = np.repeat(np.arange(n_items, dtype=np.int32), top_k).reshape(n_items, top_k)[valid]
+            self._similarity_matrix = sparse.csr_matrix(
+                (self.scores[valid], (rows, self.neighbors[valid])), shape=(n_items, n_items)
+            )
+        return self._similarity_matrix
+
+    def similar_items(self, item_id):
+        """
+        Devuelve los vecinos de un negocio como lista de (negocio_id, similitud), de mayor a menor.
+        """
+        row = self.item_index.get(item_id)
+        if row is None:
+            return []
+        return [
+            (self.item_ids[j], float(s))
+            for j, s in zip(self.neighbors[row], self.scores[row]) if j >= 0
+        ]
+
+
+def load_ratings():
     """
-    Carga los datos de valoraciones de la base de datos y calcula la matriz de similitud.
+    Carga las valoraciones con solo los campos que necesita el recomendador.
     """
+    return list(db.valoraciones.find({}, {'_id': 0, 'usuario_id': 1, 'negocio_id': 1, 'puntuacion': 1}))
+
+def build_user_item_matrix(ratings_data):
+    """
+    Construye la matriz dispersa (CSR) usuario-ítem a partir de las valoraciones.
+    Devuelve la matriz, la lista de usuarios (filas) y la lista de negocios (columnas).
+    """
+    from scipy import sparse
+    user_index = {}
+    item_index = {}
+    ratings = {}
+    for r in ratings_data:
+        # Si hay valoraciones repetidas de un mismo usuario/negocio se queda la última
+        key = (user_index.setdefault(r['usuario_id'], len(user_index)),
+               item_index.setdefault(r['negocio_id'], len(item_index)))
+        ratings[key] = r['puntuacion']
+
+    rows = np.fromiter((key[0] for key in ratings), dtype=np.int32, count=len(ratings))
+    cols = np.fromiter((key[1] for key in ratings), dtype=np.int32, count=len(ratings))
+    values = np.fromiter(ratings.values(), dtype=np.float32, count=len(ratings))
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(user_index), len(item_index)))
+    return matrix, list(user_index), list(item_index)
+
+def item_norms(user_item_matrix):
+    """
+    Norma euclidiana de cada negocio (columna) de la matriz usuario-ítem.
+    """
+    return np.sqrt(np.asarray(user_item_matrix.multiply(user_item_matrix).sum(axis=0), dtype=np.float64)).ravel()
+
+def top_k_neighbors(user_item_matrix, top_k=TOP_K_NEIGHBORS, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Calcula la similitud del coseno entre negocios por bloques y guarda solo los k vecinos
+    más similares de cada uno. Nunca se materializa la matriz completa N×N.
+    """
+    from scipy import sparse
+    n_items = user_item_matrix.shape[1]
+    neighbors = np.full((n_items, top_k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, top_k), dtype=np.float32)
+    if n_items == 0:
+        return neighbors, scores
+
+    norms = item_norms(user_item_matrix)
+    inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = sparse.csc_matrix(user_item_matrix @ sparse.diags(inverse_norms))
+    normalized_t = sparse.csr_matrix(normalized.T)
+
+    k = min(top_k, n_items - 1)
+    for start in range(0, n_items, block_size):
+        end = min(start + block_size, n_items)
+        block = (normalized_t[start:end] @ normalized).toarray()
+        block[np.arange(end - start), np.arange(start, end)] = 0  # Excluir el mismo ítem
+        if k <= 0:
+            continue
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        valid = candidate_scores > 0
+        neighbors[start:end, :k] = np.where(valid, candidates, -1)
+        scores[start:end, :k] = np.where(valid, candidate_scores, 0)
+
+    return neighbors, scores
+
+@span('train_model')
+def train_model(top_k=TOP_K_NEIGHBORS, snapshot_dir=None):
+    """
+    Carga los datos de valoraciones de la base de datos y calcula el índice de vecinos similares.
+    Con snapshot_dir además lo guarda como una versión nueva en disco (ver model/similarity_store.py).
+    """
+    # Las valoraciones modificadas desde este momento quedan para la próxima actualización incremental
+    started_at = datetime.now(timezone.utc)
+
     # Cargar datos de valoraciones
-    ratings_data = list(db.valoraciones.find({}, {'_id': 0}))
+    ratings_data = load_ratings()
 
     if not ratings_data:
         print("No hay datos de valoraciones para entrenar el modelo.")
-        return None, None
+        index = NeighborIndex.empty(top_k)
+    else:
+        # Crear la matriz dispersa usuario-ítem y calcular los vecinos más similares
+        user_item_matrix, _, item_ids = build_user_item_matrix(ratings_data)
+        neighbors, scores = top_k_neighbors(user_item_matrix, top_k)
+        index = NeighborIndex(item_ids, neighbors, scores, item_norms(user_item_matrix))
+
+    if snapshot_dir:
+        from model.similarity_store import save_neighbor_index
+        save_neighbor_index(index, snapshot_dir, high_water_mark=started_at, ratings=len(ratings_data))
+    return index
+
+@span('update_neighbor_index')
+def update_neighbor_index(neighbor_index, since):
+    """
+    Aplica al índice las valoraciones guardadas desde 'since' (según 'escrito_en', la hora de
+    MongoDB al escribirlas) sin recalcularlo todo.
+
+    Solo se leen las valoraciones de los usuarios que valoraron los negocios afectados: con
+    ellas se recalculan exactamente la norma y los vecinos de esos negocios, y su similitud
+    dentro de las filas de los negocios relacionados (usando las normas guardadas). Si un
+    negocio afectado sale de una fila llena, el hueco no se rellena hasta la próxima
+    reconstrucción completa. Devuelve (índice nuevo, lista de negocios afectados).
+
+    Reemplaza a la actualización por deltas de cada valoración (IncrementalSimilarity): un
+    delta necesita la puntuación que el índice ya incluía, y aquí las valoraciones se releen
+    desde antes de la marca de agua, llegan desde spools reprocesados y las aplican varios
+    workers sobre el mismo índice compartido, así que un delta podría sumarse dos veces.
+    Recalcular las filas afectadas da el mismo resultado aunque se repita, y no obliga a
+    guardar los productos punto de todos los pares de negocios.
+    """
+    changed = db.valoraciones.distinct('negocio_id', {'escrito_en': {'$gte': since}})
+    if not changed:
+        return neighbor_index, []
+
+    raters = db.valoraciones.distinct('usuario_id', {'negocio_id': {'$in': changed}})
+    user_ratings = {}
+    for r in db.valoraciones.find({'usuario_id': {'$in': raters}}, {'_id': 0, 'usuario_id': 1, 'negocio_id': 1, 'puntuacion': 1}):
+        user_ratings.setdefault(r['usuario_id'], {})[r['negocio_id']] = r['puntuacion']
+
+    # Copia de los arreglos (los del índice pueden estar mapeados en solo lectura), con filas
+    # nuevas para los negocios que aún no estaban en el índice
+    item_ids = list(neighbor_index.item_ids)
+    position = dict(neighbor_index.item_index)
+    for item_id in changed:
+        if item_id not in position:
+            position[item_id] = len(item_ids)
+            item_ids.append(item_id)
+    n_old, top_k = neighbor_index.neighbors.shape
+    neighbors = np.full((len(item_ids), top_k), -1, dtype=np.int32)
+    scores = np.zeros((len(item_ids), top_k), dtype=np.float32)
+    norms = np.zeros(len(item_ids), dtype=np.float64)
+    neighbors[:n_old], scores[:n_old], norms[:n_old] = neighbor_index.neighbors, neighbor_index.scores, neighbor_index.norms
+
+    # Normas y productos punto de los negocios afectados (todos sus usuarios están en user_ratings)
+    changed_set = set(changed)
+    norms_sq = {item_id: 0.0 for item_id in changed}
+    dots = {item_id: {} for item_id in changed}
+    for ratings in user_ratings.values():
+        for item_id in changed_set.intersection(ratings):
+            value = ratings[item_id]
+            norms_sq[item_id] += value ** 2
+            row = dots[item_id]
+            for otro_id, otro_valor in ratings.items():
+                if otro_id != item_id:
+                    row[otro_id] = row.get(otro_id, 0) + value * otro_valor
+    for item_id in changed:
+        norms[position[item_id]] = np.sqrt(norms_sq[item_id])
+
+    def similarity(item_id, otro_id):
+        denominador = norms[position[item_id]] * norms[position[otro_id]]
+        return float(dots[item_id].get(otro_id, 0) / denominador) if denominador else 0.0
+
+    # Filas de los negocios afectados: se recalculan completas
+    for item_id in changed:
+        candidates = ((similarity(item_id, otro_id), position[otro_id]) for otro_id in dots[item_id])
+        best = heapq.nlargest(top_k, (c for c in candidates if c[0] > 0), key=lambda candidate: candidate[0])
+        i = position[item_id]
+        neighbors[i], scores[i] = -1, 0
+        for j, (score, otro) in enumerate(best):
+            neighbors[i, j], scores[i, j] = otro, score
+
+    # Filas de los demás negocios: se reemplaza la similitud con cada negocio afectado
+    changed_positions = np.array([position[item_id] for item_id in changed], dtype=np.int32)
+    related = {position[otro_id] for item_id in changed for otro_id in dots[item_id]}
+    related.update(np.nonzero(np.isin(neighbors[:n_old], changed_positions).any(axis=1))[0].tolist())
+    for row in related - set(changed_positions.tolist()):
+        otro_id = item_ids[row]
+        entries = {int(j): float(score) for j, score in zip(neighbors[row], scores[row]) if j >= 0}
+        for item_id in changed:
+            entries.pop(position[item_id], None)
+            score = similarity(item_id, otro_id)
+            if score > 0:
+                entries[position[item_id]] = score
+        best = heapq.nlargest(top_k, entries.items(), key=lambda entry: entry[1])
+        neighbors[row], scores[row] = -1, 0
+        for j, (otro, score) in enumerate(best):
+            neighbors[row, j], scores[row, j] = otro, score
+
+    return NeighborIndex(item_ids, neighbors, scores, norms), changed
+
+def _rated_matrix(item_index, rated_items_per_user):
+    # Matriz dispersa usuarios × negocios con un 1 en cada negocio valorado
+    from scipy import sparse
+    rows, cols = [], []
+    for row, rated_items in enumerate(rated_items_per_user):
+        for item_id in rated_items:
+            col = item_index.get(item_id)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
 
-    ratings_df = pd.DataFrame(ratings_data)
+    user_matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(rated_items_per_user), len(item_index))
+    )
+    user_matrix.data[:] = 1  # Un negocio repetido cuenta una sola vez
+    return user_matrix
 
-    # Crear la matriz de usuario-ítem (pivote)
-    user_item_matrix = ratings_df.pivot_table(index='usuario_id', columns='negocio_id', values='puntuacion')
+@span('score_users')
+def score_users(neighbor_index, rated_items_per_user, num_recommendations=5, content_index=None,
+                content_weight=CONTENT_BLEND_WEIGHT):
+    """
+    Calcula las recomendaciones de varios usuarios con un solo producto matriz dispersa.
+
+    rated_items_per_user es una lista con los negocios valorados por cada usuario. Para cada
+    uno devuelve los ids de los num_recommendations negocios no valorados con mayor puntuación
+    (suma de similitudes con los negocios que sí valoró).
+
+    Con content_index (model/content_index.py) la puntuación es
+    (1 - content_weight) · colaborativa + content_weight · contenido, sobre todo el catálogo:
+    así también se recomiendan negocios que todavía nadie valoró.
+    """
+    user_matrix = _rated_matrix(neighbor_index.item_index, rated_items_per_user)
+    scores = user_matrix @ neighbor_index.similarity_matrix
+    item_ids = neighbor_index.item_ids
+    if content_index is not None and len(content_index):
+        # Las puntuaciones colaborativas se pasan al espacio del índice de contenido y se mezclan
+        content_user_matrix = _rated_matrix(content_index.item_index, rated_items_per_user)
+        scores = (
+            (1 - content_weight) * (scores @ content_index.projection_from(neighbor_index))
+            + content_weight * (content_user_matrix @ content_index.similarity_matrix)
+        )
+        user_matrix, item_ids = content_user_matrix, content_index.item_ids
+    scores = scores.tocsr()
+
+    results = []
+    for row in range(len(rated_items_per_user)):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        candidates = scores.indices[start:end]
+        candidate_scores = scores.data[start:end]
 
-    # Rellenar los valores nulos con 0 para el cálculo de similitud
-    user_item_matrix.fillna(0, inplace=True)
+        # Descartar los negocios que el usuario ya valoró
+        rated = user_matrix.indices[user_matrix.indptr[row]:user_matrix.indptr[row + 1]]
+        keep = ~np.isin(candidates, rated) & (candidate_scores > 0)
+        candidates, candidate_scores = candidates[keep], candidate_scores[keep]
 
-    # Calcular la similitud del coseno entre negocios
-    item_similarity_matrix = cosine_similarity(user_item_matrix.T)
-    item_similarity_df = pd.DataFrame(item_similarity_matrix, index=user_item_matrix.columns, columns=user_item_matrix.columns)
+        # Selección parcial de los N mejores y orden solo de esos N
+        if len(candidates) > num_recommendations:
+            best = np.argpartition(-candidate_scores, num_recommendations - 1)[:num_recommendations]
+            candidates, candidate_scores = candidates[best], candidate_scores[best]
+        order = np.argsort(-candidate_scores, kind='stable')
+        results.append([item_ids[i] for i in candidates[order]])
 
-    return item_similarity_df
+    return results
 
-def recommend_for_user(user_id, item_similarity_df, num_recommendations=5):
+def _find_businesses(business_ids, content_index=None):
+    # Diccionario id -> negocio. Los que están en el índice de contenido ya están en memoria;
+    # solo se consultan en MongoDB los que falten (por ejemplo, negocios creados después)
+    businesses = {b['_id']: b for b in content_index.find(business_ids)} if content_index is not None else {}
+    missing = [business_id for business_id in business_ids if business_id not in businesses]
+    if missing:
+        businesses.update({b['_id']: b for b in db.negocios.find({'_id': {'$in': missing}}, BUSINESS_SUMMARY_PROJECTION)})
+    return businesses
+
+def _find_businesses_in_order(business_ids, content_index=None):
+    # '$in' no respeta el orden, así que se reordena según la puntuación calculada
+    businesses = _find_businesses(business_ids, content_index)
+    return [businesses[business_id] for business_id in business_ids if business_id in businesses]
+
+def find_top_rated(num_recommendations):
     """
-    Genera recomendaciones para un usuario específico.
+    Negocios con mayor promedio_ranking; se usa cuando no hay recomendaciones personalizadas.
+    """
+    return list(db.negocios.find({}, BUSINESS_SUMMARY_PROJECTION).sort('promedio_ranking', -1).limit(num_recommendations))
+
+@span('recommend_for_user')
+def recommend_for_user(user_id, neighbor_index, num_recommendations=5, top_rated=find_top_rated, content_index=None):
+    """
+    Genera recomendaciones para un usuario específico a partir del índice de vecinos.
+    'top_rated' devuelve los negocios mejor valorados (por ejemplo, desde una caché) para
+    los usuarios sin recomendaciones. Con content_index se mezclan las similitudes por
+    contenido y los negocios se leen del índice en memoria.
     """
     # Obtener las valoraciones del usuario
-    user_ratings = list(db.valoraciones.find({'usuario_id': user_id}))
+    user_ratings = list(db.valoraciones.find({'usuario_id': user_id}, {'_id': 0, 'negocio_id': 1}))
     if not user_ratings:
         print(f"Usuario {user_id} no tiene valoraciones.")
         # Devuelve los 5 negocios con mayor rating general
-        top_rated_businesses = list(db.negocios.find().sort('promedio_ranking', -1).limit(num_recommendations))
+        top_rated_businesses = top_rated(num_recommendations)
         return top_rated_businesses
 
     rated_items = [r['negocio_id'] for r in user_ratings]
 
-    # Crear un diccionario para almacenar las recomendaciones
-    recommendations = {}
+    # Puntuar todos los candidatos de una vez y obtener los datos de los negocios recomendados
+    recommended_business_ids = score_users(neighbor_index, [rated_items], num_recommendations, content_index)[0]
+    recommended_businesses = _find_businesses_in_order(recommended_business_ids, content_index)
 
-    for item_id in rated_items:
-        if item_id in item_similarity_df.columns:
-            # Obtener los negocios más similares
-            similar_items = item_similarity_df[item_id].sort_values(ascending=False).index[1:] # Excluir el mismo ítem
+    # Si no hay recomendaciones, devuelve los negocios con mayor rating
+    if not recommended_businesses:
+        top_rated_businesses = top_rated(num_recommendations)
+        return top_rated_businesses
 
-            for similar_item in similar_items:
-                if similar_item not in rated_items:
-                    # Sumar las puntuaciones de similitud para cada negocio no valorado
-                    if similar_item not in recommendations:
-                        recommendations[similar_item] = 0
-                    recommendations[similar_item] += item_similarity_df[item_id][similar_item]
+    return recommended_businesses
 
-    # Ordenar las recomendaciones por puntuación
-    sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+async def recommend_for_user_async(user_id, neighbor_index, async_db, top_rated, num_recommendations=5, executor=None,
+                                   content_index=None):
+    """
+    Versión de recommend_for_user para el driver asíncrono (async_app.py). Las consultas se
+    esperan sin bloquear el bucle de eventos y la puntuación, que usa CPU, corre en 'executor'.
+    'top_rated' es una corrutina que devuelve los negocios mejor valorados.
+    """
+    user_ratings = await async_db.valoraciones.find({'usuario_id': user_id}, {'_id': 0, 'negocio_id': 1}).to_list(None)
+    if not user_ratings:
+        return await top_rated(num_recommendations)
 
-    # Obtener los datos de los negocios recomendados
-    recommended_business_ids = [rec[0] for rec in sorted_recommendations[:num_recommendations]]
-    recommended_businesses = list(db.negocios.find({'_id': {'$in': recommended_business_ids}}))
+    rated_items = [r['negocio_id'] for r in user_ratings]
+    loop = asyncio.get_running_loop()
+    recommended_business_ids = (
+        await loop.run_in_executor(executor, score_users, neighbor_index, [rated_items], num_recommendations, content_index)
+    )[0]
 
-    # Si no hay recomendaciones, devuelve los negocios con mayor rating
+    businesses = {b['_id']: b for b in content_index.find(recommended_business_ids)} if content_index is not None else {}
+    missing = [business_id for business_id in recommended_business_ids if business_id not in businesses]
+    if missing:
+        businesses.update({
+            b['_id']: b async for b in async_db.negocios.find({'_id': {'$in': missing}}, BUSINESS_SUMMARY_PROJECTION)
+        })
+    recommended_businesses = [businesses[i] for i in recommended_business_ids if i in businesses]
     if not recommended_businesses:
-        top_rated_businesses = list(db.negocios.find().sort('promedio_ranking', -1).limit(num_recommendations))
-        return top_rated_businesses
-
+        return await top_rated(num_recommendations)
     return recommended_businesses
 
-# Entrenar el modelo al iniciar el servidor
-item_similarity_matrix = train_model()
+@span('recommend_for_users')
+def recommend_for_users(user_ids, neighbor_index, num_recommendations=5, top_rated=find_top_rated, content_index=None):
+    """
+    Genera las recomendaciones de muchos usuarios en una sola llamada (por ejemplo, para
+    precalcular los feeds de la página principal). Devuelve un diccionario usuario_id -> negocios.
+    """
+    user_ids = list(user_ids)
+    rated_items = {user_id: [] for user_id in user_ids}
+    for r in db.valoraciones.find({'usuario_id': {'$in': user_ids}}, {'_id': 0, 'usuario_id': 1, 'negocio_id': 1}):
+        rated_items[r['usuario_id']].append(r['negocio_id'])
+
+    scored = score_users(neighbor_index, [rated_items[user_id] for user_id in user_ids], num_recommendations, content_index)
+
+    # Una sola consulta para todos los negocios recomendados (o ninguna si están en el índice de contenido)
+    all_ids = list({business_id for business_ids in scored for business_id in business_ids})
+    businesses = _find_businesses(all_ids, content_index)
+
+    top_rated_businesses = None
+    results = {}
+    for user_id, business_ids in zip(user_ids, scored):
+        recommended = [businesses[business_id] for business_id in business_ids if business_id in businesses]
+        if not recommended:
+            if top_rated_businesses is None:
+                top_rated_businesses = top_rated(num_recommendations)
+            recommended = top_rated_businesses
+        results[user_id] = recommended
+    return results
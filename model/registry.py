@@ -0,0 +1,260 @@
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directorio absoluto con las versiones del modelo del chatbot: <MODEL_DIR>/<versión>/...
+MODEL_DIR = os.path.abspath(os.getenv('CHATBOT_MODEL_DIR', os.path.join(BASE_DIR, 'artifacts')))
+
+# Archivo del modelo anterior al registro (modelo, vectorizador y corpus en un pickle)
+LEGACY_PICKLE = os.path.join(BASE_DIR, 'model.pkl')
+
+# Archivo con el nombre de la versión activa
+CURRENT_FILE = 'CURRENT'
+
+# Parámetros del vectorizador que se guardan en el manifiesto
+VECTORIZER_PARAMS = ('analyzer', 'binary', 'lowercase', 'ngram_range', 'strip_accents', 'token_pattern')
+
+
+class ChatbotModel:
+    """
+    Clasificador lineal del chatbot listo para predecir.
+
+    Los coeficientes se cargan con np.load(mmap_mode='r'), así que varios workers de gunicorn
+    comparten las mismas páginas de memoria del archivo en lugar de tener una copia cada uno.
+    """
+
+    def __init__(self, version, vectorizer, coef, intercept, classes, corpus, load_seconds=0.0, source=''):
+        self.version = version
+        self.vectorizer = vectorizer
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = np.asarray(classes)
+        self.corpus = corpus
+        self.intents_by_tag = {intent['tag']: intent for intent in corpus}
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.source = source
+
+    def transform(self, texts):
+        return self.vectorizer.transform(texts)
+
+    def predict_vectors(self, X_vec):
+        scores = X_vec @ self.coef.T + self.intercept
+        if scores.shape[1] == 1:
+            # Clasificación binaria: una sola columna de decisión
+            return list(self.classes[(scores[:, 0] > 0).astype(int)])
+        return list(self.classes[np.asarray(scores).argmax(axis=1)])
+
+    def predict(self, texts):
+        return self.predict_vectors(self.transform(texts))
+
+
+def build_vectorizer(config, vocabulary_terms=None):
+    """
+    Reconstruye el vectorizador a partir del manifiesto (no hace falta volver a entrenarlo).
+    """
+    # scikit-learn tarda en importarse; solo se carga cuando hay un modelo que usar
+    from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+    params = {key: config[key] for key in VECTORIZER_PARAMS if key in config}
+    if 'ngram_range' in params:
+        params['ngram_range'] = tuple(params['ngram_range'])
+    if config['kind'] == 'hashing':
+        return HashingVectorizer(
+            n_features=config['n_features'], alternate_sign=config.get('alternate_sign', False),
+            norm=config.get('norm'), **params
+        )
+    vocabulary = {str(term): i for i, term in enumerate(vocabulary_terms)}
+    return CountVectorizer(vocabulary=vocabulary, **params)
+
+def save_artifact(version, vectorizer_config, coef, intercept, classes, corpus,
+                  vocabulary_terms=None, metadata=None, directory=MODEL_DIR):
+    """
+    Escribe una versión nueva del modelo. Se escribe en un directorio temporal y se renombra
+    al final, de modo que nunca se lee una versión a medio escribir.
+    """
+    os.makedirs(directory, exist_ok=True)
+    final_path = os.path.join(directory, version)
+    tmp_path = os.path.join(directory, f'.{version}.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, 'coef.npy'), np.ascontiguousarray(coef, dtype=np.float64))
+    np.save(os.path.join(tmp_path, 'intercept.npy'), np.asarray(intercept, dtype=np.float64))
+    if vocabulary_terms is not None:
+        np.save(os.path.join(tmp_path, 'vocabulary.npy'), np.asarray(vocabulary_terms, dtype=str))
+
+    with open(os.path.join(tmp_path, 'corpus.json'), 'w', encoding='utf-8') as f:
+        json.dump([{k: v for k, v in intent.items() if k != '_id'} for intent in corpus], f, ensure_ascii=False)
+
+    manifest = {
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'vectorizer': vectorizer_config,
+        'classes': [str(c) for c in classes],
+        **(metadata or {})
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(final_path):
+        shutil.rmtree(final_path)
+    os.replace(tmp_path, final_path)
+    return final_path
+
+def load_artifact(path):
+    """
+    Carga una versión del modelo desde su directorio con los coeficientes mapeados en memoria.
+    """
+    start = time.perf_counter()
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    with open(os.path.join(path, 'corpus.json'), encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    vocabulary_path = os.path.join(path, 'vocabulary.npy')
+    vocabulary_terms = np.load(vocabulary_path) if os.path.exists(vocabulary_path) else None
+    vectorizer = build_vectorizer(manifest['vectorizer'], vocabulary_terms)
+
+    coef = np.load(os.path.join(path, 'coef.npy'), mmap_mode='r')
+    intercept = np.load(os.path.join(path, 'intercept.npy'))
+    return ChatbotModel(
+        manifest['version'], vectorizer, coef, intercept, manifest['classes'], corpus,
+        load_seconds=time.perf_counter() - start, source=path
+    )
+
+def new_version_name():
+    """
+    Nombre único y ordenable para una versión nueva (fecha, hora y microsegundos).
+    """
+    return datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+def set_current_version(version, directory=MODEL_DIR):
+    """
+    Marca una versión como activa reemplazando el archivo CURRENT de forma atómica.
+    """
+    tmp_path = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+def get_current_version(directory=MODEL_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_legacy_pickle(path=LEGACY_PICKLE):
+    """
+    Carga el model.pkl anterior (SGDClassifier + CountVectorizer + corpus).
+    """
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        classifier, vectorizer, corpus = pickle.load(f)
+    return ChatbotModel(
+        'legacy', vectorizer, classifier.coef_, classifier.intercept_, classifier.classes_, corpus,
+        load_seconds=time.perf_counter() - start, source=path
+    )
+
+def import_legacy_pickle(path=LEGACY_PICKLE, directory=MODEL_DIR):
+    """
+    Convierte el model.pkl anterior en una versión del registro y la activa.
+    """
+    legacy = load_legacy_pickle(path)
+    vocabulary = legacy.vectorizer.vocabulary_
+    vocabulary_terms = sorted(vocabulary, key=vocabulary.get)
+    config = {'kind': 'count', **{key: legacy.vectorizer.get_params()[key] for key in VECTORIZER_PARAMS}}
+    version = new_version_name()
+    save_artifact(
+        version, config, legacy.coef, legacy.intercept, legacy.classes, legacy.corpus,
+        vocabulary_terms=vocabulary_terms, metadata={'origen': os.path.abspath(path)}, directory=directory
+    )
+    set_current_version(version, directory)
+    return version
+
+
+class ModelRegistry:
+    """
+    Mantiene la versión activa del modelo del chatbot y la cambia en caliente.
+
+    Cada poll_interval segundos revisa el archivo CURRENT; si apunta a otra versión la carga
+    y reemplaza la referencia. Las peticiones en curso terminan con el modelo que ya tenían.
+    """
+
+    def __init__(self, directory=MODEL_DIR, poll_interval=30):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.last_error = None
+        self._model = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Devuelve el modelo activo (o None si no hay ninguno disponible).
+        """
+        # Si todavía no hay modelo (carga en segundo plano en curso) se espera a esa carga;
+        # si la carga falló, se reintenta solo cada poll_interval segundos
+        if (self._model is None and self.last_error is None) or time.time() - self._checked_at >= self.poll_interval:
+            self.reload_if_changed()
+        return self._model
+
+    def load(self, version=None):
+        """
+        Carga una versión (por defecto la de CURRENT) y la activa. Si el registro está vacío
+        usa el model.pkl anterior.
+        """
+        with self._lock:
+            self._checked_at = time.time()
+            version = version or get_current_version(self.directory)
+            if self._model is not None and self._model.version == (version or 'legacy'):
+                # Otro hilo ya la cargó mientras se esperaba el bloqueo
+                return self._model
+            try:
+                if version:
+                    model = load_artifact(os.path.join(self.directory, version))
+                else:
+                    print(f"Aviso: no hay versiones en '{self.directory}'; se usa '{LEGACY_PICKLE}'.")
+                    model = load_legacy_pickle()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error al cargar el modelo del chatbot ({version or LEGACY_PICKLE}): {e}")
+                return self._model
+            self._model = model
+            self.last_error = None
+            print(f"Modelo del chatbot '{model.version}' cargado en {model.load_seconds * 1000:.1f} ms.")
+            return model
+
+    def reload_if_changed(self):
+        self._checked_at = time.time()
+        version = get_current_version(self.directory)
+        if self._model is None or (version and version != self._model.version):
+            self.load(version)
+
+    def status(self):
+        model = self._model
+        return {
+            'available': model is not None,
+            'version': model.version if model else None,
+            'source': model.source if model else None,
+            'load_ms': round(model.load_seconds * 1000, 3) if model else None,
+            'loaded_at': datetime.fromtimestamp(model.loaded_at).isoformat() if model else None,
+            'directory': self.directory,
+            'last_error': self.last_error
+        }
+
+
+if __name__ == '__main__':
+    # python -m model.registry [ruta/al/model.pkl] -> importa el pickle como versión activa
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else LEGACY_PICKLE
+    version = import_legacy_pickle(pickle_path)
+    print(f"Modelo importado como versión '{version}' en '{MODEL_DIR}'.")
@@ -0,0 +1,121 @@
+import math
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+
+from db.serializers import BUSINESS_SUMMARY_PROJECTION
+
+# Palabras muy comunes en español que no aportan a la búsqueda
+STOPWORDS = {
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'es', 'la', 'las', 'lo', 'los',
+    'para', 'por', 'que', 'se', 'su', 'un', 'una', 'y'
+}
+
+# Peso de cada campo del negocio al indexar
+FIELD_WEIGHTS = {'nombre': 3.0, 'categoria': 2.0, 'descripcion': 1.0}
+
+# Campos que se guardan de cada negocio para devolver resultados sin ir a la base de datos
+SEARCH_PROJECTION = {**BUSINESS_SUMMARY_PROJECTION, 'descripcion': 1}
+
+# Factor aplicado a los términos que solo coinciden por prefijo
+PREFIX_MATCH_FACTOR = 0.7
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(text):
+    """
+    Pasa el texto a minúsculas y elimina tildes ('Turísticos' -> 'turisticos').
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(normalize_text(text)) if token not in STOPWORDS]
+
+
+class SearchIndex:
+    """
+    Índice invertido en memoria sobre nombre, categoría y descripción de los negocios.
+
+    Los resultados se ordenan por relevancia (tf-idf ponderado por campo) mezclada con el
+    promedio_ranking. Cada palabra de la consulta se busca también como prefijo para poder
+    sugerir resultados mientras el usuario escribe ('cul' encuentra 'cultura').
+    """
+
+    def __init__(self, negocios, ranking_weight=0.3):
+        self.ranking_weight = ranking_weight
+        self.built_at = time.time()
+        self.documents = list(negocios)
+        self.postings = {}  # término -> {posición del documento: peso}
+
+        for position, negocio in enumerate(self.documents):
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(negocio.get(field, '')):
+                    postings = self.postings.setdefault(token, {})
+                    postings[position] = postings.get(position, 0) + weight
+
+        n_documents = max(len(self.documents), 1)
+        self.idf = {
+            term: math.log(1 + n_documents / len(postings)) for term, postings in self.postings.items()
+        }
+        self.vocabulary = sorted(self.postings)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query, limit=10, prefix=True):
+        """
+        Devuelve los negocios que contienen todas las palabras de la consulta, ordenados.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        scores = None
+        for token in tokens:
+            terms = self._prefix_terms(token) if prefix else [token] if token in self.postings else []
+
+            token_scores = {}
+            for term in terms:
+                # Una coincidencia exacta pesa más que una por prefijo
+                idf = self.idf[term] * (1.0 if term == token else PREFIX_MATCH_FACTOR)
+                for position, weight in self.postings[term].items():
+                    token_scores[position] = max(token_scores.get(position, 0), weight * idf)
+
+            # Todas las palabras deben aparecer en el negocio
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {position: scores[position] + s for position, s in token_scores.items() if position in scores}
+            if not scores:
+                return []
+
+        best = max(scores.values())
+        ranked = sorted(
+            scores,
+            key=lambda position: self._blend(scores[position] / best, self.documents[position]),
+            reverse=True
+        )
+        return [self.documents[position] for position in ranked[:limit]]
+
+    def _prefix_terms(self, prefix):
+        # El vocabulario está ordenado: los términos con el prefijo son contiguos
+        terms = []
+        i = bisect_left(self.vocabulary, prefix)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            terms.append(self.vocabulary[i])
+            i += 1
+        return terms
+
+    def _blend(self, relevance, negocio):
+        ranking = (negocio.get('promedio_ranking') or 0) / 5
+        return (1 - self.ranking_weight) * relevance + self.ranking_weight * ranking
+
+
+def build_search_index(db):
+    """
+    Construye el índice de búsqueda a partir de la colección 'negocios'.
+    """
+    return SearchIndex(db.negocios.find({}, SEARCH_PROJECTION))
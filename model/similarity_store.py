@@ -0,0 +1,332 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson import json_util
+from bson.objectid import ObjectId
+
+from db.connection import db
+from metrics import span
+from model.content_index import ContentIndex, build_content_index
+from model.recommendation_engine import NeighborIndex, train_model, update_neighbor_index
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directorio compartido por los workers con los índices de vecinos ya calculados
+SNAPSHOT_DIR = os.path.abspath(os.getenv('RECOMMENDER_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshots')))
+
+# Antigüedad máxima (en segundos) de un índice guardado para usarlo al arrancar
+SNAPSHOT_MAX_AGE = int(os.getenv('RECOMMENDER_SNAPSHOT_MAX_AGE', 3600))
+
+# La marca de agua se compara con 'escrito_en', la hora de MongoDB al guardar cada valoración (no
+# la del evento, que puede llegar tarde desde un spool). Se relee desde un poco antes por si el
+# reloj de este servidor y el de MongoDB no están sincronizados (aplicar una de nuevo no cambia nada)
+HIGH_WATER_MARK_MARGIN = int(os.getenv('RECOMMENDER_SNAPSHOT_MARGIN', 60))
+
+# Versiones que se conservan en disco (la actual y las anteriores más recientes)
+SNAPSHOT_KEEP_VERSIONS = 3
+
+# Archivo con el nombre de la versión más reciente y archivo de bloqueo para construirla
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.build.lock'
+
+# Formato de los archivos; una versión con otro formato se descarta y se reconstruye
+SNAPSHOT_FORMAT = 2
+ARRAY_FILES = ('item_ids.npy', 'neighbors.npy', 'scores.npy', 'norms.npy')
+
+# Subdirectorio con las versiones del índice de contenido (model/content_index.py), con su
+# propio CURRENT y bloqueo, y antigüedad máxima (en segundos) antes de reconstruirlo
+CONTENT_SUBDIR = 'content'
+CONTENT_MAX_AGE = int(os.getenv('CONTENT_INDEX_TTL', 600))
+CONTENT_FILES = ('documents.json', 'neighbors.npy', 'scores.npy')
+
+
+def save_neighbor_index(index, directory=SNAPSHOT_DIR, high_water_mark=None, parent=None, ratings=None,
+                        full_built_at=None):
+    """
+    Guarda un NeighborIndex como una versión nueva y la marca como actual: ids de los negocios,
+    arreglos de vecinos y similitudes y normas por negocio en .npy, más un manifiesto con la
+    suma SHA-256 de cada archivo y la marca de agua (fecha hasta la que llegan las valoraciones
+    incluidas). Se escribe en un directorio temporal y se renombra al final.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    tmp_path = os.path.join(directory, f'.{version}.tmp')
+    os.makedirs(tmp_path)
+
+    object_ids = all(isinstance(item_id, ObjectId) for item_id in index.item_ids)
+    np.save(os.path.join(tmp_path, 'item_ids.npy'), np.array([str(item_id) for item_id in index.item_ids], dtype=str))
+    np.save(os.path.join(tmp_path, 'neighbors.npy'), np.ascontiguousarray(index.neighbors, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'scores.npy'), np.ascontiguousarray(index.scores, dtype=np.float32))
+    np.save(os.path.join(tmp_path, 'norms.npy'), np.ascontiguousarray(index.norms, dtype=np.float64))
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'parent': parent,
+        'built_at': time.time(),
+        # Fecha de la última reconstrucción completa; las actualizaciones incrementales la heredan
+        'full_built_at': full_built_at or time.time(),
+        'high_water_mark': high_water_mark.isoformat() if high_water_mark else None,
+        'item_id_type': 'objectid' if object_ids else 'str',
+        'items': len(index),
+        'ratings': ratings,
+        'top_k': int(index.neighbors.shape[1]),
+        'checksums': {name: _file_checksum(os.path.join(tmp_path, name)) for name in ARRAY_FILES}
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_path, os.path.join(directory, version))
+    _set_current_version(version, directory)
+    return version
+
+def load_neighbor_index(path, verify=True):
+    """
+    Carga una versión guardada. Los arreglos se mapean en memoria (solo lectura), así que
+    todos los workers comparten las mismas páginas del archivo. Lanza ValueError si el
+    formato no coincide o si una suma de verificación no corresponde.
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"formato {manifest.get('format')} no soportado")
+    if verify:
+        for name, checksum in manifest['checksums'].items():
+            if _file_checksum(os.path.join(path, name)) != checksum:
+                raise ValueError(f"la suma de verificación de '{name}' no coincide")
+    item_ids = np.load(os.path.join(path, 'item_ids.npy'))
+    if manifest['item_id_type'] == 'objectid':
+        item_ids = [ObjectId(item_id) for item_id in item_ids]
+    else:
+        item_ids = [str(item_id) for item_id in item_ids]
+    neighbors = np.load(os.path.join(path, 'neighbors.npy'), mmap_mode='r')
+    scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+    norms = np.load(os.path.join(path, 'norms.npy'), mmap_mode='r')
+    return NeighborIndex(item_ids, neighbors, scores, norms), manifest
+
+def load_current(directory=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE):
+    """
+    Devuelve (índice, manifiesto) de la versión actual si existe y su última reconstrucción
+    completa no es más antigua que max_age.
+    """
+    version = get_current_version(directory)
+    if not version:
+        return None, None
+    try:
+        index, manifest = load_neighbor_index(os.path.join(directory, version))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Aviso: no se pudo leer el índice de vecinos '{version}': {e}")
+        return None, None
+    if time.time() - manifest['full_built_at'] > max_age:
+        return None, None
+    return index, manifest
+
+def resume(index, manifest, directory=SNAPSHOT_DIR):
+    """
+    Aplica las valoraciones modificadas desde la marca de agua de una versión y, si hubo
+    cambios, guarda el resultado como una versión nueva. Devuelve (índice, manifiesto) al día.
+    """
+    if not manifest.get('high_water_mark'):
+        return index, manifest
+    since = datetime.fromisoformat(manifest['high_water_mark']) - timedelta(seconds=HIGH_WATER_MARK_MARGIN)
+    started_at = datetime.now(timezone.utc)
+    updated, changed = update_neighbor_index(index, since)
+    if not changed:
+        return index, manifest
+    version = save_neighbor_index(
+        updated, directory, high_water_mark=started_at, parent=manifest['version'], ratings=manifest.get('ratings'),
+        full_built_at=manifest['full_built_at']
+    )
+    print(f"Índice de vecinos '{version}': {len(changed)} negocios actualizados desde '{manifest['version']}'.")
+    _remove_old_versions(directory)
+    return load_neighbor_index(os.path.join(directory, version), verify=False)
+
+@span('load_or_build')
+def load_or_build(build=train_model, directory=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE):
+    """
+    Carga el índice compartido al día con las últimas valoraciones o, si no hay uno con
+    menos de max_age segundos, lo construye con build() y lo guarda. Devuelve (índice, manifiesto).
+
+    Un bloqueo de archivo hace que un solo worker lo construya o actualice; los demás esperan
+    y después mapean en memoria la misma versión en lugar de repetir el cálculo.
+    """
+    return refresh(None, None, build, directory, max_age)
+
+@span('refresh_neighbor_index')
+def refresh(index, manifest, build=train_model, directory=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE, full=False):
+    """
+    Pone al día un índice ya cargado (con su manifiesto) y devuelve (índice, manifiesto).
+
+    Si otro proceso guardó una versión más nueva se parte de esa; si no, se reutiliza el índice
+    recibido sin volver a leerlo. Las valoraciones posteriores a la marca de agua se aplican con
+    update_neighbor_index y el resultado se guarda como versión nueva, todo bajo el bloqueo de
+    archivo. Con full=True, o si la última reconstrucción completa tiene más de max_age segundos,
+    se reconstruye desde cero con build().
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _build_lock(directory):
+        if not full:
+            if manifest is None or get_current_version(directory) != manifest['version']:
+                index, manifest = load_current(directory, max_age)
+            elif time.time() - manifest['full_built_at'] > max_age:
+                index = None
+            if index is not None:
+                return resume(index, manifest, directory)
+
+        started_at = datetime.now(timezone.utc)
+        version = save_neighbor_index(build(), directory, high_water_mark=started_at)
+        _remove_old_versions(directory)
+        return load_neighbor_index(os.path.join(directory, version), verify=False)
+
+def save_content_index(index, directory):
+    """
+    Guarda un ContentIndex como una versión nueva y la marca como actual: vecinos y similitudes
+    en .npy y los documentos de los negocios en JSON extendido (conserva los ObjectId).
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    tmp_path = os.path.join(directory, f'.{version}.tmp')
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, 'neighbors.npy'), np.ascontiguousarray(index.neighbors, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'scores.npy'), np.ascontiguousarray(index.scores, dtype=np.float32))
+    with open(os.path.join(tmp_path, 'documents.json'), 'w', encoding='utf-8') as f:
+        f.write(json_util.dumps(index.documents))
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'built_at': index.built_at,
+        'items': len(index),
+        'top_k': int(index.neighbors.shape[1]),
+        'checksums': {name: _file_checksum(os.path.join(tmp_path, name)) for name in CONTENT_FILES}
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_path, os.path.join(directory, version))
+    _set_current_version(version, directory)
+    return version
+
+def load_content_index(path, verify=True):
+    """
+    Carga una versión guardada del índice de contenido (los arreglos, mapeados en memoria).
+    Lanza ValueError si el formato no coincide o si una suma de verificación no corresponde.
+    """
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"formato {manifest.get('format')} no soportado")
+    if verify:
+        for name, checksum in manifest['checksums'].items():
+            if _file_checksum(os.path.join(path, name)) != checksum:
+                raise ValueError(f"la suma de verificación de '{name}' no coincide")
+    with open(os.path.join(path, 'documents.json'), encoding='utf-8') as f:
+        documents = json_util.loads(f.read())
+    neighbors = np.load(os.path.join(path, 'neighbors.npy'), mmap_mode='r')
+    scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+    return ContentIndex.from_arrays(documents, neighbors, scores, manifest['built_at'], manifest['version'])
+
+@span('refresh_content_index')
+def refresh_content_index(index=None, directory=SNAPSHOT_DIR, max_age=CONTENT_MAX_AGE, build=None):
+    """
+    Devuelve el índice de contenido compartido, con menos de max_age segundos. Si 'index' ya es
+    la versión actual en disco se devuelve sin leer nada; si otro proceso guardó una más nueva
+    se carga, y si no hay ninguna reciente se construye con build() (por defecto, desde
+    'negocios') y se guarda. Un bloqueo de archivo hace que un solo proceso lo construya.
+    """
+    directory = os.path.join(directory, CONTENT_SUBDIR)
+    current = _current_content_index(index, directory, max_age)
+    if current is not None:
+        return current
+    os.makedirs(directory, exist_ok=True)
+    with _build_lock(directory):
+        # Otro proceso pudo guardarlo mientras se esperaba el bloqueo
+        current = _current_content_index(index, directory, max_age)
+        if current is not None:
+            return current
+        version = save_content_index(build() if build else build_content_index(db), directory)
+        _remove_old_versions(directory)
+        return load_content_index(os.path.join(directory, version), verify=False)
+
+def _current_content_index(index, directory, max_age):
+    version = get_current_version(directory)
+    if not version:
+        return None
+    if index is None or index.version != version:
+        try:
+            index = load_content_index(os.path.join(directory, version))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Aviso: no se pudo leer el índice de contenido '{version}': {e}")
+            return None
+    return index if time.time() - index.built_at <= max_age else None
+
+@contextmanager
+def _build_lock(directory):
+    try:
+        import fcntl
+    except ImportError:
+        # Sin fcntl (Windows) cada proceso construye su propio índice
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _set_current_version(version, directory):
+    tmp_path = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+def get_current_version(directory=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _remove_old_versions(directory, keep=SNAPSHOT_KEEP_VERSIONS):
+    # Se conservan las 'keep' versiones más recientes (los nombres se ordenan por fecha). Los
+    # procesos que aún mapean una versión borrada conservan sus páginas hasta cerrarla.
+    names = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    versions = [name for name in names if not name.startswith('.') and name != CONTENT_SUBDIR]
+    for name in versions[:-keep] + [name for name in names if name.startswith('.')]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # Actualiza (o reconstruye con --full) el índice compartido, por ejemplo desde un cron
+    parser = argparse.ArgumentParser(description="Construye o actualiza los índices de vecinos y de contenido en disco.")
+    parser.add_argument('--full', action='store_true', help="Reconstruye los índices desde cero.")
+    parser.add_argument('--directory', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.full:
+        os.makedirs(args.directory, exist_ok=True)
+        with _build_lock(args.directory):
+            train_model(snapshot_dir=args.directory)
+            _remove_old_versions(args.directory)
+    else:
+        load_or_build(directory=args.directory, max_age=float('inf'))
+    content_index = refresh_content_index(directory=args.directory, max_age=0 if args.full else CONTENT_MAX_AGE)
+    print(f"Índice de vecinos '{get_current_version(args.directory)}' y de contenido '{content_index.version}' "
+          f"listos en {time.perf_counter() - start:.2f} s.")
@@ -0,0 +1,201 @@
+"""
+Entrenamiento del modelo del chatbot a partir de la colección 'corpus'.
+
+    python -m model.train_chatbot            # solo si algún intent cambió desde la versión activa
+    python -m model.train_chatbot --full     # reentrena aunque nada haya cambiado
+
+Los patrones se leen con un cursor y se vectorizan con un HashingVectorizer (sin vocabulario
+que ajustar), así que el clasificador se entrena por lotes con partial_fit sin cargar todo el
+corpus en memoria. Siempre se entrena con todos los ejemplos: en un SGD uno-contra-todos, pasar
+solo los de los intents cambiados haría que las demás clases vieran únicamente negativos. El
+resultado se guarda como una versión nueva del registro de modelos.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+
+from db.mongo import iter_corpus
+from model.registry import (
+    MODEL_DIR, ChatbotModel, build_vectorizer, get_current_version, new_version_name, save_artifact,
+    set_current_version
+)
+
+# Vectorizador sin estado: el mismo texto siempre cae en las mismas columnas
+VECTORIZER_CONFIG = {
+    'kind': 'hashing',
+    'n_features': 2 ** 16,
+    'alternate_sign': False,
+    'norm': 'l2',
+    'analyzer': 'word',
+    'lowercase': True,
+    'token_pattern': r'(?u)\b\w\w+\b',
+    'ngram_range': [1, 2]
+}
+
+
+def intent_hash(intent):
+    """
+    Huella del intent completo (tag, patrones, respuestas...); si ninguna cambia, no hace
+    falta volver a entrenar ni a publicar el corpus.
+    """
+    document = {k: v for k, v in intent.items() if k != '_id'}
+    return hashlib.sha1(json.dumps(document, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+def is_held_out(text, test_fraction):
+    # División determinista: el mismo patrón siempre queda en el mismo conjunto
+    bucket = int(hashlib.md5(text.lower().encode()).hexdigest(), 16) % 1000
+    return bucket < test_fraction * 1000
+
+def iter_examples(query, test_fraction, held_out):
+    """
+    Recorre los patrones del corpus como pares (texto, tag) del conjunto pedido
+    (held_out=None recorre los dos).
+    """
+    for intent in iter_corpus(query):
+        for pattern in intent.get('patterns', []):
+            if held_out is None or is_held_out(pattern, test_fraction) == held_out:
+                yield pattern.lower(), intent['tag']
+
+def iter_batches(examples, batch_size):
+    texts, tags = [], []
+    for text, tag in examples:
+        texts.append(text)
+        tags.append(tag)
+        if len(texts) >= batch_size:
+            yield texts, tags
+            texts, tags = [], []
+    if texts:
+        yield texts, tags
+
+def scan_corpus():
+    """
+    Primera pasada: huellas de cada intent y sus respuestas (los patrones no se guardan).
+    """
+    intents, hashes = [], {}
+    for intent in iter_corpus():
+        hashes[intent['tag']] = intent_hash(intent)
+        intents.append({k: v for k, v in intent.items() if k not in ('_id', 'patterns')})
+    return intents, hashes
+
+def fit_classifier(vectorizer, classes, examples, epochs, batch_size):
+    """
+    Entrena un clasificador nuevo con partial_fit, recorriendo examples() una vez por época.
+    """
+    classifier = SGDClassifier(loss='hinge', alpha=1e-4, random_state=0)
+    for _ in range(epochs):
+        for texts, tags in iter_batches(examples(), batch_size):
+            classifier.partial_fit(vectorizer.transform(texts), tags, classes=classes)
+    return classifier
+
+def load_previous_manifest(directory):
+    version = get_current_version(directory)
+    if not version:
+        return None, None
+    path = os.path.join(directory, version)
+    try:
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f), path
+    except FileNotFoundError:
+        return None, None
+
+def evaluate(chatbot_model, test_fraction):
+    """
+    Exactitud y latencia por mensaje (vectorizar + predecir) sobre el conjunto reservado.
+    """
+    correct, total, latencies = 0, 0, []
+    for text, tag in iter_examples(None, test_fraction, held_out=True):
+        start = time.perf_counter()
+        predicted = chatbot_model.predict([text])[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += predicted == tag
+        total += 1
+    if not total:
+        return {'accuracy': None, 'test_examples': 0}
+    return {
+        'accuracy': round(correct / total, 4),
+        'test_examples': total,
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 4),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 4)
+    }
+
+def train(full=False, epochs=10, batch_size=256, test_fraction=0.2, refit=True, activate=True, directory=MODEL_DIR):
+    """
+    Entrena el clasificador y guarda una versión nueva del modelo. Devuelve su manifiesto.
+    Si no es full y ningún intent cambió respecto a la versión activa, no entrena y devuelve
+    el manifiesto de esa versión.
+    """
+    start = time.perf_counter()
+    intents, hashes = scan_corpus()
+    if not intents:
+        raise ValueError("La colección 'corpus' está vacía; no hay nada que entrenar.")
+    classes = np.array(sorted(hashes))
+
+    previous, previous_path = load_previous_manifest(directory)
+    comparable = (
+        previous is not None
+        and previous.get('vectorizer') == VECTORIZER_CONFIG
+        and previous.get('classes') == list(classes)
+        and 'intent_hashes' in previous
+    )
+    # Las huellas solo deciden si hay que entrenar; el entrenamiento usa siempre todo el corpus
+    if comparable:
+        changed = [tag for tag in classes if hashes[tag] != previous['intent_hashes'].get(tag)]
+    else:
+        changed = list(classes)
+    if not changed and not full:
+        print(f"Ningún intent cambió desde la versión '{os.path.basename(previous_path)}'; no se entrena.")
+        return previous
+    print(f"Entrenamiento con los {len(classes)} intents (intents con cambios: {len(changed)}).")
+
+    vectorizer = build_vectorizer(VECTORIZER_CONFIG)
+    classifier = fit_classifier(
+        vectorizer, classes, lambda: iter_examples(None, test_fraction, held_out=False), epochs, batch_size
+    )
+    chatbot_model = ChatbotModel('candidato', vectorizer, classifier.coef_, classifier.intercept_, classes, intents)
+    metrics = evaluate(chatbot_model, test_fraction)
+    print(f"Exactitud en el conjunto reservado: {metrics['accuracy']} ({metrics['test_examples']} ejemplos)")
+
+    if refit:
+        # Tras medir, el modelo final se entrena desde cero con todo el corpus y la misma
+        # configuración; la exactitud guardada es la estimación del candidato que se midió
+        classifier = fit_classifier(
+            vectorizer, classes, lambda: iter_examples(None, test_fraction, held_out=None), epochs, batch_size
+        )
+
+    version = new_version_name()
+    metadata = {
+        'intent_hashes': hashes,
+        'intents_cambiados': [str(tag) for tag in changed],
+        'segundos_entrenamiento': round(time.perf_counter() - start, 3),
+        'reentrenado_con_todo': refit,
+        **metrics
+    }
+    save_artifact(
+        version, VECTORIZER_CONFIG, classifier.coef_, classifier.intercept_, classes, intents,
+        metadata=metadata, directory=directory
+    )
+    if activate:
+        set_current_version(version, directory)
+    print(f"Versión '{version}' guardada en '{directory}'" + (" y activada." if activate else "."))
+    return {'version': version, **metadata}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Entrena el modelo del chatbot desde db.corpus.")
+    parser.add_argument('--full', action='store_true', help="Reentrena aunque ningún intent haya cambiado.")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--no-refit', action='store_true', help="Publica el modelo medido, sin reentrenarlo con todo el corpus.")
+    parser.add_argument('--no-activate', action='store_true', help="Guarda la versión sin activarla.")
+    args = parser.parse_args()
+
+    train(
+        full=args.full, epochs=args.epochs, batch_size=args.batch_size, test_fraction=args.test_fraction,
+        refit=not args.no_refit, activate=not args.no_activate
+    )
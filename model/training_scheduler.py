@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from metrics import count_error
+from model import similarity_store
+from model.recommendation_engine import NeighborIndex, train_model
+
+# Versión inmutable del modelo publicada para los lectores.
+# 'model' es el índice de vecinos (NeighborIndex); nunca se modifica después de publicarse.
+# 'version' es el nombre de la versión en disco (igual en todos los procesos que la cargan) y
+# 'manifest' su manifiesto (ver model/similarity_store.py).
+ModelSnapshot = namedtuple('ModelSnapshot', ['version', 'model', 'manifest', 'built_at', 'build_seconds'])
+
+
+class TrainingScheduler:
+    """
+    Reentrena el recomendador fuera del hilo de la petición.
+
+    Las valoraciones se encolan con notify_rating(); un hilo en segundo plano espera a que
+    pase el periodo de 'debounce' sin eventos nuevos, aplica al índice publicado las
+    valoraciones guardadas desde su marca de agua (o lo reconstruye completo si toca), guarda
+    el resultado en el índice compartido en disco y publica un ModelSnapshot nuevo
+    reemplazando una sola referencia. Los lectores solo ven versiones completas del modelo.
+
+    Cuando no hay valoraciones nuevas, cada poll_interval segundos se carga la versión del
+    índice que haya guardado otro proceso (otro worker con sus propias valoraciones).
+
+    El mismo hilo mantiene el índice de contenido (content_index): se carga del disco y, si
+    tiene más de content_max_age segundos, lo reconstruye un solo proceso para todos.
+
+    El hilo pertenece al proceso que llamó a start(): en un hijo creado con fork (un worker de
+    gunicorn con --preload) se arranca de nuevo con el primer uso.
+    """
+
+    def __init__(self, debounce_seconds=2.0, max_delay_seconds=30.0, full_rebuild_interval=3600, poll_interval=30.0,
+                 build=train_model, snapshot_dir=similarity_store.SNAPSHOT_DIR,
+                 content_max_age=similarity_store.CONTENT_MAX_AGE):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.full_rebuild_interval = full_rebuild_interval
+        self.poll_interval = poll_interval
+        # Función que construye el NeighborIndex completo y directorio del índice compartido
+        self.build = build
+        self.snapshot_dir = snapshot_dir
+        self.content_max_age = content_max_age
+
+        self._pending = []
+        self._first_pending_at = None
+        self._last_event_at = None
+        self._force_rebuild = False
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._started = False
+        self._thread = None
+        self._listeners = []
+        self._ready = threading.Event()
+
+        self._snapshot = ModelSnapshot(None, NeighborIndex.empty(), None, None, 0.0)
+        self._content_index = None
+        self._content_checked_at = 0.0
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def snapshot(self):
+        """
+        Devuelve la última versión publicada del modelo (lectura atómica de una referencia).
+        """
+        self._ensure_running()
+        return self._snapshot
+
+    @property
+    def content_index(self):
+        """
+        Índice de contenido compartido (None hasta que se carga el primero).
+        """
+        self._ensure_running()
+        return self._content_index
+
+    def add_listener(self, callback):
+        """
+        Registra una función que se llama con cada ModelSnapshot nuevo.
+        """
+        self._listeners.append(callback)
+
+    def start(self, block=True):
+        """
+        Arranca el hilo de entrenamiento. Con block=True carga el modelo inicial antes de
+        volver; si no, lo carga el propio hilo y mientras tanto se publica un modelo vacío
+        (las recomendaciones usan los negocios mejor valorados).
+        """
+        if self._started:
+            return
+        self._started = True
+        if block:
+            self._load_initial()
+        self._ensure_running()
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Espera a que se publique el modelo inicial. Devuelve False si se agota el tiempo.
+        """
+        self._ensure_running()
+        return self._ready.wait(timeout)
+
+    def notify_rating(self, usuario_id, negocio_id, puntuacion):
+        """
+        Encola una valoración para aplicarla en el próximo entrenamiento.
+        """
+        self._ensure_running()
+        now = time.time()
+        with self._lock:
+            self._pending.append((usuario_id, negocio_id, puntuacion))
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+            self._last_event_at = now
+        self._wakeup.set()
+
+    def request_rebuild(self):
+        """
+        Solicita una reconstrucción completa del modelo en segundo plano.
+        """
+        self._ensure_running()
+        now = time.time()
+        with self._lock:
+            self._force_rebuild = True
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+            self._last_event_at = now
+        self._wakeup.set()
+
+    def status(self):
+        """
+        Información de la versión publicada: versión, tiempo de construcción y antigüedad.
+        """
+        snapshot = self.snapshot
+        now = time.time()
+        with self._lock:
+            pending = len(self._pending)
+            first_pending_at = self._first_pending_at
+        return {
+            'version': snapshot.version,
+            'built_at': datetime.fromtimestamp(snapshot.built_at).isoformat() if snapshot.built_at else None,
+            'build_seconds': round(snapshot.build_seconds, 4),
+            'age_seconds': round(now - snapshot.built_at, 1) if snapshot.built_at else None,
+            'staleness_seconds': round(now - first_pending_at, 1) if first_pending_at else 0.0,
+            'pending_events': pending,
+            'ready': self._ready.is_set(),
+        }
+
+    def _run(self):
+        if not self._ready.is_set():
+            self._load_initial()
+        while True:
+            if time.time() - self._content_checked_at >= self.poll_interval:
+                self._refresh_content_index()
+            if not self._wakeup.wait(self.poll_interval):
+                try:
+                    self._check_shared_index()
+                except Exception as e:
+                    print(f"Error al revisar el índice de vecinos compartido: {e}")
+                    count_error('training')
+                continue
+            self._wait_for_quiet_period()
+
+            with self._lock:
+                self._wakeup.clear()
+                events = self._pending
+                full = self._force_rebuild
+                self._pending = []
+                self._force_rebuild = False
+                self._first_pending_at = None
+
+            if not events and not full:
+                continue
+            try:
+                self._build(full)
+            except Exception as e:
+                print(f"Error al reentrenar el modelo de recomendaciones: {e}")
+                count_error('training')
+
+    def _wait_for_quiet_period(self):
+        # Espera a que dejen de llegar valoraciones, sin superar max_delay_seconds
+        while True:
+            with self._lock:
+                last_event_at = self._last_event_at or 0
+                first_pending_at = self._first_pending_at or time.time()
+            now = time.time()
+            quiet_for = now - last_event_at
+            if quiet_for >= self.debounce_seconds or now - first_pending_at >= self.max_delay_seconds:
+                return
+            time.sleep(self.debounce_seconds - quiet_for)
+
+    def _ensure_running(self):
+        # Arranca el hilo en este proceso si start() ya se llamó (aquí o en el padre antes del fork)
+        if self._started and self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='training-scheduler', daemon=True)
+                    self._thread.start()
+
+    def _after_fork(self):
+        # fork solo copia el hilo que lo llama: en el hijo no hay hilo de entrenamiento y los locks
+        # pudieron quedar tomados. Se recrean; el modelo ya publicado se conserva (mapeado en memoria)
+        ready = self._ready.is_set()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._ready = threading.Event()
+        if ready:
+            self._ready.set()
+        self._thread = None
+        self._pending = []
+        self._first_pending_at = None
+        self._force_rebuild = False
+
+    def _load_initial(self):
+        start = time.perf_counter()
+        try:
+            # Índice compartido en disco; solo un proceso lo construye o lo pone al día
+            index, manifest = similarity_store.load_or_build(self.build, self.snapshot_dir)
+            self._publish(index, manifest, start)
+        except Exception as e:
+            print(f"Error al cargar el modelo inicial de recomendaciones: {e}")
+            count_error('initial_model')
+        finally:
+            self._ready.set()
+        self._refresh_content_index()
+
+    def _refresh_content_index(self):
+        # Lee la versión actual del disco; si no hay una reciente, la construye (bajo el bloqueo)
+        self._content_checked_at = time.time()
+        try:
+            self._content_index = similarity_store.refresh_content_index(
+                self._content_index, self.snapshot_dir, self.content_max_age
+            )
+        except Exception as e:
+            print(f"Error al cargar el índice de contenido: {e}")
+            count_error('content_index')
+
+    def _build(self, full):
+        # Las valoraciones ya están en MongoDB: se aplican al índice publicado las modificadas
+        # desde su marca de agua (update_neighbor_index) y el resultado se guarda como versión nueva
+        start = time.perf_counter()
+        current = self._snapshot
+        index, manifest = similarity_store.refresh(
+            current.model, current.manifest, self.build, self.snapshot_dir, self.full_rebuild_interval, full
+        )
+        if manifest['version'] != current.version:
+            self._publish(index, manifest, start)
+
+    def _check_shared_index(self):
+        # Sin valoraciones propias pendientes: se publica la versión que haya guardado otro proceso
+        # (sin volver a aplicarle valoraciones) o se reconstruye si la última completa es antigua
+        start = time.perf_counter()
+        current = self._snapshot
+        if current.manifest is not None and time.time() - current.manifest['full_built_at'] > self.full_rebuild_interval:
+            self._build(full=False)
+        elif similarity_store.get_current_version(self.snapshot_dir) != current.version:
+            index, manifest = similarity_store.load_current(self.snapshot_dir, max_age=float('inf'))
+            if index is not None and manifest['version'] != current.version:
+                self._publish(index, manifest, start)
+
+    def _publish(self, model, manifest, start):
+        snapshot = ModelSnapshot(manifest['version'], model, manifest, time.time(), time.perf_counter() - start)
+        self._snapshot = snapshot
+
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Error al notificar la nueva versión del modelo: {e}")
@@ -2,6 +2,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Global variable for the map instance
     let map;
+    // Capa con los negocios del área visible del mapa (se recarga al mover el mapa)
+    let viewportLayer;
+    let viewportTimer;
 
     // --- Funciones para la UI y la interactividad ---
 
@@ -34,7 +37,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 /*alert('¡Gracias por tu valoración!');*/
                 showToast("¡Gracias por tu valoración!", "success");
                 // Recarga la página para mostrar el ranking actualizado y las nuevas recomendaciones
-                window.location.reload(); 
+                // (con 202 la valoración se guarda en segundo plano, así que se espera un momento)
+                setTimeout(() => window.location.reload(), response.status === 202 ? 1500 : 0);
             } else {
                 /*alert(`Error: ${data.error}`);*/
                 showToast(`${data.error}`, "error");
@@ -44,6 +48,24 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // Ancho con el que se muestran las imágenes de las tarjetas (para elegir la miniatura del srcset)
+    const CARD_IMAGE_SIZES = '(max-width: 600px) 100vw, 300px';
+
+    // Imagen de una tarjeta: miniaturas WebP (con JPEG de respaldo) si el backend las envía
+    const businessImageHtml = (business) => {
+        const imageUrl = business.image_url || 'https://via.placeholder.com/300x200';
+        const alt = `Imagen de ${business.name}`;
+        const srcset = business.image_srcset;
+        if (!srcset) {
+            return `<img src="${imageUrl}" alt="${alt}" loading="lazy">`;
+        }
+        return `
+            <picture>
+                <source type="image/webp" srcset="${srcset.webp}" sizes="${CARD_IMAGE_SIZES}">
+                <img src="${imageUrl}" srcset="${srcset.jpeg}" sizes="${CARD_IMAGE_SIZES}" alt="${alt}" loading="lazy">
+            </picture>`;
+    };
+
     // Renderiza las tarjetas de negocios en la cuadrícula de recomendaciones
     const renderBusinessCards = (data) => {
         const grid = document.querySelector('.recommendations-grid');
@@ -59,16 +81,13 @@ document.addEventListener('DOMContentLoaded', () => {
             const card = document.createElement('div');
             card.classList.add('business-card');
 
-            // Asumiendo que 'business.image_url' se envía desde el backend
-            const imageUrl = business.image_url || 'https://via.placeholder.com/300x200';
-
             // Genera estrellas basadas en el ranking
             const rankingStars = '★'.repeat(Math.floor(business.ranking)) +
                                 ((business.ranking % 1 !== 0) ? '½' : '');
 
             // Nuevo HTML para incluir las estrellas de valoración y el botón de "Ver más"
             card.innerHTML = `
-                <img src="${imageUrl}" alt="Imagen de ${business.name}">
+                ${businessImageHtml(business)}
                 <div class="card-content">
                     <h3>${business.name}</h3>
                     <p>${business.category}</p>
@@ -125,7 +144,37 @@ document.addEventListener('DOMContentLoaded', () => {
             attribution: '© OpenStreetMap contributors'
         }).addTo(map);
 
+        viewportLayer = L.layerGroup().addTo(map);
+        map.on('moveend', () => {
+            // Espera a que el usuario deje de mover el mapa antes de pedir los negocios
+            clearTimeout(viewportTimer);
+            viewportTimer = setTimeout(loadViewportMarkers, 300);
+        });
+
         map.invalidateSize();
+        loadViewportMarkers();
+    };
+
+    // Carga solo los negocios que están dentro del área visible del mapa
+    const loadViewportMarkers = async () => {
+        if (!map || !viewportLayer) return;
+        try {
+            const bbox = map.getBounds().toBBoxString();
+            const response = await fetch(`/api/cercanos?bbox=${bbox}&limit=200`);
+            if (!response.ok) return;
+            const businesses = await response.json();
+
+            viewportLayer.clearLayers();
+            businesses.forEach(business => {
+                if (business.lat && business.lng) {
+                    L.circleMarker([business.lat, business.lng], { radius: 6 })
+                        .bindPopup(`<b>${business.name}</b><br>${business.category}<br><a href="/negocio/${business.id}">Ver más</a>`)
+                        .addTo(viewportLayer);
+                }
+            });
+        } catch (error) {
+            console.error("Error al obtener los negocios del mapa:", error);
+        }
     };
 
     // Agrega marcadores de negocios al mapa
@@ -208,14 +257,13 @@ const getAllBusinesses = async (page = 1) => {
                 const card = document.createElement('div');
                 card.classList.add('business-card');
 
-                // Genera estrellas y URL de la imagen
-                const imageUrl = business.image_url || 'https://via.placeholder.com/300x200';
+                // Genera estrellas
                 const rankingStars = '★'.repeat(Math.floor(business.ranking)) +
                                      ((business.ranking % 1 !== 0) ? '½' : '');
 
                 // Inserta el HTML completo de la tarjeta
                 card.innerHTML = `
-                    <img src="${imageUrl}" alt="Imagen de ${business.name}">
+                    ${businessImageHtml(business)}
                     <div class="card-content">
                         <h3>${business.name}</h3>
                         <p>${business.category}</p>